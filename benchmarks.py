@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""Slides35 throughput benchmarks
+
+Measures SVG generation per slide, PNG conversion per installed converter and
+DPI, and end-to-end --pictures-dir style runs, on synthetic pictures.
+Results are saved as JSON, which can be compared with a previous run:
+
+python benchmarks.py --output bench_output.json
+python benchmarks.py --output new.json --compare bench_output.json
+"""
+
+# builtin modules
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+# third-party modules
+import numpy
+from PIL import Image
+
+from slides35 import (
+    Slide,
+    compile_template,
+    do_slides,
+    get_converter,
+    SLIDES35_DEFAULT_SVG_TEMPLATE,
+    SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    SLIDES35_SUPPORTED_CONVERTERS,
+)
+
+BENCH_DEFAULT_OUTPUT = "bench_output.json"
+BENCH_DEFAULT_DPIS = (96, 300, 500)
+BENCH_DEFAULT_SIZES = (10, 100, 1000)
+BENCH_DEFAULT_REPEAT = 5
+BENCH_PICTURE_SIZE = (1200, 800)
+
+
+def make_pictures(dirname, count, size=BENCH_PICTURE_SIZE):
+    """Write count random JPEG pictures into dirname and return their sorted paths."""
+    for n in range(count):
+        a = numpy.random.rand(size[1], size[0], 3) * 255
+        im_out = Image.fromarray(a.astype("uint8")).convert("RGB")
+        im_out.save(Path(dirname) / Path("out%04d.jpg" % n))
+    return [Path(dirname) / img for img in sorted(os.listdir(dirname))]
+
+
+def _timings(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(name, timings, per=1, **params):
+    return dict(
+        name=name,
+        params=params,
+        runs=len(timings),
+        min=min(timings) / per,
+        median=statistics.median(timings) / per,
+        max=max(timings) / per,
+    )
+
+
+def bench_svg(template, picture, repeat):
+    slides = 1000
+    s = Slide(template).id(1).picture(picture)
+    compiled = compile_template(template)
+    return [
+        _summary(
+            "svg_per_slide",
+            _timings(lambda: [s.svg() for _ in range(slides)], repeat),
+            per=slides,
+        ),
+        _summary(
+            "compiled_render_per_slide",
+            _timings(
+                lambda: [compiled.render(picture, 1) for _ in range(slides)], repeat
+            ),
+            per=slides,
+        ),
+    ]
+
+
+def bench_converters(template, picture, dpis, repeat):
+    results = []
+    for converter in SLIDES35_SUPPORTED_CONVERTERS:
+        if not get_converter(converter).available():
+            print("Skipping converter {}: not installed".format(converter))
+            continue
+        s = Slide(template, converter=converter).id(1).picture(picture)
+        for dpi in dpis:
+            results.append(
+                _summary(
+                    "png_per_slide",
+                    _timings(lambda: s.png(dpi=dpi), repeat),
+                    converter=converter,
+                    dpi=dpi,
+                )
+            )
+    return results
+
+
+def bench_end_to_end(template, sizes, dpi, jobs):
+    results = []
+    outputs = ["svg"] + [
+        converter
+        for converter in SLIDES35_SUPPORTED_CONVERTERS
+        if get_converter(converter).available()
+    ]
+    for count in sizes:
+        with tempfile.TemporaryDirectory() as pictures_dir:
+            pictures = make_pictures(pictures_dir, count)
+            for output in outputs:
+                with tempfile.TemporaryDirectory() as output_dir:
+                    start = time.perf_counter()
+                    slide_results = do_slides(
+                        template,
+                        pictures,
+                        output_dir=output_dir,
+                        output_as="svg" if output == "svg" else "png",
+                        dpi=dpi,
+                        converter=(
+                            output
+                            if output != "svg"
+                            else SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER
+                        ),
+                        jobs=jobs,
+                    )
+                    elapsed = time.perf_counter() - start
+                errors = [error for _, _, error in slide_results if error]
+                results.append(
+                    dict(
+                        name="end_to_end",
+                        params=dict(output=output, pictures=count, dpi=dpi, jobs=jobs),
+                        seconds=elapsed,
+                        slides_per_second=count / elapsed,
+                        errors=len(errors),
+                    )
+                )
+    return results
+
+
+def _environment():
+    try:
+        revision = (
+            subprocess.check_output(
+                ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return dict(
+        revision=revision,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        converters={
+            converter: get_converter(converter).version()
+            for converter in SLIDES35_SUPPORTED_CONVERTERS
+            if get_converter(converter).available()
+        },
+    )
+
+
+def _result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, previous):
+    """Print the change of each result against the same one of a previous run."""
+    previous_results = {_result_key(result): result for result in previous["results"]}
+    for result in results["results"]:
+        old = previous_results.get(_result_key(result))
+        if not old:
+            continue
+        metric = "seconds" if "seconds" in result else "median"
+        change = (result[metric] - old[metric]) / old[metric] * 100
+        print(
+            "{} {}: {:.6f}s -> {:.6f}s ({:+.1f}%)".format(
+                result["name"], result["params"], old[metric], result[metric], change
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=BENCH_DEFAULT_OUTPUT,
+        help="JSON results file (default:{}).".format(BENCH_DEFAULT_OUTPUT),
+    )
+    parser.add_argument(
+        "-t",
+        "--template",
+        default=SLIDES35_DEFAULT_SVG_TEMPLATE,
+        help="SVG template to use (default:{}).".format(SLIDES35_DEFAULT_SVG_TEMPLATE),
+    )
+    parser.add_argument(
+        "--dpis",
+        default=",".join(map(str, BENCH_DEFAULT_DPIS)),
+        help="Comma-separated DPIs of the conversion benchmarks (default:{}).".format(
+            ",".join(map(str, BENCH_DEFAULT_DPIS))
+        ),
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, BENCH_DEFAULT_SIZES)),
+        help="Comma-separated picture counts of the end-to-end runs (default:{}).".format(
+            ",".join(map(str, BENCH_DEFAULT_SIZES))
+        ),
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=BENCH_DEFAULT_REPEAT,
+        help="Runs of each micro-benchmark (default:{}).".format(BENCH_DEFAULT_REPEAT),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Processes of the end-to-end runs (default: CPU count).",
+    )
+    parser.add_argument(
+        "--compare", help="Previous JSON results file to compare the new results with."
+    )
+    args = parser.parse_args()
+
+    dpis = [int(dpi) for dpi in args.dpis.split(",") if dpi]
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = dict(environment=_environment(), results=[])
+    with tempfile.TemporaryDirectory() as pictures_dir:
+        picture = make_pictures(pictures_dir, 1)[0]
+        results["results"] += bench_svg(args.template, picture, args.repeat)
+        results["results"] += bench_converters(
+            args.template, picture, dpis, args.repeat
+        )
+    results["results"] += bench_end_to_end(args.template, sizes, dpis[-1], args.jobs)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for result in results["results"]:
+        print(json.dumps(result))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
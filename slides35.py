@@ -12,228 +12,4320 @@ SLIDES35_DEFAULT_OUTPUT_DPI = 500
 SLIDES35_DEFAULT_OUTPUT_PREFIX = "slide_"
 SLIDES35_DEFAULT_OUTPUT_FILENAME_ZFILL_COUNT = 3
 SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER = "convert"
-SLIDES35_SUPPORTED_CONVERTERS = ("inkscape", "convert", "rsvg-convert")
+SLIDES35_SUPPORTED_CONVERTERS = ("inkscape", "convert", "rsvg-convert", "pillow")
+SLIDES35_DEFAULT_CONVERTER_BATCH_SIZE = 32
+SLIDES35_RASTER_FORMATS = ("png", "tiff", "jpeg", "webp")
+SLIDES35_OUTPUT_SUFFIXES = {
+    ".svg": "svg",
+    ".pdf": "pdf",
+    ".png": "png",
+    ".tif": "tiff",
+    ".tiff": "tiff",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".webp": "webp",
+}
+# rough peak memory of converting a slide: bytes per process, per pixel of the
+# embedded picture and per pixel of the output raster
+SLIDES35_CONVERTER_MEMORY = {
+    "inkscape": (200 << 20, 8, 8),
+    "convert": (64 << 20, 12, 16),
+    "rsvg-convert": (16 << 20, 4, 4),
+    "pillow": (48 << 20, 4, 8),
+}
+SLIDES35_DEFAULT_CACHE_SIZE = "1G"
+SLIDES35_PICTURE_EXTENSIONS = (
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".tif",
+    ".tiff",
+    ".webp",
+    ".bmp",
+)
+SLIDES35_SORT_KEYS = ("name", "mtime", "exif")
+SLIDES35_DEFAULT_PLAN_THREADS = 16
+SLIDES35_SERVE_REQUEST_KEYS = (
+    "template",
+    "picture",
+    "id",
+    "output_dir",
+    "output",
+    "output_as",
+    "dpi",
+    "converter",
+    "depth",
+    "alpha",
+    "compression",
+    "quality",
+    "embed",
+    "proxy",
+    "stdout",
+    "tag",
+)
+SLIDES35_SERVE_EVICT_INTERVAL = 60.0  # seconds between render cache evictions
+SLIDES35_WATCH_DEBOUNCE = 2.0
+SLIDES35_WATCH_POLL_INTERVAL = 1.0
+SLIDES35_SHEET_SIZES = {
+    "A3": (297, 420),
+    "A4": (210, 297),
+    "A5": (148, 210),
+    "letter": (215.9, 279.4),
+    "legal": (215.9, 355.6),
+}
+SLIDES35_DEFAULT_SHEET_BLEED = "2mm"
+SLIDES35_DEFAULT_SHEET_MARGIN = "10mm"
+SLIDES35_DEFAULT_SHEET_PREFIX = "sheet_"
+SLIDES35_DEFAULT_PREVIEW_DPI = 72
+SLIDES35_DEFAULT_PREVIEW_FILENAME = "preview.html"
+SLIDES35_PREVIEW_COLUMNS = 8
+SLIDES35_EMBED_CHUNK_SIZE = 3 << 18  # a multiple of 3 to base64 encode chunks apart
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from xml.dom import minidom
 import argparse
+import asyncio
+import atexit
+import base64
+import collections
+import csv
+import ctypes
+import ctypes.util
+import hashlib
+import io
+import itertools
+import json
+import math
 import os
+import re
+import select
 import subprocess
 import shutil
+import signal
+import socket
+import sys
+import struct
+import tarfile
 import tempfile
+import threading
+import time
+import zipfile
+import zlib
 
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:  # Pillow is optional, only needed for proxies and its converter
+    Image = None
 
-class Slide:
-    _id = None
-    _comment = None
-    _picture = None
-    _template = None
-    _prefix = None
-    _verbose = None
-    _converter = None
+SLIDES35_DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "slides35"
+)
 
-    def __init__(
-        self,
-        template=None,
-        verbose=False,
-        converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
-    ):
-        self.template(template)
-        self.verbose(verbose)
-        self.converter(converter)
 
-    def template(self, template=None):
-        if not template:
-            return self._template
+def _escape_xml(value):
+    # same escaping as minidom's toxml() for attribute values and text nodes
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def _multiply_matrices(m, n):
+    # Returns the (a, b, c, d, e, f) affine matrix applying n, then m.
+    return (
+        m[0] * n[0] + m[2] * n[1],
+        m[1] * n[0] + m[3] * n[1],
+        m[0] * n[2] + m[2] * n[3],
+        m[1] * n[2] + m[3] * n[3],
+        m[0] * n[4] + m[2] * n[5] + m[4],
+        m[1] * n[4] + m[3] * n[5] + m[5],
+    )
+
+
+def _transform_matrix(transform):
+    # Returns the (a, b, c, d, e, f) affine matrix of an SVG transform attribute.
+    matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    for name, arguments in re.findall(r"(\w+)\s*\(([^)]*)\)", transform or ""):
+        values = [float(v) for v in re.split(r"[\s,]+", arguments.strip()) if v]
+        if name == "matrix" and len(values) == 6:
+            m = tuple(values)
+        elif name == "translate" and values:
+            m = (1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) > 1 else 0.0)
+        elif name == "scale" and values:
+            m = (values[0], 0.0, 0.0, values[1] if len(values) > 1 else values[0], 0, 0)
+        elif name == "rotate" and values:
+            angle = math.radians(values[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            cx, cy = (values[1], values[2]) if len(values) == 3 else (0.0, 0.0)
+            m = (
+                cos,
+                sin,
+                -sin,
+                cos,
+                cx - cos * cx + sin * cy,
+                cy - sin * cx - cos * cy,
+            )
+        elif name == "skewX" and values:
+            m = (1.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and values:
+            m = (1.0, math.tan(math.radians(values[0])), 0.0, 1.0, 0.0, 0.0)
         else:
-            if not Path(template).exists():
-                raise FileNotFoundError("Could not find template: {}".format(template))
-            self._template = str(Path(template))
-            return self
+            continue
+        matrix = _multiply_matrices(matrix, m)
+    return matrix
 
-    def converter(self, converter=None):
-        if not converter:
-            return self._converter
+
+def _transform_scale(transform):
+    # Returns the (x, y) scale factors of an SVG transform attribute.
+    a, b, c, d, _, _ = _transform_matrix(transform)
+    return math.hypot(a, b), math.hypot(c, d)
+
+
+def _node_matrix(node):
+    # Returns the matrix from the user space of node to the root user space.
+    matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    while node.nodeType == node.ELEMENT_NODE:
+        matrix = _multiply_matrices(
+            _transform_matrix(node.getAttribute("transform")), matrix
+        )
+        node = node.parentNode
+    return matrix
+
+
+SLIDES35_LENGTH_UNITS_IN_MM = {
+    "mm": 1.0,
+    "cm": 10.0,
+    "in": 25.4,
+    "pt": 25.4 / 72,
+    "pc": 25.4 / 6,
+    "px": 25.4 / 96,
+    "": 25.4 / 96,
+}
+
+
+def length_to_mm(length):
+    """Return the millimeters of an SVG length like "36mm", "1.5in" or "96" (px)."""
+    text = str(length).strip()
+    number = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = text[len(number) :]
+    if unit not in SLIDES35_LENGTH_UNITS_IN_MM:
+        raise ValueError("Unsupported length unit: {}".format(length))
+    try:
+        return float(number) * SLIDES35_LENGTH_UNITS_IN_MM[unit]
+    except ValueError:
+        raise ValueError("Invalid length: {}".format(length))
+
+
+def _svg_property(node, name):
+    # Returns the value of an inherited presentation property of node, looked up
+    # in the style attributes then the presentation attributes of its ancestors.
+    while node.nodeType == node.ELEMENT_NODE:
+        for declaration in node.getAttribute("style").split(";"):
+            key, _, value = declaration.partition(":")
+            if key.strip() == name and value.strip() != "inherit":
+                return value.strip()
+        if node.getAttribute(name) and node.getAttribute(name) != "inherit":
+            return node.getAttribute(name)
+        node = node.parentNode
+    return None
+
+
+class CompiledTemplate:
+    """SVG template parsed once, then rendered for any picture and slide id.
+
+    The href of the first <image> and the text of the first <text> element are
+    located at compile time; rendering splices their values between
+    pre-serialized UTF-8 segments of the template.
+    """
+
+    _SLOT_MARKS = {
+        "picture": "\x00slides35:picture\x00",
+        "id": "\x00slides35:id\x00",
+    }
+
+    def __init__(self, path):
+        self.path = str(Path(path))
+        with profile_stage("template_parse", template=self.path):
+            self._compile()
+
+    def _compile(self):
+        document = minidom.parse(self.path)
+        images = document.getElementsByTagName("image")
+        texts = document.getElementsByTagName("text")
+        if not images:
+            raise ValueError("Template {} has no <image> element".format(self.path))
+        if not texts:
+            raise ValueError("Template {} has no <text> element".format(self.path))
+        root = document.documentElement
+        view_box = root.getAttribute("viewBox").replace(",", " ").split()
+        self.size_mm = tuple(
+            length_to_mm(root.getAttribute(dimension) or view_box[n + 2])
+            for n, dimension in enumerate(("width", "height"))
+        )
+        self.picture_box_mm = self._picture_box_mm(images[0], view_box)
+        # root user space geometry, for compositing pictures without an SVG renderer
+        self.view_box = (
+            tuple(float(v) for v in view_box) if len(view_box) == 4 else None
+        )
+        self.picture_rect = self._picture_rect(images[0])
+        self.picture_aspect_ratio = (
+            images[0].getAttribute("preserveAspectRatio") or "xMidYMid meet"
+        )
+        self.label = self._label(texts[0])
+        images[0].attributes["xlink:href"].value = self._SLOT_MARKS["picture"]
+        texts[0].firstChild.firstChild.nodeValue = self._SLOT_MARKS["id"]
+        self._segments = self._split(document.toxml())
+        # nested into a sheet, the slide is sized in the millimeter user units
+        # of the sheet: absolute units would be scaled by the output DPI
+        root.setAttribute("width", "{:g}".format(self.size_mm[0]))
+        root.setAttribute("height", "{:g}".format(self.size_mm[1]))
+        xml = document.toxml()
+        if xml.startswith("<?xml"):
+            xml = xml[xml.index("?>") + 2 :]
+        self._nested_segments = self._split(xml)
+
+    def _picture_box_mm(self, image, view_box):
+        try:
+            width = float(image.getAttribute("width"))
+            height = float(image.getAttribute("height"))
+        except ValueError:  # missing or relative size
+            return None
+        if len(view_box) == 4:
+            user_unit_mm = (
+                self.size_mm[0] / float(view_box[2]),
+                self.size_mm[1] / float(view_box[3]),
+            )
         else:
-            if type(converter) is not str:
-                raise TypeError("converter must be a str")
-            if converter not in SLIDES35_SUPPORTED_CONVERTERS:
+            user_unit_mm = (SLIDES35_LENGTH_UNITS_IN_MM["px"],) * 2
+        a, b, c, d, _, _ = _node_matrix(image)
+        width, height = width * math.hypot(a, b), height * math.hypot(c, d)
+        return width * user_unit_mm[0], height * user_unit_mm[1]
+
+    def _picture_rect(self, image):
+        # (x, y, width, height) bounding box of the image in the root user space
+        try:
+            width = float(image.getAttribute("width"))
+            height = float(image.getAttribute("height"))
+        except ValueError:
+            return None
+        x = float(image.getAttribute("x") or 0)
+        y = float(image.getAttribute("y") or 0)
+        a, b, c, d, e, f = _node_matrix(image)
+        corners = [
+            (a * px + c * py + e, b * px + d * py + f)
+            for px in (x, x + width)
+            for py in (y, y + height)
+        ]
+        xs, ys = [p[0] for p in corners], [p[1] for p in corners]
+        return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+    def _label(self, text):
+        # position, size and style of the slide number in the root user space
+        positioned = (
+            text.firstChild if text.firstChild.nodeType == text.ELEMENT_NODE else text
+        )
+
+        def number(node, name):
+            match = re.match(r"\s*(-?[\d.]+(?:e-?\d+)?)", node.getAttribute(name))
+            return float(match.group(1)) if match else None
+
+        x = number(positioned, "x")
+        y = number(positioned, "y")
+        if x is None:
+            x = number(text, "x") or 0.0
+        if y is None:
+            y = number(text, "y") or 0.0
+        a, b, c, d, e, f = _node_matrix(positioned)
+        font_size = re.match(
+            r"\s*([\d.]+)", _svg_property(positioned, "font-size") or "16"
+        )
+        return dict(
+            x=a * x + c * y + e,
+            y=b * x + d * y + f,
+            size=float(font_size.group(1)) * math.hypot(c, d),
+            fill=_svg_property(positioned, "fill") or "#000000",
+            font_family=(_svg_property(positioned, "font-family") or "sans-serif")
+            .split(",")[0]
+            .strip("'\" "),
+            bold=(_svg_property(positioned, "font-weight") or "normal")
+            in ("bold", "bolder", "600", "700", "800", "900"),
+            anchor=_svg_property(positioned, "text-anchor") or "start",
+        )
+
+    def picture_size_px(self, dpi):
+        """Return the pixel size of the picture box at dpi, or None if unknown."""
+        if not self.picture_box_mm:
+            return None
+        return tuple(
+            int(math.ceil(length / 25.4 * float(dpi))) for length in self.picture_box_mm
+        )
+
+    def _split(self, xml):
+        self._slots = sorted(
+            self._SLOT_MARKS, key=lambda s: xml.index(self._SLOT_MARKS[s])
+        )
+        first, second = (self._SLOT_MARKS[slot] for slot in self._slots)
+        head, rest = xml.split(first)
+        middle, tail = rest.split(second)
+        return [part.encode("utf-8") for part in (head, middle, tail)]
+
+    def render(self, picture, identifier, nested=False):
+        """Return the SVG document as UTF-8 bytes.
+
+        A nested document has no XML declaration and is sized in millimeter
+        user units, to be placed into an SVG sheet.
+        """
+        values = {
+            "picture": _escape_xml(str(picture)).encode("utf-8"),
+            "id": _escape_xml(str(identifier).center(3)).encode("utf-8"),
+        }
+        head, middle, tail = self._nested_segments if nested else self._segments
+        return b"".join(
+            (head, values[self._slots[0]], middle, values[self._slots[1]], tail)
+        )
+
+    def write(self, stream, picture_chunks, identifier, nested=False):
+        """Write the SVG document to a binary stream, without building it in memory.
+
+        picture_chunks is an iterable of bytes making up the picture href,
+        already safe for an XML attribute, such as EmbeddedPicture.chunks().
+        """
+        identifier = _escape_xml(str(identifier).center(3)).encode("utf-8")
+        segments = iter(self._nested_segments if nested else self._segments)
+        stream.write(next(segments))
+        for slot, segment in zip(self._slots, segments):
+            if slot == "picture":
+                for chunk in picture_chunks:
+                    stream.write(chunk)
+            else:
+                stream.write(identifier)
+            stream.write(segment)
+
+
+@lru_cache(maxsize=32)
+def _compile_template_cached(path, mtime_ns):
+    return CompiledTemplate(path)
+
+
+def compile_template(path):
+    """Return the CompiledTemplate of path, reusing it until the file changes."""
+    path = Path(path).resolve()
+    return _compile_template_cached(str(path), path.stat().st_mtime_ns)
+
+
+def _error_message(e):
+    return "{}: {}".format(type(e).__name__, e)
+
+
+_profiling_hooks = []
+
+
+def add_profiling_hook(hook):
+    """Call hook(event) for every timed stage of slides rendering.
+
+    An event is a dict with at least "stage" ("template_parse", "svg_build",
+    "temp_write", "convert" or "slide") and "seconds"; it may also hold the
+    "picture", "output", output "bytes", "slides" count or "error".
+    """
+    _profiling_hooks.append(hook)
+
+
+def remove_profiling_hook(hook):
+    _profiling_hooks.remove(hook)
+
+
+def _emit(event):
+    for hook in _profiling_hooks:
+        hook(event)
+
+
+@contextmanager
+def profile_stage(stage, **info):
+    """Time the enclosed block as an event of stage, sent to profiling hooks.
+
+    The yielded dict is the event, so details can be added from the block.
+    """
+    if not _profiling_hooks:
+        yield info
+        return
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        _emit(dict(info, stage=stage, seconds=time.perf_counter() - start))
+
+
+def _with_profiling(function, *args):
+    # Runs function in a pool worker, returning its result with the profiling
+    # events it emitted, so that the parent process can replay them.
+    global _profiling_hooks
+    events = []
+    parent_hooks, _profiling_hooks = _profiling_hooks, [events.append]
+    try:
+        return function(*args), events
+    finally:
+        _profiling_hooks = parent_hooks
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class StatsCollector:
+    """Profiling hook gathering stage events into a run report."""
+
+    def __init__(self):
+        self.events = []
+        self.start = time.perf_counter()
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def report(self, slowest=5):
+        """Return per-stage totals and percentiles, slide throughput, output
+        sizes per format and slowest inputs."""
+        wall_seconds = time.perf_counter() - self.start
+        stages = {}
+        for event in self.events:
+            stages.setdefault(event["stage"], []).append(event["seconds"])
+        slides = [event for event in self.events if event["stage"] == "slide"]
+        formats = {}
+        for event in slides:
+            if event.get("format") and not event.get("error"):
+                totals = formats.setdefault(event["format"], dict(slides=0, bytes=0))
+                totals["slides"] += 1
+                totals["bytes"] += event.get("bytes") or 0
+        return dict(
+            wall_seconds=wall_seconds,
+            slides=len(slides),
+            failed_slides=sum(1 for event in slides if event.get("error")),
+            slides_per_second=len(slides) / wall_seconds if wall_seconds else None,
+            output_bytes=sum(event.get("bytes") or 0 for event in slides),
+            formats=formats,
+            stages={
+                stage: dict(
+                    count=len(seconds),
+                    total=sum(seconds),
+                    p50=_percentile(seconds, 0.5),
+                    p95=_percentile(seconds, 0.95),
+                )
+                for stage, seconds in stages.items()
+            },
+            slowest=[
+                dict(picture=event.get("picture"), seconds=event["seconds"])
+                for event in sorted(slides, key=lambda e: e["seconds"], reverse=True)[
+                    :slowest
+                ]
+            ],
+        )
+
+
+def format_stats(report):
+    lines = [
+        "{} slides ({} failed) in {:.2f}s: {:.2f} slides/s, {} output bytes".format(
+            report["slides"],
+            report["failed_slides"],
+            report["wall_seconds"],
+            report["slides_per_second"] or 0,
+            report["output_bytes"],
+        ),
+        "{:<16}{:>8}{:>12}{:>12}{:>12}".format(
+            "stage", "count", "total s", "p50 s", "p95 s"
+        ),
+    ]
+    for stage, stats in report["stages"].items():
+        lines.append(
+            "{:<16}{:>8}{:>12.3f}{:>12.6f}{:>12.6f}".format(
+                stage, stats["count"], stats["total"], stats["p50"], stats["p95"]
+            )
+        )
+    if report.get("formats"):
+        lines.append(
+            "{:<16}{:>8}{:>16}{:>16}".format("format", "slides", "bytes", "bytes/slide")
+        )
+        lines += [
+            "{:<16}{:>8}{:>16}{:>16}".format(
+                name,
+                totals["slides"],
+                totals["bytes"],
+                totals["bytes"] // totals["slides"],
+            )
+            for name, totals in report["formats"].items()
+        ]
+    if report["slowest"]:
+        lines.append("slowest inputs:")
+        lines += [
+            "  {:.3f}s {}".format(slow["seconds"], slow["picture"])
+            for slow in report["slowest"]
+        ]
+    return "\n".join(lines)
+
+
+def parse_size(size):
+    """Return the number of bytes of a size like 512, "800K", "1.5G" or "2TB"."""
+    units = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = str(size).strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in units else ""
+    try:
+        return int(float(text[: len(text) - len(unit)]) * units[unit])
+    except ValueError:
+        raise ValueError("Invalid size: {}".format(size))
+
+
+def _hash_file(digest, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+
+@lru_cache(maxsize=None)
+def _which(executable, path):
+    # shutil.which() looked up once per process, per PATH value
+    return shutil.which(executable, path=path)
+
+
+@lru_cache(maxsize=None)
+def _executable_version(executable):
+    try:
+        completed = subprocess.run(
+            [executable, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        return None
+    lines = completed.stdout.decode("utf-8", "replace").strip().splitlines()
+    return lines[0] if lines else None
+
+
+class RasterEncoding:
+    """Format, bit depth, alpha channel and compression of raster slides.
+
+    format is one of SLIDES35_RASTER_FORMATS. depth is 8 or 16 bits per
+    channel, 16 being for PNG and TIFF only. Without alpha, slides are
+    flattened on white, as JPEG slides always are. compression is the effort
+    of lossless formats, from 0 (fastest, largest) to 9 (slowest, smallest),
+    and quality that of JPEG and WebP, from 1 to 100: WebP is lossless
+    without it. Settings left to None are the converter defaults.
+    """
+
+    def __init__(
+        self, format="png", depth=None, alpha=True, compression=None, quality=None
+    ):
+        if format not in SLIDES35_RASTER_FORMATS:
+            raise ValueError(
+                "format must be one of {} but '{}' was provided".format(
+                    SLIDES35_RASTER_FORMATS, format
+                )
+            )
+        if depth is not None:
+            depth = int(depth)
+            if depth not in (8, 16):
+                raise ValueError("depth must be 8 or 16 bits per channel")
+            if depth == 16 and format not in ("png", "tiff"):
                 raise ValueError(
-                    "converter must be one {}".format(SLIDES35_SUPPORTED_CONVERTERS)
+                    "Only PNG and TIFF slides can have 16 bits per channel"
                 )
-            self._converter = converter
-        return self
+        if compression is not None:
+            compression = int(compression)
+            if not 0 <= compression <= 9:
+                raise ValueError("compression must be between 0 and 9")
+        if quality is not None:
+            quality = int(quality)
+            if not 1 <= quality <= 100:
+                raise ValueError("quality must be between 1 and 100")
+        self.format = format
+        self.depth = depth
+        self._alpha = bool(alpha)  # kept for other formats by with_format()
+        self.alpha = self._alpha and format != "jpeg"
+        self.compression = compression
+        self.quality = quality
 
-    def verbose(self, verbose=None):
-        if verbose is None:
-            return self._verbose
-        else:
-            if type(verbose) is not bool:
-                raise TypeError("verbose flag must be a boolean")
-            self._verbose = verbose
-            return self
+    def with_format(self, format):
+        """Return these settings for another format."""
+        return RasterEncoding(
+            format, self.depth, self._alpha, self.compression, self.quality
+        )
 
-    def id(self, page_id=None):
-        if not page_id:
-            return self._id
-        else:
-            self._id = page_id
-            return self
+    def _settings(self):
+        # PNG and TIFF slides do not depend on the quality
+        quality = self.quality if self.format in ("jpeg", "webp") else None
+        return (self.format, self.depth, self.alpha, self.compression, quality)
 
-    def comment(self, comment=None):
-        if not comment:
-            return self._comment
-        else:
-            self._comment = comment
-            return self
+    def __eq__(self, other):
+        return (
+            isinstance(other, RasterEncoding) and self._settings() == other._settings()
+        )
 
-    def picture(self, picture=None):
-        if not picture:
-            return self._picture
-        else:
-            if not Path(picture).exists():
-                raise FileNotFoundError("Could not find picture: {}".format(picture))
+    def __hash__(self):
+        return hash(self._settings())
 
-            self._picture = str(Path(picture).resolve())
-            return self
+    def __repr__(self):
+        return "RasterEncoding(format={!r}, depth={}, alpha={}, compression={}, quality={})".format(
+            *self._settings()
+        )
 
-    def prefix(self, prefix=None):
-        if not prefix:
-            return self._prefix
-        else:
-            self._prefix = str(prefix)
-            return self
+    def save(self, image, fp, dpi=None):
+        """Save a Pillow image in this encoding to a path or binary stream."""
+        if self.depth == 16:
+            raise ValueError(
+                "Pillow cannot write 16 bits per channel slides, use the convert converter"
+            )
+        if not self.alpha and (
+            image.mode in ("RGBA", "LA", "PA", "P") or "transparency" in image.info
+        ):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if self.alpha else "RGB")
+        options = dict(dpi=(float(dpi),) * 2) if dpi else {}
+        if self.format == "png" and self.compression is not None:
+            options["compress_level"] = self.compression
+        elif self.format == "tiff" and self.compression is not None:
+            options["compression"] = "tiff_adobe_deflate" if self.compression else "raw"
+        elif self.format == "webp":
+            options["lossless"] = self.quality is None
+            if self.compression is not None:
+                options["method"] = round(self.compression * 6 / 9)
+        if self.quality is not None and self.format in ("jpeg", "webp"):
+            options["quality"] = self.quality
+        image.save(fp, self.format.upper(), **options)
 
-    def svg(self, output_path=None):
-        if not self._template or not Path(self._template).exists():
-            raise FileNotFoundError("Set the SVG template first")
-        if not self._id:
-            raise ValueError("Set the .id() value first")
-        if not self._picture:
-            raise ValueError("Set the .picture() value first")
-        rootElem = minidom.parse(self._template)
-        rootElem.getElementsByTagName("image")[0].attributes[
-            "xlink:href"
-        ].value = self._picture
-        rootElem.getElementsByTagName("text")[0].firstChild.firstChild.nodeValue = str(
-            self._id
-        ).center(3)
-        if output_path:
-            if self._verbose:
-                print(
-                    "{} -> {} (id: {}) -> {}".format(
-                        self._picture, self._template, self._id, output_path
-                    )
+
+def _slide_encoding(output_as, encoding=None):
+    # Returns the RasterEncoding of output_as slides with the settings of
+    # encoding, None for SVG, PDF and converter default PNG output.
+    if output_as not in SLIDES35_RASTER_FORMATS:
+        return None
+    encoding = (encoding or RasterEncoding()).with_format(output_as)
+    return None if encoding == RasterEncoding() else encoding
+
+
+def _reencode(png, output_path, encoding, dpi):
+    # Re-encodes PNG bytes into output_path, or returns the encoded bytes if it
+    # is None, for the encodings a converter cannot write itself.
+    if Image is None:
+        raise ValueError(
+            "Writing {} slides needs the Pillow module".format(encoding.format.upper())
+        )
+    with profile_stage("encode", format=encoding.format) as event:
+        with Image.open(io.BytesIO(png)) as image:
+            if output_path is not None:
+                encoding.save(image, output_path, dpi)
+                event["bytes"] = os.path.getsize(output_path)
+                return None
+            stream = io.BytesIO()
+            encoding.save(image, stream, dpi)
+        event["bytes"] = stream.tell()
+        return stream.getvalue()
+
+
+class Converter:
+    """SVG to PNG conversion through an external executable.
+
+    Single slides are piped through the tool's stdin, and its stdout when the
+    PNG is wanted as bytes. Subclasses provide that command line and may
+    override convert_many() to feed many slides to a single process, which
+    needs the SVGs as temporary files.
+
+    With an encoding, slides are written in that RasterEncoding: through the
+    tool's own flags where encodes() allows it, else by re-encoding its PNG
+    with Pillow.
+    """
+
+    name = None
+    in_process = False  # renders slides from their template and picture
+    batches = False  # converts many slides per process in convert_many()
+    transparent = False  # renders the page background transparent
+
+    def __init__(self, verbose=False, memory_limit=None, encoding=None):
+        self.verbose = verbose
+        self.memory_limit = memory_limit  # bytes, for the tools supporting it
+        self.encoding = encoding
+
+    def encodes(self, encoding):
+        """Return whether the tool writes slides in encoding through its own flags."""
+        return encoding is None or encoding == RasterEncoding()
+
+    def _reencodes(self):
+        return self.encoding is not None and not self.encodes(self.encoding)
+
+    def _without_encoding(self):
+        # the same converter writing its default PNG, to be re-encoded
+        return type(self)(self.verbose, self.memory_limit)
+
+    @classmethod
+    def available(cls):
+        return _which(cls.name, os.environ.get("PATH")) is not None
+
+    def version(self):
+        """Return the first line of `<tool> --version`, looked up once per process."""
+        return _executable_version(self.name)
+
+    def command(self, output_path, dpi):
+        """Return the command reading SVG on stdin and writing output_path (stdout if None)."""
+        raise NotImplementedError
+
+    def pdf_command(self, svg_paths, output_path, dpi):
+        """Return the command writing svg_paths (stdin if empty) as the pages of
+        one PDF at output_path (stdout if None)."""
+        raise ValueError("{} cannot write PDF documents".format(self.name))
+
+    def _run(self, command, **kwargs):
+        if self.verbose:
+            print(command)
+        return subprocess.run(command, **kwargs)
+
+    def convert(self, svg, output_path, dpi):
+        """Convert SVG bytes into output_path, or return the image bytes if it is None."""
+        if self._reencodes():
+            png = self._without_encoding().convert(svg, None, dpi)
+            return _reencode(png, output_path, self.encoding, dpi)
+        with profile_stage("convert", converter=self.name, slides=1) as event:
+            completed = self._run(
+                self.command(output_path, dpi),
+                input=svg,
+                stdout=subprocess.PIPE if output_path is None else None,
+                check=True,
+            )
+            event["bytes"] = (
+                len(completed.stdout)
+                if output_path is None
+                else os.path.getsize(output_path)
+            )
+        return completed.stdout
+
+    def convert_pdf(self, svg, output_path, dpi):
+        """Convert SVG bytes into a one page PDF, returning its bytes if output_path is None."""
+        with profile_stage("convert", converter=self.name, slides=1) as event:
+            completed = self._run(
+                self.pdf_command([], output_path, dpi),
+                input=svg,
+                stdout=subprocess.PIPE if output_path is None else None,
+                check=True,
+            )
+            event["bytes"] = (
+                len(completed.stdout)
+                if output_path is None
+                else os.path.getsize(output_path)
+            )
+        return completed.stdout
+
+    def convert_pdf_pages(self, svgs, output_path, dpi):
+        """Convert an iterable of SVG documents into the pages of one PDF at
+        output_path, through a single converter run."""
+        output_path = Path(output_path).resolve()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            svg_names = []
+            with profile_stage("temp_write"):
+                for n, svg in enumerate(svgs):
+                    svg_names.append("{}.svg".format(n))
+                    (Path(tmp_dir) / svg_names[-1]).write_bytes(svg)
+            if not svg_names:
+                raise ValueError("A PDF document needs at least one page")
+            with profile_stage(
+                "convert", converter=self.name, slides=len(svg_names)
+            ) as event:
+                # relative names keep the command line short for large decks
+                self._run(
+                    self.pdf_command(svg_names, output_path, dpi),
+                    cwd=tmp_dir,
+                    check=True,
                 )
-            with open(output_path, "w") as f:
-                f.write(rootElem.toxml())
-            return self
-        else:
-            return rootElem.toxml()
+                event["bytes"] = os.path.getsize(output_path)
 
-    def png(
-        self,
-        output_path,
-        dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
-    ):
-        if not shutil.which(self._converter):
-            print(
-                "Cannot find executable path for converter '{}'".format(self._converter)
+    async def convert_async(self, svg, output_path, dpi):
+        """Coroutine version of convert(), not blocking the event loop."""
+        if self._reencodes():
+            png = await self._without_encoding().convert_async(svg, None, dpi)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, _reencode, png, output_path, self.encoding, dpi
             )
-            exit(1)
+        command = self.command(output_path, dpi)
+        if self.verbose:
+            print(command)
+        with profile_stage("convert", converter=self.name, slides=1) as event:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE if output_path is None else None,
+            )
+            stdout, _ = await process.communicate(svg)
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, command)
+            event["bytes"] = (
+                len(stdout) if output_path is None else os.path.getsize(output_path)
+            )
+        return stdout
 
-        svg_handle, svg_output_filename = tempfile.mkstemp(".svg")
-        self.svg(svg_output_filename)
-        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
-        if self._verbose:
-            print("{} -> {}".format(svg_output_filename, output_path))
+    def convert_many(self, jobs):
+        """Convert (svg, output_path, dpi) jobs, one process per job.
 
-        if self._converter == "convert":
-            command_to_run = [
-                "convert",
-                "-resample",
-                str(dpi),
-                svg_output_filename,
-                output_path,
+        Returns a list holding, for each job, None on success or an error message.
+        """
+        errors = []
+        for svg, output_path, dpi in jobs:
+            try:
+                self.convert(svg, output_path, dpi)
+                errors.append(None)
+            except Exception as e:
+                errors.append(_error_message(e))
+        return errors
+
+    def _convert_batches(self, jobs, batch_command):
+        # Writes the SVGs to a temporary directory and runs batch_command(chunk)
+        # over chunks of (svg_path, output_path, dpi), then converts again one by
+        # one the jobs whose output is missing to get their own error message.
+        for _, output_path, _ in jobs:
+            if Path(output_path).exists():
+                os.unlink(output_path)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_jobs = []
+            svg_paths = {}  # variants of a slide share their SVG
+            with profile_stage("temp_write", slides=len(jobs)):
+                for svg, output_path, dpi in jobs:
+                    if svg not in svg_paths:
+                        svg_paths[svg] = Path(tmp_dir) / "{}.svg".format(len(svg_paths))
+                        svg_paths[svg].write_bytes(svg)
+                    file_jobs.append((svg_paths[svg], output_path, dpi))
+            for start in range(0, len(jobs), SLIDES35_DEFAULT_CONVERTER_BATCH_SIZE):
+                chunk = file_jobs[start : start + SLIDES35_DEFAULT_CONVERTER_BATCH_SIZE]
+                command, command_input = batch_command(chunk)
+                with profile_stage("convert", converter=self.name, slides=len(chunk)):
+                    self._run(command, input=command_input, stdout=subprocess.DEVNULL)
+        errors = [None] * len(jobs)
+        missing = [i for i, job in enumerate(jobs) if not Path(job[1]).exists()]
+        for i, error in zip(
+            missing, Converter.convert_many(self, [jobs[i] for i in missing])
+        ):
+            errors[i] = error
+        return errors
+
+
+class ImageMagickConverter(Converter):
+    name = "convert"
+    batches = True
+
+    def _limits(self):
+        # caps the pixel cache in memory, beyond which ImageMagick uses disk
+        if not self.memory_limit:
+            return []
+        limit = str(int(self.memory_limit))
+        return ["-limit", "memory", limit, "-limit", "map", limit]
+
+    def encodes(self, encoding):
+        return True
+
+    def _encoding_options(self):
+        encoding = self.encoding
+        if encoding is None:
+            return []
+        options = []
+        if encoding.depth:
+            options += ["-depth", str(encoding.depth)]
+        if not encoding.alpha:
+            options += ["-background", "white", "-alpha", "remove", "-alpha", "off"]
+        if encoding.compression is not None:
+            if encoding.format == "png":
+                options += [
+                    "-define",
+                    "png:compression-level={}".format(encoding.compression),
+                ]
+            elif encoding.format == "tiff":
+                options += ["-compress", "Zip" if encoding.compression else "None"]
+            elif encoding.format == "webp":
+                options += [
+                    "-define",
+                    "webp:method={}".format(round(encoding.compression * 6 / 9)),
+                ]
+        if encoding.format == "webp" and encoding.quality is None:
+            options += ["-define", "webp:lossless=true"]
+        if encoding.quality is not None and encoding.format in ("jpeg", "webp"):
+            options += ["-quality", str(encoding.quality)]
+        return options
+
+    def _output(self, output_path):
+        # the format prefix names the output format whatever the file suffix
+        output_format = self.encoding.format if self.encoding else "png"
+        if output_path is None:
+            return output_format + ":-"
+        if output_format == "png":
+            return str(output_path)
+        return "{}:{}".format(output_format, output_path)
+
+    def _background(self):
+        # ImageMagick paints SVG documents on white unless told otherwise
+        return ["-background", "none"] if self.transparent else []
+
+    def command(self, output_path, dpi):
+        return (
+            ["convert"]
+            + self._limits()
+            + self._background()
+            + ["-resample", str(dpi), "svg:-"]
+            + self._encoding_options()
+            + [self._output(output_path)]
+        )
+
+    def pdf_command(self, svg_paths, output_path, dpi):
+        # ImageMagick rasterizes each page at the density
+        output = str(output_path) if output_path is not None else "pdf:-"
+        return (
+            ["convert"]
+            + self._limits()
+            + ["-density", str(dpi)]
+            + (svg_paths or ["svg:-"])
+            + [output]
+        )
+
+    def convert_many(self, jobs):
+        """Convert all jobs in one process per batch, using -write per slide."""
+        if len(jobs) < 2 or any(output_path is None for _, output_path, _ in jobs):
+            return super().convert_many(jobs)
+
+        def batch_command(chunk):
+            command = ["convert"] + self._limits() + self._background()
+            for svg_path, output_path, dpi in chunk:
+                command += [str(svg_path), "-resample", str(dpi)]
+                command += self._encoding_options()
+                command += ["-write", self._output(output_path), "+delete"]
+            return command + ["null:"], None
+
+        return self._convert_batches(jobs, batch_command)
+
+
+class InkscapeConverter(Converter):
+    name = "inkscape"
+    batches = True
+
+    def encodes(self, encoding):
+        # compression and formats other than PNG go through Pillow
+        return encoding is None or (
+            encoding.format == "png" and encoding.compression is None
+        )
+
+    def _export_options(self):
+        # (option, value) pairs of the PNG color mode and background
+        encoding = self.encoding
+        if self.transparent:
+            # over the page color and opacity of the template namedview
+            return [("export-background-opacity", "0")]
+        if encoding is None or (encoding.depth is None and encoding.alpha):
+            return []
+        options = [
+            (
+                "export-png-color-mode",
+                "{}_{}".format(
+                    "RGBA" if encoding.alpha else "RGB", encoding.depth or 8
+                ),
+            )
+        ]
+        if not encoding.alpha:
+            options += [
+                ("export-background", "white"),
+                ("export-background-opacity", "1"),
             ]
-        elif self._converter == "inkscape":
-            command_to_run = [
+        return options
+
+    def command(self, output_path, dpi):
+        return (
+            [
                 "inkscape",
-                svg_output_filename,
+                "--pipe",
+                "--export-type=png",
                 "--export-dpi",
                 str(dpi),
+            ]
+            + [
+                "--{}={}".format(option, value)
+                for option, value in self._export_options()
+            ]
+            + [
                 "--export-filename",
-                output_path,
+                str(output_path) if output_path is not None else "-",
             ]
-        elif self._converter == "rsvg-convert":
-            command_to_run = [
-                "rsvg-convert",
-                "--dpi-x=" + str(dpi),
-                "--dpi-y=" + str(dpi),
-                "-o",
-                output_path,
-                svg_output_filename,
+        )
+
+    def pdf_command(self, svg_paths, output_path, dpi):
+        if len(svg_paths) > 1:
+            raise ValueError(
+                "inkscape writes one page PDF documents only, use rsvg-convert or convert"
+            )
+        return [
+            "inkscape",
+            "--export-type=pdf",
+            "--export-dpi",
+            str(dpi),
+            "--export-filename",
+            str(output_path) if output_path is not None else "-",
+        ] + (svg_paths or ["--pipe"])
+
+    def convert_many(self, jobs):
+        """Convert all jobs through one `inkscape --shell` session per batch."""
+        # action lists are split on ";" so such paths are converted one by one
+        if (
+            len(jobs) < 2
+            or self._reencodes()
+            or any(
+                output_path is None
+                or ";" in str(output_path)
+                or "\n" in str(output_path)
+                for _, output_path, _ in jobs
+            )
+        ):
+            return super().convert_many(jobs)
+
+        def batch_command(chunk):
+            options = "".join(
+                "{}:{};".format(option, value)
+                for option, value in self._export_options()
+            )
+            actions = [
+                "file-open:{};export-dpi:{};{}export-filename:{};export-do;file-close".format(
+                    svg_path, dpi, options, output_path
+                )
+                for svg_path, output_path, dpi in chunk
             ]
+            return ["inkscape", "--shell"], "\n".join(actions + ["quit", ""]).encode()
 
-        if self._verbose:
-            print(command_to_run)
+        return self._convert_batches(jobs, batch_command)
+
+
+class RsvgConverter(Converter):
+    # rsvg-convert renders many inputs only into multi-page documents, so PNG
+    # conversion keeps one process per slide
+    name = "rsvg-convert"
+
+    def encodes(self, encoding):
+        # rsvg-convert only writes 8 bits per channel RGBA PNG
+        return encoding is None or (
+            encoding.format == "png"
+            and encoding.depth in (None, 8)
+            and encoding.alpha
+            and encoding.compression is None
+        )
+
+    def command(self, output_path, dpi):
+        command = ["rsvg-convert", "--dpi-x=" + str(dpi), "--dpi-y=" + str(dpi)]
+        if output_path is not None:
+            command += ["-o", str(output_path)]
+        return command
+
+    def pdf_command(self, svg_paths, output_path, dpi):
+        # vector pages, sized after the width and height of each SVG
+        return self.command(output_path, dpi) + ["--format=pdf"] + svg_paths
+
+
+SLIDES35_SVG_GRAPHICS_ELEMENTS = (
+    "a",
+    "circle",
+    "ellipse",
+    "foreignObject",
+    "g",
+    "image",
+    "line",
+    "path",
+    "polygon",
+    "polyline",
+    "rect",
+    "svg",
+    "switch",
+    "text",
+    "use",
+)
+
+
+@lru_cache(maxsize=16)
+def _template_layers(path, mtime_ns, dpi, converter_name):
+    # Renders the template without its picture and slide number into two RGBA
+    # images: the elements painted below the picture, and the ones above it.
+    layers = []
+    with profile_stage("template_raster", template=path, dpi=dpi):
+        for layer in ("below", "above"):
+            document = minidom.parse(path)
+            image = document.getElementsByTagName("image")[0]
+            hidden = [image, document.getElementsByTagName("text")[0]]
+            node = image
+            while node.parentNode.nodeType == node.ELEMENT_NODE:
+                siblings = node.parentNode.childNodes
+                index = siblings.index(node)
+                hidden += [
+                    sibling
+                    for sibling in (
+                        siblings[index + 1 :] if layer == "below" else siblings[:index]
+                    )
+                    if sibling.nodeType == sibling.ELEMENT_NODE
+                    and sibling.localName in SLIDES35_SVG_GRAPHICS_ELEMENTS
+                ]
+                node = node.parentNode
+            for element in hidden:
+                # a style declaration overrides any display presentation attribute
+                element.setAttribute(
+                    "style", element.getAttribute("style") + ";display:none"
+                )
+            converter = get_converter(converter_name)
+            converter.transparent = True
+            png = converter.convert(document.toxml().encode("utf-8"), None, dpi)
+            layers.append(Image.open(io.BytesIO(png)).convert("RGBA"))
+    return tuple(layers)
+
+
+@lru_cache(maxsize=16)
+def _label_font(family, bold, size):
+    # Looks the template font up through fontconfig, falling back on DejaVu Sans.
+    candidates = []
+    if shutil.which("fc-match"):
+        completed = subprocess.run(
+            ["fc-match", "-f", "%{file}", family + (":bold" if bold else "")],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        candidates.append(completed.stdout.decode().strip())
+    candidates.append("DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf")
+    for candidate in candidates:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 only has a fixed size bitmap font
+        return ImageFont.load_default()
+
+
+def _composite(canvas, image, left, top, clip):
+    # Composites image at (left, top), clipped to the (x0, y0, x1, y1) box.
+    x0, y0 = max(left, clip[0], 0), max(top, clip[1], 0)
+    x1 = min(left + image.width, clip[2], canvas.width)
+    y1 = min(top + image.height, clip[3], canvas.height)
+    if x1 > x0 and y1 > y0:
+        canvas.alpha_composite(
+            image.crop((x0 - left, y0 - top, x1 - left, y1 - top)), dest=(x0, y0)
+        )
+
+
+class PillowConverter(Converter):
+    """In-process rasterizer, compositing pictures into a pre-rendered template.
+
+    The template is rendered once per DPI by an external converter, without its
+    picture and slide number, as a layer of the elements below the picture and
+    one of the elements above it. A slide then takes no process: its picture is
+    resized into place between both layers and its number drawn with Pillow.
+    Filters applied to the number are not reproduced. SVG documents, such as
+    print sheets, are converted by the external converter.
+    """
+
+    name = "pillow"
+    in_process = True
+    batches = True
+    # preferred first, as it is the fastest; layers are rendered transparent
+    layer_converters = ("rsvg-convert", "inkscape", "convert")
+
+    @classmethod
+    def available(cls):
+        return Image is not None and any(
+            SLIDES35_CONVERTER_CLASSES[name].available()
+            for name in cls.layer_converters
+        )
+
+    def encodes(self, encoding):
+        # Pillow writes 8 bits per channel only
+        return encoding is None or encoding.depth != 16
+
+    def layer_converter(self):
+        """Return the external converter rendering templates and SVG documents."""
+        for name in self.layer_converters:
+            if SLIDES35_CONVERTER_CLASSES[name].available():
+                return get_converter(
+                    name, self.verbose, self.memory_limit, self.encoding
+                )
+        raise FileNotFoundError(
+            "The pillow converter needs Pillow and one of {} installed".format(
+                self.layer_converters
+            )
+        )
+
+    def version(self):
+        return "Pillow {} over {}".format(
+            Image.__version__, self.layer_converter().version()
+        )
+
+    def convert(self, svg, output_path, dpi):
+        return self.layer_converter().convert(svg, output_path, dpi)
+
+    def convert_many(self, jobs):
+        return self.layer_converter().convert_many(jobs)
+
+    async def convert_async(self, svg, output_path, dpi):
+        return await self.layer_converter().convert_async(svg, output_path, dpi)
+
+    def pdf_command(self, svg_paths, output_path, dpi):
+        return self.layer_converter().pdf_command(svg_paths, output_path, dpi)
+
+    def render(self, template, picture, identifier, output_path, dpi):
+        """Render a slide into output_path, or return the image bytes if it is None."""
+        with profile_stage("convert", converter=self.name, slides=1) as event:
+            compiled = compile_template(template)
+            below, above = _template_layers(
+                compiled.path,
+                os.stat(compiled.path).st_mtime_ns,
+                dpi,
+                self.layer_converter().name,
+            )
+            canvas = below.copy()
+            if compiled.view_box:
+                min_x, min_y, width, height = compiled.view_box
+                scale = (canvas.width / width, canvas.height / height)
+            else:
+                min_x, min_y, scale = 0.0, 0.0, (float(dpi) / 96.0,) * 2
+
+            def to_px(x, y):
+                return (x - min_x) * scale[0], (y - min_y) * scale[1]
+
+            if compiled.picture_rect:
+                x, y, width, height = compiled.picture_rect
+                self._paste_picture(
+                    canvas,
+                    picture,
+                    to_px(x, y) + (width * scale[0], height * scale[1]),
+                    compiled.picture_aspect_ratio,
+                )
+            canvas.alpha_composite(above)
+            label = compiled.label
+            font = _label_font(
+                label["font_family"],
+                label["bold"],
+                max(1, round(label["size"] * scale[1])),
+            )
+            position = to_px(label["x"], label["y"])
+            text = str(identifier).center(3)
+            draw = ImageDraw.Draw(canvas)
+            if isinstance(font, ImageFont.FreeTypeFont):
+                anchor = {"middle": "ms", "end": "rs"}.get(label["anchor"], "ls")
+                draw.text(position, text, fill=label["fill"], font=font, anchor=anchor)
+            else:
+                draw.text(
+                    (position[0], position[1] - font.getbbox(text)[3]),
+                    text,
+                    fill=label["fill"],
+                    font=font,
+                )
+            encoding = self.encoding or RasterEncoding()
+            if output_path is None:
+                stream = io.BytesIO()
+                encoding.save(canvas, stream, dpi)
+                event["bytes"] = stream.tell()
+                return stream.getvalue()
+            encoding.save(canvas, output_path, dpi)
+            event["bytes"] = os.path.getsize(output_path)
+        return None
+
+    def _paste_picture(self, canvas, picture, rect, aspect_ratio):
+        # Places the picture into the (x, y, width, height) pixel rectangle
+        # following the SVG preserveAspectRatio rules.
+        x, y, width, height = rect
+        align, _, meet_or_slice = aspect_ratio.strip().partition(" ")
+        with Image.open(picture) as source:
+            if align == "none":
+                size = (width, height)
+            else:
+                fit = max if meet_or_slice.strip() == "slice" else min
+                factor = fit(width / source.width, height / source.height)
+                size = (source.width * factor, source.height * factor)
+            pixels = tuple(max(1, round(length)) for length in size)
+            source.draft("RGB", pixels)
+            resized = source.convert("RGBA").resize(pixels, Image.LANCZOS)
+        offsets = {"Min": 0.0, "Mid": 0.5, "Max": 1.0}
+        left = x + (width - size[0]) * offsets.get(align[1:4], 0.5)
+        top = y + (height - size[1]) * offsets.get(align[5:8], 0.5)
+        _composite(
+            canvas,
+            resized,
+            round(left),
+            round(top),
+            (round(x), round(y), round(x + width), round(y + height)),
+        )
+
+    async def render_async(self, template, picture, identifier, output_path, dpi):
+        """Coroutine version of render(), running it in the default executor."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.render, template, picture, identifier, output_path, dpi
+        )
+
+    def render_many(self, jobs):
+        """Render ((template, picture, identifier), output_path, dpi) jobs.
+
+        Returns a list holding, for each job, None on success or an error message.
+        """
+        errors = []
+        for (template, picture, identifier), output_path, dpi in jobs:
+            try:
+                self.render(template, picture, identifier, output_path, dpi)
+                errors.append(None)
+            except Exception as e:
+                errors.append(_error_message(e))
+        return errors
+
+
+SLIDES35_CONVERTER_CLASSES = {
+    converter_class.name: converter_class
+    for converter_class in (
+        InkscapeConverter,
+        ImageMagickConverter,
+        RsvgConverter,
+        PillowConverter,
+    )
+}
+
+
+def get_converter(name, verbose=False, memory_limit=None, encoding=None):
+    if name not in SLIDES35_CONVERTER_CLASSES:
+        raise ValueError(
+            "converter must be one {}".format(tuple(SLIDES35_CONVERTER_CLASSES))
+        )
+    return SLIDES35_CONVERTER_CLASSES[name](
+        verbose=verbose, memory_limit=memory_limit, encoding=encoding
+    )
+
+
+SLIDES35_AUTO_CONVERTER_PREFERENCE = ("pillow", "rsvg-convert", "convert", "inkscape")
+SLIDES35_CALIBRATION_SLIDES = 3
+
+
+def _write_calibration_png(path, size=(360, 240)):
+    # Writes a gradient PNG with the standard library only.
+    width, height = size
+    rows = b"".join(
+        b"\x00" + bytes(v for x in range(width) for v in (x % 256, y % 256, 128))
+        for y in range(height)
+    )
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    Path(path).write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _calibrate(converter, template, dpi):
+    # Returns the seconds per slide of converting calibration slides of the
+    # template, or None if the converter failed or rendered a wrong size.
+    compiled = compile_template(template)
+    expected = [round(length / 25.4 * float(dpi)) for length in compiled.size_mm]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        picture = Path(tmp_dir) / "calibration.png"
+        _write_calibration_png(picture)
+        outputs = [
+            Path(tmp_dir) / "{}.png".format(n)
+            for n in range(SLIDES35_CALIBRATION_SLIDES)
+        ]
+        if converter.in_process:
+            jobs = [
+                ((template, picture, n + 1), output, dpi)
+                for n, output in enumerate(outputs)
+            ]
+        else:
+            jobs = [
+                (compiled.render(picture, n + 1), output, dpi)
+                for n, output in enumerate(outputs)
+            ]
+        start = time.perf_counter()
+        if converter.in_process:
+            errors = converter.render_many(jobs)
+        else:
+            errors = converter.convert_many(jobs)
+        seconds = (time.perf_counter() - start) / len(jobs)
+        for output, error in zip(outputs, errors):
+            if error or not output.exists():
+                return None
+            with open(output, "rb") as f:
+                header = f.read(24)
+            if header[:8] != b"\x89PNG\r\n\x1a\n" or any(
+                abs(actual - length) > 1
+                for actual, length in zip(struct.unpack(">II", header[16:24]), expected)
+            ):
+                return None
+    return seconds
+
+
+def _converters_fingerprint():
+    # Changes whenever a converter is installed, removed or updated.
+    fingerprint = {"pillow": Image.__version__ if Image is not None else None}
+    for name in SLIDES35_SUPPORTED_CONVERTERS:
+        path = _which(name, os.environ.get("PATH"))
+        if name != "pillow":
+            fingerprint[name] = [path, os.stat(path).st_mtime_ns] if path else None
+    return fingerprint
+
+
+def probe_converters(cache_path=None, template=None, dpi=None, calibrate=False):
+    """Return the capabilities of the supported converters, probed once per host.
+
+    Returns a dict of dicts by converter name, with whether it is available,
+    its version, and its features: stdin input, batch conversion, PDF and
+    multi-page PDF output. With calibrate, each also has the seconds per
+    slide of converting calibration slides of template at dpi, None if its
+    output was wrong. Results are kept in the cache_path JSON file, under the
+    host name, until a converter executable changes.
+    """
+    host = socket.gethostname()
+    fingerprint = _converters_fingerprint()
+    saved = {}
+    if cache_path and Path(cache_path).exists():
+        try:
+            saved = json.loads(Path(cache_path).read_text())
+        except ValueError:  # corrupted, probed again
+            saved = {}
+    probe = saved.get(host)
+    if not probe or probe.get("fingerprint") != fingerprint:
+        probe = dict(fingerprint=fingerprint, converters={}, calibrations={})
+        for name in SLIDES35_SUPPORTED_CONVERTERS:
+            converter = get_converter(name)
+            available = converter.available()
+            features = dict(
+                stdin=available and not converter.in_process,
+                batches=available and converter.batches,
+                pdf=False,
+                pdf_pages=False,
+            )
+            if available:
+                for feature, pages in (("pdf", []), ("pdf_pages", ["0.svg", "1.svg"])):
+                    try:
+                        converter.pdf_command(pages, None, 96)
+                        features[feature] = True
+                    except ValueError:
+                        pass
+            probe["converters"][name] = dict(
+                available=available,
+                version=converter.version() if available else None,
+                features=features,
+            )
+    converters = {name: dict(info) for name, info in probe["converters"].items()}
+    if calibrate:
+        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+        digest = hashlib.sha256()
+        _hash_file(digest, template)
+        key = "{}:{}".format(digest.hexdigest(), dpi)
+        if key not in probe["calibrations"]:
+            probe["calibrations"][key] = {
+                name: (
+                    _calibrate(get_converter(name), template, dpi)
+                    if info["available"]
+                    else None
+                )
+                for name, info in converters.items()
+            }
+        for name, seconds in probe["calibrations"][key].items():
+            converters[name]["seconds"] = seconds
+    if cache_path and saved.get(host) != probe:
+        saved[host] = probe
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path("{}.{}.tmp".format(cache_path, os.getpid()))
+        tmp_path.write_text(json.dumps(saved, indent=1))
+        os.replace(tmp_path, cache_path)
+    return converters
+
+
+def select_converter(
+    template=SLIDES35_DEFAULT_SVG_TEMPLATE,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    cache_path=None,
+    calibrate=False,
+    pdf_pages=False,
+):
+    """Return the name of the converter to use for `--converter auto`.
+
+    Without calibrate, the first available one in
+    SLIDES35_AUTO_CONVERTER_PREFERENCE; with it, the one converting the
+    calibration slides the fastest with a right output. pdf_pages only
+    considers converters writing multi-page PDFs. The pillow converter is
+    only considered over rsvg-convert template layers, the ones its slides
+    are checked against, as calibration only checks the output size.
+    Raises FileNotFoundError if there is none.
+    """
+    converters = probe_converters(cache_path, template, dpi, calibrate)
+    candidates = [
+        name
+        for name in SLIDES35_AUTO_CONVERTER_PREFERENCE
+        if converters[name]["available"]
+        and (name != "pillow" or converters["rsvg-convert"]["available"])
+        and (not pdf_pages or converters[name]["features"]["pdf_pages"])
+        and (not calibrate or converters[name]["seconds"] is not None)
+    ]
+    if calibrate:
+        candidates.sort(key=lambda name: converters[name]["seconds"])
+    if not candidates:
+        raise FileNotFoundError(
+            "Cannot find any working converter among {}".format(
+                SLIDES35_SUPPORTED_CONVERTERS
+            )
+        )
+    return candidates[0]
+
+
+class RenderCache:
+    """Directory of rendered slides keyed by a hash of everything they depend on.
+
+    Hits are hard-linked into place (or copied across file systems). Entries
+    beyond max_size bytes are evicted least recently used first.
+    """
+
+    def __init__(
+        self, cache_dir=SLIDES35_DEFAULT_CACHE_DIR, max_size=SLIDES35_DEFAULT_CACHE_SIZE
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = parse_size(max_size)
+
+    def key(self, template, picture, identifier, dpi, converter, **options):
+        """Return the cache key of a slide; options are any other render settings."""
+        digest = hashlib.sha256()
+        for path in (template, picture):
+            _hash_file(digest, path)
+            digest.update(b"\x00")
+        values = [identifier, dpi, converter.name, converter.version()]
+        values += ["{}={}".format(name, options[name]) for name in sorted(options)]
+        for value in values:
+            digest.update(str(value).encode("utf-8") + b"\x00")
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return self.cache_dir / key[:2] / "{}.png".format(key)
+
+    def get(self, key, output_path):
+        """Put the cached render of key at output_path, returning False on a miss."""
+        entry = self._entry(key)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        if os.path.lexists(output_path):
+            os.unlink(output_path)
+        try:
+            os.link(entry, output_path)
+        except OSError:
+            shutil.copyfile(entry, output_path)
+        return True
+
+    def put(self, key, output_path):
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry.with_name(
+            "{}.{}.{}.tmp".format(entry.name, os.getpid(), threading.get_ident())
+        )
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, entry)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits max_size."""
+        entries = []
+        for entry in self.cache_dir.glob("??/*.png"):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(entry)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def picture_format(path):
+    """Return the format of a picture from its magic bytes, or None."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+    except OSError:
+        return None
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "tiff"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+def scan_pictures(pictures_dir, recursive=False, verbose=False):
+    """Yield the (path, stat) of pictures found in pictures_dir, in no particular order.
+
+    Entries are streamed from os.scandir() and kept only if their extension is
+    one of SLIDES35_PICTURE_EXTENSIONS and their magic bytes match a picture format.
+    Symbolic links to directories are not followed, as they may loop.
+    """
+    with os.scandir(pictures_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not entry.name.startswith("."):
+                    yield from scan_pictures(entry.path, recursive, verbose)
+                continue
+            if (
+                not entry.is_file()
+                or not entry.name.lower().endswith(SLIDES35_PICTURE_EXTENSIONS)
+                or not picture_format(entry.path)
+            ):
+                if verbose:
+                    print("Skipping {}: not a picture".format(entry.path))
+                continue
+            yield Path(entry.path), entry.stat()
+
+
+def _tiff_datetime_original(f, base):
+    # Reads DateTimeOriginal (or DateTime) from the TIFF structure starting at
+    # offset base of the binary file f, seeking only to the IFDs involved.
+    f.seek(base)
+    header = f.read(8)
+    if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+        return None
+    endian = "<" if header[:2] == b"II" else ">"
+
+    def read_ifd(offset):
+        f.seek(base + offset)
+        count_bytes = f.read(2)
+        if len(count_bytes) < 2:
+            return {}
+        (count,) = struct.unpack(endian + "H", count_bytes)
+        tags = {}
+        for _ in range(count):
+            entry = f.read(12)
+            if len(entry) < 12:
+                break
+            tag, value_type, value_count, value = struct.unpack(endian + "HHII", entry)
+            tags[tag] = (value_type, value_count, value)
+        return tags
+
+    def read_ascii(value_type, value_count, value):
+        if value_type != 2 or value_count <= 4:
+            return None
+        f.seek(base + value)
+        return f.read(value_count).split(b"\x00")[0].decode("ascii", "replace")
+
+    ifd0 = read_ifd(struct.unpack(endian + "I", header[4:8])[0])
+    if 0x8769 in ifd0:
+        exif_ifd = read_ifd(ifd0[0x8769][2])
+        if 0x9003 in exif_ifd:
+            return read_ascii(*exif_ifd[0x9003])
+    if 0x0132 in ifd0:
+        return read_ascii(*ifd0[0x0132])
+    return None
+
+
+def exif_datetime(path):
+    """Return the EXIF DateTimeOriginal ("YYYY:MM:DD HH:MM:SS") of a JPEG or TIFF.
+
+    Only the file headers are read; None is returned when there is no date.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4)
+            if head.startswith((b"II*\x00", b"MM\x00*")):
+                return _tiff_datetime_original(f, 0)
+            if not head.startswith(b"\xff\xd8"):
+                return None
+            exif = _jpeg_exif(f)
+            return _tiff_datetime_original(io.BytesIO(exif), 6) if exif else None
+    except (OSError, struct.error):
+        return None
+
+
+def _jpeg_exif(f):
+    # Returns the EXIF segment of the JPEG file f, starting with its
+    # "Exif\0\0" header, or None.
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        (length,) = struct.unpack(">H", marker[2:])
+        # image data follows the start of scan marker: no EXIF after it
+        if marker[1] == 0xDA:
+            return None
+        if marker[1] == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b"Exif\x00\x00"):
+                return data
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _jpeg_dimensions(f):
+    # Walks the JPEG segments up to the start of frame marker.
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return None
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD8:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2 or marker[1] == 0xDA:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_first_ifd(f, base, tags):
+    # Returns the SHORT or LONG values of tags in the first IFD of the TIFF
+    # structure starting at offset base of the binary file f.
+    f.seek(base)
+    header = f.read(8)
+    if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+        return {}
+    endian = "<" if header[:2] == b"II" else ">"
+    f.seek(base + struct.unpack(endian + "I", header[4:8])[0])
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return {}
+    values = {}
+    for _ in range(struct.unpack(endian + "H", count_bytes)[0]):
+        entry = f.read(12)
+        if len(entry) < 12:
+            break
+        tag, value_type = struct.unpack(endian + "HH", entry[:4])
+        if tag in tags and value_type == 3:
+            values[tag] = struct.unpack(endian + "H", entry[8:10])[0]
+        elif tag in tags and value_type == 4:
+            values[tag] = struct.unpack(endian + "I", entry[8:12])[0]
+    return values
+
+
+def picture_dimensions(path):
+    """Return the (width, height) in pixels of a picture, or None.
+
+    Only the file header is read, for the formats of picture_format().
+    """
+    try:
+        with open(path, "rb") as f:
+            return _header_dimensions(f)
+    except OSError:
+        return None
+
+
+def _header_dimensions(f):
+    # Reads the (width, height) from the header of the binary file f, or None,
+    # leaving f where the header walk stopped.
+    head = f.read(30)
+    try:
+        if head.startswith(b"\xff\xd8\xff"):
+            return _jpeg_dimensions(f)
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", head[16:24])
+        if head.startswith((b"GIF87a", b"GIF89a")):
+            return struct.unpack("<HH", head[6:10])
+        if head.startswith((b"II*\x00", b"MM\x00*")):
+            tags = _tiff_first_ifd(f, 0, (256, 257))
+            return (tags[256], tags[257]) if len(tags) == 2 else None
+        if head.startswith(b"BM"):
+            width, height = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+        if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+            chunk = head[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", head[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                (bits,) = struct.unpack("<I", head[21:25])
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return (
+                    int.from_bytes(head[24:27], "little") + 1,
+                    int.from_bytes(head[27:30], "little") + 1,
+                )
+    except struct.error:
+        pass
+    return None
+
+
+def picture_orientation(path):
+    """Return the EXIF orientation (1 to 8) of a JPEG or TIFF picture, 1 if unset.
+
+    SVG converters draw pictures as stored, so pictures with another
+    orientation appear rotated or mirrored on their slides.
+    """
+    orientation = 1
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4)
+            if head.startswith((b"II*\x00", b"MM\x00*")):
+                orientation = _tiff_first_ifd(f, 0, (0x0112,)).get(0x0112, 1)
+            elif head.startswith(b"\xff\xd8"):
+                exif = _jpeg_exif(f)
+                if exif:
+                    orientation = _tiff_first_ifd(io.BytesIO(exif), 6, (0x0112,)).get(
+                        0x0112, 1
+                    )
+    except (OSError, struct.error):
+        pass
+    return orientation if 1 <= orientation <= 8 else 1
+
+
+def inspect_picture(path):
+    """Return a dict of the format, width, height and orientation of a picture.
+
+    Only the file header is read. Raises OSError if the picture cannot be
+    read, and ValueError if it is not in a supported format or its header
+    is truncated.
+    """
+    with open(path, "rb") as f:
+        if not f.read(1):
+            raise ValueError("{} is empty".format(path))
+    kind = picture_format(path)
+    if not kind:
+        raise ValueError("{} is not a picture of a supported format".format(path))
+    dimensions = picture_dimensions(path)
+    if not dimensions or not all(dimensions):
+        raise ValueError("{} has a truncated or corrupt {} header".format(path, kind))
+    return dict(
+        format=kind,
+        width=dimensions[0],
+        height=dimensions[1],
+        orientation=picture_orientation(path),
+    )
+
+
+def _check_picture_header(path):
+    # Fails a batch slide before its SVG is built when its picture is empty or
+    # ends within its header. Pictures of other formats, or whose header is
+    # only unusual, are left to the converter.
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            raise ValueError("{} is empty".format(path))
+        if _header_dimensions(f) is None and f.tell() >= size and picture_format(path):
+            raise ValueError(
+                "{} has a truncated {} header".format(path, picture_format(path))
+            )
+
+
+class ExifIndex:
+    """JSON file remembering the EXIF date of pictures by path, size and mtime."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._changed = False
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def datetime(self, path, stat):
+        key = str(Path(path).resolve())
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = self._entries.get(key)
+        if entry and entry[:2] == signature:
+            return entry[2]
+        value = exif_datetime(path)
+        self._entries[key] = signature + [value]
+        self._changed = True
+        return value
+
+    def save(self):
+        if not self._changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name("{}.{}.tmp".format(self.path.name, os.getpid()))
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+        self._changed = False
+
+
+def discover_pictures(
+    pictures_dir, recursive=False, sort="name", index_path=None, verbose=False
+):
+    """Return the pictures of pictures_dir sorted by "name", "mtime" or "exif".
+
+    Names are compared relatively to pictures_dir. The "exif" order uses the
+    DateTimeOriginal of pictures, falling back to their mtime, and remembers
+    dates in the ExifIndex at index_path if given.
+    """
+    if sort not in SLIDES35_SORT_KEYS:
+        raise ValueError("sort must be one of {}".format(SLIDES35_SORT_KEYS))
+    index = ExifIndex(index_path) if sort == "exif" and index_path else None
+    keyed = [
+        (_picture_sort_key(pictures_dir, path, stat, sort, index), path)
+        for path, stat in scan_pictures(pictures_dir, recursive, verbose)
+    ]
+    if index:
+        index.save()
+    return [path for _, path in sorted(keyed)]
+
+
+def _picture_sort_key(pictures_dir, path, stat, sort, index=None):
+    name = str(Path(path).relative_to(pictures_dir))
+    if sort == "name":
+        return (name,)
+    if sort == "mtime":
+        return (stat.st_mtime_ns, name)
+    date = index.datetime(path, stat) if index else exif_datetime(path)
+    if not date:
+        date = time.strftime("%Y:%m:%d %H:%M:%S", time.localtime(stat.st_mtime))
+    return (date, name)
+
+
+def _is_picture(path):
+    return (
+        path.name.lower().endswith(SLIDES35_PICTURE_EXTENSIONS)
+        and path.is_file()
+        and bool(picture_format(path))
+    )
+
+
+class PicturesWatcher:
+    """Wait for changes in a directory of pictures.
+
+    Uses Linux inotify through the C library where available, else polls
+    every poll_interval seconds. With recursive, subdirectories (except
+    hidden ones) are watched too.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(
+        self,
+        pictures_dir,
+        recursive=False,
+        poll_interval=SLIDES35_WATCH_POLL_INTERVAL,
+        inotify=True,
+    ):
+        self.pictures_dir = Path(pictures_dir)
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._watches = {}
+        if inotify:
+            try:
+                self._init_inotify()
+            except (OSError, AttributeError):
+                self.close()
+
+    @property
+    def polling(self):
+        return self._fd is None
+
+    def _init_inotify(self):
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._fd = fd
+        self._add_watch(self.pictures_dir)
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(directory),
+            self.IN_MODIFY
+            | self.IN_ATTRIB
+            | self.IN_CLOSE_WRITE
+            | self.IN_MOVED_FROM
+            | self.IN_MOVED_TO
+            | self.IN_CREATE
+            | self.IN_DELETE,
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+        self._watches[wd] = Path(directory)
+        if self.recursive:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # like scan_pictures(), not following directory links
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        self._add_watch(entry.path)
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds (forever if None) for changes.
+
+        Returns the set of paths which changed, or None when any picture may
+        have changed: when polling, when the kernel dropped events or when
+        a watched subdirectory changed.
+        """
+        if self._fd is None:
+            time.sleep(
+                self.poll_interval
+                if timeout is None
+                else min(timeout, self.poll_interval)
+            )
+            return None
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        changed = set()
+        while ready:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed = None
+                elif mask & self.IN_IGNORED:
+                    self._watches.pop(wd, None)
+                elif mask & self.IN_ISDIR:
+                    if self.recursive and wd in self._watches:
+                        directory = self._watches[wd] / os.fsdecode(name)
+                        if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                            self._add_watch(directory)
+                        changed = None
+                elif changed is not None and wd in self._watches:
+                    changed.add(self._watches[wd] / os.fsdecode(name))
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def picture_proxy(picture, size, proxy_dir):
+    """Return a copy of picture downscaled to cover size (in pixels), made once.
+
+    Proxies are kept in proxy_dir, named after a hash of the picture bytes
+    and size. JPEG pictures are decoded at reduced scale directly. The EXIF
+    orientation is applied to the proxy, which is saved as RGB(A). The picture
+    itself is returned when it is not larger than size. Requires Pillow.
+    """
+    if Image is None:
+        raise ImportError("Pillow is required for picture proxies")
+    digest = _hash_file(hashlib.sha256(), picture)
+    digest.update("{}x{}:upright".format(*size).encode("utf-8"))
+    with Image.open(picture) as image:
+        # Orientations 5 to 8 swap width and height once transposed
+        transposed = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        width, height = image.size[::-1] if transposed else image.size
+        ratio = max(size[0] / width, size[1] / height)
+        if ratio >= 1:
+            return Path(picture)
+        suffix = ".jpg" if image.format == "JPEG" else ".png"
+        proxy = Path(proxy_dir) / (digest.hexdigest() + suffix)
+        if proxy.exists():
+            return proxy
+        target = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+        image.draft(image.mode, target[::-1] if transposed else target)
+        scaled = ImageOps.exif_transpose(image).resize(target, Image.LANCZOS)
+    # JPEG can hold CMYK or YCbCr and PNG neither, nor LAB
+    if suffix == ".jpg" and scaled.mode not in ("RGB", "L"):
+        scaled = scaled.convert("RGB")
+    elif suffix == ".png" and scaled.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        alpha = scaled.mode in ("La", "PA", "RGBa") or "transparency" in scaled.info
+        scaled = scaled.convert("RGBA" if alpha else "RGB")
+    proxy.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = proxy.with_name(
+        "{}.{}.{}.tmp".format(proxy.name, os.getpid(), threading.get_ident())
+    )
+    scaled.save(tmp_path, "JPEG" if suffix == ".jpg" else "PNG", quality=95)
+    os.replace(tmp_path, proxy)
+    return proxy
+
+
+_embed_spool = None
+
+
+class EmbeddedPicture:
+    """Picture as a base64 data URI, streamed in chunks.
+
+    The encoded payload is spooled to a temporary file of the process the
+    first time, then streamed from it for every other slide of the picture.
+    The payload of a picture that changed since replaces the previous one.
+    """
+
+    MIME_TYPES = {
+        "jpeg": "image/jpeg",
+        "png": "image/png",
+        "gif": "image/gif",
+        "tiff": "image/tiff",
+        "webp": "image/webp",
+        "bmp": "image/bmp",
+    }
+
+    def __init__(self, picture):
+        self.picture = Path(picture)
+        self.mime_type = self.MIME_TYPES.get(
+            picture_format(picture), "application/octet-stream"
+        )
+
+    def _spool_path(self):
+        # Named after the picture path, then its size and modification time
+        global _embed_spool
+        if _embed_spool is None:
+            _embed_spool = tempfile.TemporaryDirectory(prefix="slides35-embed-")
+        st = self.picture.stat()
+        path_key = str(self.picture.resolve()).encode("utf-8")
+        signature = "{}\x00{}".format(st.st_size, st.st_mtime_ns).encode("utf-8")
+        return Path(_embed_spool.name) / "{}-{}".format(
+            hashlib.sha256(path_key).hexdigest(),
+            hashlib.sha256(signature).hexdigest()[:16],
+        )
+
+    def chunks(self):
+        """Yield the data URI as bytes chunks."""
+        yield "data:{};base64,".format(self.mime_type).encode("ascii")
+        spool_path = self._spool_path()
+        if spool_path.exists():
+            with open(spool_path, "rb") as f:
+                yield from iter(lambda: f.read(SLIDES35_EMBED_CHUNK_SIZE), b"")
+            return
+        # threads may spool the same picture at once, as in the serve() daemon
+        tmp_path = spool_path.with_name(
+            "{}.{}.{}.tmp".format(spool_path.name, os.getpid(), threading.get_ident())
+        )
+        try:
+            with open(self.picture, "rb") as f, open(tmp_path, "wb") as spool:
+                for chunk in iter(lambda: f.read(SLIDES35_EMBED_CHUNK_SIZE), b""):
+                    encoded = base64.b64encode(chunk)
+                    spool.write(encoded)
+                    yield encoded
+            os.replace(tmp_path, spool_path)
+        finally:
+            # left over when the generator is closed before the end
+            if tmp_path.exists():
+                tmp_path.unlink()
+        path_key = spool_path.name.partition("-")[0]
+        for stale in spool_path.parent.glob(path_key + "-*"):
+            if stale != spool_path and stale.suffix != ".tmp":
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass  # removed by another thread
+
+
+def _product(values):
+    # math.prod() is Python 3.8+
+    product = 1
+    for value in values:
+        product *= value
+    return product
+
+
+def estimate_slide_memory(template, picture, dpi, converter, proxy=False):
+    """Return a rough estimate of the peak memory of converting a slide, in bytes.
+
+    It adds up the footprint of the converter process, its decoded copies of
+    the picture (sized from its header, or from its file size when unknown)
+    and of the output raster at dpi, after SLIDES35_CONVERTER_MEMORY. With
+    proxy, the picture is expected downscaled to the size the template needs.
+    """
+    process, per_picture_pixel, per_output_pixel = SLIDES35_CONVERTER_MEMORY[converter]
+    compiled = compile_template(template)
+    dpi = float(dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI)
+    output_pixels = _product(round(mm / 25.4 * dpi) for mm in compiled.size_mm)
+    file_size = os.path.getsize(picture)
+    dimensions = picture_dimensions(picture)
+    picture_pixels = _product(dimensions) if dimensions else 4 * file_size
+    if proxy:
+        size = compiled.picture_size_px(dpi)
+        if size:
+            picture_pixels = min(picture_pixels, _product(size))
+    # plus the SVG document embedding the picture in base64
+    return (
+        process
+        + picture_pixels * per_picture_pixel
+        + output_pixels * per_output_pixel
+        + 2 * file_size
+    )
+
+
+def _picture_or_proxy(template, picture, dpi, proxy_dir):
+    if not proxy_dir:
+        return picture
+    size = compile_template(template).picture_size_px(
+        dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+    )
+    return picture_proxy(picture, size, proxy_dir) if size else picture
+
+
+class Slide:
+    def __init__(
+        self,
+        template=None,
+        verbose=False,
+        converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    ):
+        self._id = None
+        self._comment = None
+        self._picture = None
+        self._template = None
+        self._compiled = None
+        self._prefix = None
+        self._verbose = None
+        self._converter = None
+        self._memory_limit = None
+        self._embed = False
+        self.template(template)
+        self.verbose(verbose)
+        self.converter(converter)
+
+    def template(self, template=None):
+        if not template:
+            return self._template
+        elif isinstance(template, CompiledTemplate):
+            # checked when compiled, as by render_batch() once per batch
+            self._template = template.path
+            self._compiled = template
+            return self
+        else:
+            self._compiled = None
+            if not Path(template).exists():
+                raise FileNotFoundError("Could not find template: {}".format(template))
+            self._template = str(Path(template))
+            return self
+
+    def converter(self, converter=None):
+        if not converter:
+            return self._converter
+        else:
+            if type(converter) is not str:
+                raise TypeError("converter must be a str")
+            if converter not in SLIDES35_SUPPORTED_CONVERTERS:
+                raise ValueError(
+                    "converter must be one {}".format(SLIDES35_SUPPORTED_CONVERTERS)
+                )
+            self._converter = converter
+        return self
+
+    def verbose(self, verbose=None):
+        if verbose is None:
+            return self._verbose
+        else:
+            if type(verbose) is not bool:
+                raise TypeError("verbose flag must be a boolean")
+            self._verbose = verbose
+            return self
+
+    def memory_limit(self, memory_limit=None):
+        """Memory in bytes the converter may use, where it supports a limit."""
+        if memory_limit is None:
+            return self._memory_limit
+        else:
+            self._memory_limit = memory_limit
+            return self
+
+    def embed(self, embed=None):
+        """Get or set whether SVG output embeds the picture as a data URI."""
+        if embed is None:
+            return self._embed
+        else:
+            if type(embed) is not bool:
+                raise TypeError("embed flag must be a boolean")
+            self._embed = embed
+            return self
+
+    def id(self, page_id=None):
+        if not page_id:
+            return self._id
+        else:
+            self._id = page_id
+            return self
+
+    def comment(self, comment=None):
+        if not comment:
+            return self._comment
+        else:
+            self._comment = comment
+            return self
+
+    def picture(self, picture=None):
+        if not picture:
+            return self._picture
+        else:
+            if not Path(picture).exists():
+                raise FileNotFoundError("Could not find picture: {}".format(picture))
+
+            self._picture = str(Path(picture).resolve())
+            return self
+
+    def prefix(self, prefix=None):
+        if not prefix:
+            return self._prefix
+        else:
+            self._prefix = str(prefix)
+            return self
+
+    def _check_svg_settings(self):
+        if not self._template or (
+            self._compiled is None and not Path(self._template).exists()
+        ):
+            raise FileNotFoundError("Set the SVG template first")
+        if not self._id:
+            raise ValueError("Set the .id() value first")
+        if not self._picture:
+            raise ValueError("Set the .picture() value first")
+
+    def _svg_bytes(self):
+        # PNG conversion reads the picture file, so it is never embedded here
+        self._check_svg_settings()
+        compiled = self._compiled or compile_template(self._template)
+        with profile_stage("svg_build", picture=self._picture):
+            return compiled.render(self._picture, self._id)
+
+    def write_svg(self, stream):
+        """Write the SVG to a binary stream, streaming the embedded picture if any."""
+        self._check_svg_settings()
+        if self._embed:
+            compiled = self._compiled or compile_template(self._template)
+            with profile_stage("svg_build", picture=self._picture):
+                compiled.write(
+                    stream, EmbeddedPicture(self._picture).chunks(), self._id
+                )
+        else:
+            stream.write(self._svg_bytes())
+        return self
+
+    def svg(self, output_path=None):
+        if output_path:
+            if self._verbose:
+                print(
+                    "{} -> {} (id: {}) -> {}".format(
+                        self._picture, self._template, self._id, output_path
+                    )
+                )
+            with open(output_path, "wb") as f:
+                self.write_svg(f)
+            return self
+        else:
+            stream = io.BytesIO()
+            self.write_svg(stream)
+            return stream.getvalue().decode("utf-8")
+
+    def png(
+        self,
+        output_path=None,
+        dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+        encoding=None,
+    ):
+        """Convert the slide to output_path, or return the PNG bytes without it.
+
+        The SVG is piped to the converter, so no temporary file is written.
+        encoding, a RasterEncoding, writes another format, bit depth, alpha
+        channel or compression than the PNG the converter defaults to.
+        Raises FileNotFoundError if the converter is not installed.
+        """
+        converter = self._png_converter(encoding)
+        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+        if self._verbose:
+            print("{} -> {}".format(self._picture, output_path))
+
+        if converter.in_process:
+            self._check_svg_settings()
+            png = converter.render(
+                self._template, self._picture, self._id, output_path, dpi
+            )
+        else:
+            png = converter.convert(self._svg_bytes(), output_path, dpi)
+        return self if output_path is not None else png
+
+    async def png_async(
+        self,
+        output_path=None,
+        dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+        encoding=None,
+    ):
+        """Coroutine version of png(), not blocking the event loop.
+
+        Slides are not modified by rendering, so one can be rendered by many
+        tasks at once.
+        """
+        converter = self._png_converter(encoding)
+        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+        if self._verbose:
+            print("{} -> {}".format(self._picture, output_path))
+
+        if converter.in_process:
+            self._check_svg_settings()
+            png = await converter.render_async(
+                self._template, self._picture, self._id, output_path, dpi
+            )
+        else:
+            png = await converter.convert_async(self._svg_bytes(), output_path, dpi)
+        return self if output_path is not None else png
+
+    def pdf(
+        self,
+        output_path=None,
+        dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    ):
+        """Convert the slide to a one page PDF at output_path, or return its bytes.
+
+        The page has the size of the template; dpi applies to rasterizing
+        converters and effects.
+        """
+        converter = self._png_converter()
+        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+        if self._verbose:
+            print("{} -> {}".format(self._picture, output_path))
+        pdf = converter.convert_pdf(self._svg_bytes(), output_path, dpi)
+        return self if output_path is not None else pdf
+
+    def _png_converter(self, encoding=None):
+        converter = get_converter(
+            self._converter, self._verbose, self._memory_limit, encoding
+        )
+        if not converter.available():
+            raise FileNotFoundError(
+                "Cannot find executable path for converter '{}'".format(self._converter)
+            )
+        return converter
+
+    def __eq__(self, other):
+        return (
+            self._template == other._template
+            and self._id == other._id
+            and self._comment == other._comment
+            and self._picture == other._picture
+        )
+
+
+async def render_many_async(
+    slides,
+    concurrency=None,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    return_exceptions=False,
+    encoding=None,
+):
+    """Render slides to PNG concurrently, with at most concurrency conversions running.
+
+    slides is an iterable of Slide objects, rendered to PNG bytes, or of
+    (slide, output_path) pairs, rendered to files. Returns the results of
+    png_async() in order; with return_exceptions, a failed slide gives its
+    exception instead of raising it, like asyncio.gather().
+    """
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+    async def render(item):
+        slide, output_path = item if isinstance(item, tuple) else (item, None)
+        async with semaphore:
+            return await slide.png_async(output_path, dpi=dpi, encoding=encoding)
+
+    return await asyncio.gather(
+        *(render(item) for item in slides), return_exceptions=return_exceptions
+    )
+
+
+def _slide_output_path(
+    identifier, output_dir=".", output_filename=None, output_as="svg", output_prefix=""
+):
+    if not output_filename:
+        output_filename = "{}{}.{}".format(
+            output_prefix,
+            (str(identifier).zfill(SLIDES35_DEFAULT_OUTPUT_FILENAME_ZFILL_COUNT)),
+            output_as,
+        )
+    return Path(output_dir) / output_filename
+
+
+def do_slide(
+    template,
+    picture,
+    identifier,
+    output_dir=".",
+    stdout=False,
+    output_filename=None,
+    output_as="svg",
+    output_prefix=SLIDES35_DEFAULT_OUTPUT_PREFIX,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    cache=None,
+    proxy_dir=None,
+    embed=False,
+    encoding=None,
+):
+    if output_as not in ("svg", "pdf") + SLIDES35_RASTER_FORMATS:
+        raise ValueError(
+            "output_as parameter must be one of {} but '{}' was provided".format(
+                ("svg", "pdf") + SLIDES35_RASTER_FORMATS, output_as
+            )
+        )
+    # output_as replaces the format of encoding
+    encoding = _slide_encoding(output_as, encoding)
+    with profile_stage("slide", picture=str(picture)) as event:
+        try:
+            output_path = _do_slide(
+                template,
+                picture,
+                identifier,
+                output_dir,
+                stdout,
+                output_filename,
+                output_as,
+                output_prefix,
+                dpi,
+                converter,
+                verbose,
+                cache,
+                proxy_dir,
+                embed,
+                encoding,
+            )
+        except Exception as e:
+            event["error"] = _error_message(e)
+            raise
+        if not stdout:
+            event["output"] = str(output_path)
+            event["format"] = output_as
+            event["bytes"] = os.path.getsize(output_path)
+    return output_path
+
+
+def _do_slide(
+    template,
+    picture,
+    identifier,
+    output_dir,
+    stdout,
+    output_filename,
+    output_as,
+    output_prefix,
+    dpi,
+    converter,
+    verbose,
+    cache,
+    proxy_dir,
+    embed,
+    encoding=None,
+    compiled=None,
+):
+    output_path = _slide_output_path(
+        identifier, output_dir, output_filename, output_as, output_prefix
+    )
+    s = (
+        Slide(compiled or template)
+        .picture(_picture_or_proxy(template, picture, dpi, proxy_dir))
+        .id(identifier)
+        .verbose(verbose)
+        .converter(converter)
+        .embed(embed)
+    )
+    if output_as == "svg":
+        if not stdout:
+            s.svg(output_path)
+        elif embed:
+            sys.stdout.flush()
+            s.write_svg(sys.stdout.buffer)
+            sys.stdout.buffer.write(b"\n")
+        else:
+            print(s.svg())
+    elif output_as == "pdf":
+        s.pdf(output_path=output_path, dpi=dpi)
+    else:
+        dpi = dpi if dpi else SLIDES35_DEFAULT_OUTPUT_DPI
+        key = (
+            cache.key(
+                template,
+                picture,
+                identifier,
+                dpi,
+                get_converter(converter),
+                proxy=bool(proxy_dir),
+                **_encoding_cache_options(encoding),
+            )
+            if cache
+            else None
+        )
+        if not key or not cache.get(key, output_path):
+            # the previous output may be a hard link to a cache entry
+            if os.path.lexists(output_path):
+                os.unlink(output_path)
+            s.png(output_path=output_path, dpi=dpi, encoding=encoding)
+            if key:
+                # evicted by the caller once done, a scan of the whole cache
+                cache.put(key, output_path)
+    return output_path
+
+
+def _encoding_cache_options(encoding):
+    # keeps the cache keys of converter default PNG slides unchanged
+    return dict(encoding=repr(encoding)) if encoding else {}
+
+
+def _slide_bytes(kwargs, memory_limit=None, compiled=None):
+    # Returns the SVG or raster bytes of a render_batch() item without output_dir.
+    s = (
+        Slide(compiled or kwargs["template"])
+        .picture(
+            _picture_or_proxy(
+                kwargs["template"],
+                kwargs["picture"],
+                kwargs["dpi"],
+                kwargs["proxy_dir"],
+            )
+        )
+        .id(kwargs["identifier"])
+        .verbose(kwargs["verbose"])
+        .converter(kwargs["converter"])
+    )
+    if memory_limit:
+        s.memory_limit(memory_limit)
+    if kwargs["output_as"] == "svg":
+        if not kwargs["embed"]:
+            return s._svg_bytes()
+        stream = io.BytesIO()
+        s.embed(True).write_svg(stream)
+        return stream.getvalue()
+    return s.png(dpi=kwargs["dpi"], encoding=kwargs["encoding"])
+
+
+def _do_slides_batch(kwargs_list, cache=None, memory_limit=None):
+    # Renders a batch of render_batch() items: raster files missing from the cache
+    # have their SVGs built first, then all their conversions are handed to the
+    # converter at once, limited to memory_limit bytes where supported.
+    # Returns a result dict per item.
+    converters = {}  # per name and encoding
+    templates = {}  # compiled, and so checked, once per batch
+    svgs = {}  # built once per template, picture and id for all variants
+    results = []
+    pending = []  # (result, job, cache key, converter) of the raster files to convert
+    for kwargs in kwargs_list:
+        start = time.perf_counter()
+        result = dict(
+            picture=kwargs["picture"],
+            id=kwargs["identifier"],
+            comment=kwargs["comment"],
+            variant=kwargs["variant"],
+            name=_slide_output_path(
+                kwargs["identifier"],
+                ".",
+                kwargs["output_filename"],
+                kwargs["output_as"],
+                kwargs["output_prefix"],
+            ).name,
+            output=None,
+            seconds=0.0,
+            error=None,
+            cached=False,
+        )
+        results.append(result)
+        try:
+            if not kwargs["picture"]:
+                raise ValueError("Slide {} has no picture".format(kwargs["identifier"]))
+            # fails truncated pictures before their SVG is built and converted
+            _check_picture_header(kwargs["picture"])
+            if kwargs["template"] not in templates:
+                templates[kwargs["template"]] = compile_template(kwargs["template"])
+            compiled = templates[kwargs["template"]]
+            if kwargs["output_dir"] is None:
+                result["output"] = _slide_bytes(kwargs, memory_limit, compiled)
+            elif kwargs["output_as"] == "svg":
+                result["output"] = _do_slide(
+                    kwargs["template"],
+                    kwargs["picture"],
+                    kwargs["identifier"],
+                    kwargs["output_dir"],
+                    stdout=False,
+                    output_filename=kwargs["output_filename"],
+                    output_as="svg",
+                    output_prefix=kwargs["output_prefix"],
+                    dpi=kwargs["dpi"],
+                    converter=kwargs["converter"],
+                    verbose=kwargs["verbose"],
+                    cache=None,
+                    proxy_dir=kwargs["proxy_dir"],
+                    embed=kwargs["embed"],
+                    compiled=compiled,
+                )
+            else:
+                converter_key = (kwargs["converter"], kwargs["encoding"])
+                if converter_key not in converters:
+                    converters[converter_key] = get_converter(
+                        kwargs["converter"],
+                        kwargs["verbose"],
+                        memory_limit,
+                        kwargs["encoding"],
+                    )
+                converter = converters[converter_key]
+                output_path = _slide_output_path(
+                    kwargs["identifier"],
+                    kwargs["output_dir"],
+                    output_filename=kwargs["output_filename"],
+                    output_as=kwargs["output_as"],
+                    output_prefix=kwargs["output_prefix"],
+                )
+                key = None
+                if cache:
+                    key = cache.key(
+                        kwargs["template"],
+                        kwargs["picture"],
+                        kwargs["identifier"],
+                        kwargs["dpi"],
+                        converter,
+                        proxy=bool(kwargs["proxy_dir"]),
+                        **_encoding_cache_options(kwargs["encoding"]),
+                    )
+                    if cache.get(key, output_path):
+                        result["output"] = output_path
+                        result["cached"] = True
+                        result["seconds"] = time.perf_counter() - start
+                        continue
+                # the previous output may be a hard link to a cache entry
+                if os.path.lexists(output_path):
+                    os.unlink(output_path)
+                picture = _picture_or_proxy(
+                    kwargs["template"],
+                    kwargs["picture"],
+                    kwargs["dpi"],
+                    kwargs["proxy_dir"],
+                )
+                if converter.in_process:
+                    source = (kwargs["template"], picture, kwargs["identifier"])
+                else:
+                    svg_key = (kwargs["template"], picture, kwargs["identifier"])
+                    if svg_key not in svgs:
+                        svgs[svg_key] = (
+                            Slide(compiled)
+                            .picture(picture)
+                            .id(kwargs["identifier"])
+                            ._svg_bytes()
+                        )
+                    source = svgs[svg_key]
+                pending.append(
+                    (result, (source, output_path, kwargs["dpi"]), key, converter)
+                )
+        except Exception as e:
+            result["error"] = _error_message(e)
+        result["seconds"] = time.perf_counter() - start
+    for converter in converters.values():
+        converter_pending = [p for p in pending if p[3] is converter]
+        if not converter_pending:
+            continue
+        start = time.perf_counter()
+        jobs = [job for _, job, _, _ in converter_pending]
+        if converter.in_process:
+            errors = converter.render_many(jobs)
+        else:
+            errors = converter.convert_many(jobs)
+        convert_seconds = (time.perf_counter() - start) / len(jobs)
+        for (result, (_, output_path, _), key, _), error in zip(
+            converter_pending, errors
+        ):
+            result["seconds"] += convert_seconds
+            if error:
+                result["error"] = error
+            else:
+                result["output"] = output_path
+                if key:
+                    cache.put(key, output_path)
+    if _profiling_hooks:
+        for kwargs, result in zip(kwargs_list, results):
+            is_path = result["output"] is not None and not isinstance(
+                result["output"], bytes
+            )
+            _emit(
+                dict(
+                    stage="slide",
+                    seconds=result["seconds"],
+                    picture=str(result["picture"]),
+                    output=str(result["output"]) if is_path else None,
+                    format=kwargs["output_as"],
+                    bytes=(
+                        os.path.getsize(result["output"])
+                        if is_path
+                        else len(result["output"] or b"")
+                    ),
+                    cached=result["cached"],
+                    error=result["error"],
+                )
+            )
+    return results
+
+
+SLIDES35_MANIFEST_FIELDS = ("picture", "id", "comment", "template", "output")
+
+
+def read_manifest(path):
+    """Yield the rows of a CSV or JSON lines manifest as render_batch() items.
+
+    A CSV manifest has a header row naming its columns, JSON lines are objects;
+    both use the picture, id, comment, template and output fields, of which
+    only picture is required: a row without it is yielded all the same, so
+    that only its own slide fails. Relative picture and template paths are
+    relative to the manifest directory. The file is read as a stream, row by
+    row.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix not in (".csv", ".jsonl", ".ndjson"):
+        raise ValueError(
+            "Manifest {} must be a .csv, .jsonl or .ndjson file".format(path)
+        )
+    with open(path, newline="", encoding="utf-8") as f:
+        if suffix == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if not isinstance(row, dict):
+                row = {}
+            item = {
+                key: row[key]
+                for key in SLIDES35_MANIFEST_FIELDS
+                if row.get(key) not in (None, "")
+            }
+            for key in ("picture", "template"):
+                if key in item:
+                    item[key] = str(path.parent / item[key])
+            yield item
+
+
+def _batch_item(item, position):
+    # Returns the (picture, id, comment, template, output) of a render_batch() item.
+    if isinstance(item, dict):
+        fields = tuple(
+            item.get(key) or None
+            for key in ("picture", "id", "comment", "template", "output")
+        )
+    elif isinstance(item, tuple):
+        fields = (tuple(item) + (None,) * 5)[:5]
+    else:
+        fields = (item,) + (None,) * 4
+    picture, identifier, comment, template, output = fields
+    identifier = identifier if identifier is not None else position
+    return picture, identifier, comment, template, output
+
+
+def _item_kwargs(item, position, variants, create_dirs=True, **options):
+    # Returns the _do_slides_batch() kwargs of a render_batch() item, one per
+    # variant; options are the render_batch() arguments for all items.
+    picture, identifier, comment, item_template, output = _batch_item(item, position)
+    item_output_as = options["output_as"]
+    if output and Path(output).suffix.lower() in SLIDES35_OUTPUT_SUFFIXES:
+        item_output_as = SLIDES35_OUTPUT_SUFFIXES[Path(output).suffix.lower()]
+    kwargs_list = []
+    for variant in variants:
+        kwargs = dict(
+            options,
+            template=item_template or options["template"],
+            picture=picture,
+            identifier=identifier,
+            comment=comment,
+            variant=variant["name"],
+            output_filename=output,
+            output_as=item_output_as,
+        )
+        kwargs.update((key, value) for key, value in variant.items() if key != "name")
+        if variant["name"] is not None and options["output_dir"] is not None:
+            kwargs["output_dir"] = Path(options["output_dir"]) / variant["name"]
+            if create_dirs:
+                os.makedirs(kwargs["output_dir"], exist_ok=True)
+        if output and "output_as" in variant:
+            kwargs["output_filename"] = str(
+                Path(output).with_suffix("." + variant["output_as"])
+            )
+        kwargs["encoding"] = _slide_encoding(
+            kwargs["output_as"], options.get("encoding")
+        )
+        kwargs_list.append(kwargs)
+    return kwargs_list
+
+
+def plan_batch(
+    template,
+    items,
+    output_dir=".",
+    output_as="png",
+    output_prefix=SLIDES35_DEFAULT_OUTPUT_PREFIX,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    proxy_dir=None,
+    variants=None,
+    threads=SLIDES35_DEFAULT_PLAN_THREADS,
+):
+    """Check a render_batch() run from the picture headers, without rendering.
+
+    Takes the arguments of render_batch() and reads the headers of all
+    pictures through inspect_picture(), on `threads` threads. Returns a dict
+    per slide in render_batch() order, with the picture, id, variant, output
+    path (None without output_dir), template, dpi and converter (None for SVG
+    output) of the slide, the format, width, height and orientation of its
+    picture, its output pixels and memory as estimated by
+    estimate_slide_memory() (both 0 for SVG output) and error, the reason
+    the slide would fail, None if it looks renderable.
+    """
+    variants = variants or [dict(name=None)]
+    slides = [
+        kwargs
+        for position, item in enumerate(items, start=1)
+        for kwargs in _item_kwargs(
+            item,
+            position,
+            variants,
+            create_dirs=False,
+            template=template,
+            output_dir=output_dir,
+            output_as=output_as,
+            output_prefix=output_prefix,
+            dpi=dpi,
+            converter=converter,
+            verbose=False,
+            proxy_dir=proxy_dir,
+        )
+    ]
+
+    def inspect(picture):
+        try:
+            return inspect_picture(picture), None
+        except (OSError, ValueError) as e:
+            return None, _error_message(e)
+
+    pictures = list(
+        dict.fromkeys(kwargs["picture"] for kwargs in slides if kwargs["picture"])
+    )
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        headers = dict(zip(pictures, executor.map(inspect, pictures)))
+    plan = []
+    for kwargs in slides:
+        header, error = headers.get(
+            kwargs["picture"],
+            (None, "Slide {} has no picture".format(kwargs["identifier"])),
+        )
+        slide = dict(
+            picture=kwargs["picture"],
+            id=kwargs["identifier"],
+            variant=kwargs["variant"],
+            output=(
+                _slide_output_path(
+                    kwargs["identifier"],
+                    kwargs["output_dir"],
+                    kwargs["output_filename"],
+                    kwargs["output_as"],
+                    kwargs["output_prefix"],
+                )
+                if kwargs["output_dir"] is not None
+                else None
+            ),
+            template=kwargs["template"],
+            dpi=kwargs["dpi"],
+            converter=kwargs["converter"] if kwargs["output_as"] != "svg" else None,
+            format=None,
+            width=None,
+            height=None,
+            orientation=None,
+            pixels=0,
+            memory=0,
+            error=error,
+        )
+        if header:
+            slide.update(header)
+        if header and kwargs["output_as"] != "svg":
+            try:
+                slide["pixels"] = _product(
+                    round(mm / 25.4 * float(kwargs["dpi"]))
+                    for mm in compile_template(kwargs["template"]).size_mm
+                )
+                slide["memory"] = estimate_slide_memory(
+                    kwargs["template"],
+                    kwargs["picture"],
+                    kwargs["dpi"],
+                    kwargs["converter"],
+                    proxy=bool(kwargs["proxy_dir"]),
+                )
+            except (OSError, ValueError) as e:
+                slide["error"] = _error_message(e)
+        plan.append(slide)
+    return plan
+
+
+def render_batch(
+    template,
+    items,
+    output_dir=".",
+    output_as="png",
+    output_prefix=SLIDES35_DEFAULT_OUTPUT_PREFIX,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    jobs=None,
+    cache=None,
+    proxy_dir=None,
+    variants=None,
+    max_memory=None,
+    encoding=None,
+    embed=False,
+):
+    """Render an iterable of slides, returning an iterator of their results in order.
+
+    items is any iterable, possibly lazy, of pictures, of (picture, id,
+    comment, template, output) tuples (trailing items are optional) or of
+    dicts with these keys, as read by read_manifest(). Slides without an id
+    are numbered after their position (starting at 1), without a template use
+    `template`, and an output file name sets their format from its suffix.
+    The default template is compiled and the converter set up once for the
+    whole batch. Slides are rendered into output_dir, or into bytes if
+    it is None, by batches spread over a pool of `jobs` processes (default:
+    CPU count), with at most two batches per process in flight so that memory
+    stays flat whatever the number of items.
+
+    max_memory (bytes) is the memory budget of the conversions: a batch is
+    only submitted once the estimate_slide_memory() of its largest slide fits
+    in what the batches in flight leave of it (a batch over the whole budget
+    runs alone), and converters supporting it are limited to their share.
+
+    output_as is svg or one of SLIDES35_RASTER_FORMATS, and encoding a
+    RasterEncoding of the bit depth, alpha channel and compression of raster
+    slides, whatever their format. embed embeds the pictures of SVG slides as
+    data URIs.
+
+    variants, as returned by parse_variant(), render every item several times
+    from a single pass: each variant overrides some of the template, dpi,
+    output_as, converter and output_prefix arguments and is written into the
+    output_dir subdirectory named after it. The SVG of an item is built once
+    for all variants sharing its template, and the conversions of all variants
+    are handed to the converters of the same batches.
+
+    Each result is a dict with the picture, id and comment of the item, its
+    variant name (None without variants), output file name, output (file
+    path, or SVG/raster bytes), the rendering seconds, error (None on success,
+    output is None on failure) and whether it was cached. With variants, the
+    results of an item follow each other in variants order.
+
+    The arguments are checked on the call, before any item is read.
+    """
+    if output_as not in ("svg",) + SLIDES35_RASTER_FORMATS:
+        raise ValueError(
+            "output_as parameter must be one of {} but '{}' was provided".format(
+                ("svg",) + SLIDES35_RASTER_FORMATS, output_as
+            )
+        )
+    variants = variants or [dict(name=None)]
+    for variant in variants:
+        compile_template(variant.get("template", template))
+        get_converter(variant.get("converter", converter))
+        _slide_encoding(variant.get("output_as", output_as), encoding)
+    jobs = jobs if jobs else os.cpu_count() or 1
+    batch_size = SLIDES35_DEFAULT_CONVERTER_BATCH_SIZE
+    if hasattr(items, "__len__"):
+        batch_size = max(min(batch_size, -(-len(items) // jobs)), 1)
+
+    def batches():
+        batch = []
+        for position, item in enumerate(items, start=1):
+            batch += _item_kwargs(
+                item,
+                position,
+                variants,
+                template=template,
+                output_dir=output_dir,
+                output_as=output_as,
+                output_prefix=output_prefix,
+                dpi=dpi,
+                converter=converter,
+                verbose=verbose,
+                proxy_dir=proxy_dir,
+                encoding=encoding,
+                embed=embed,
+            )
+            if len(batch) == batch_size * len(variants):
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def batch_memory(batch):
+        memory = 0
+        for kwargs in batch:
+            if (
+                kwargs["output_as"] != "svg"
+                and kwargs["output_dir"] is not None
+                and kwargs["picture"]
+            ):
+                try:
+                    memory = max(
+                        memory,
+                        estimate_slide_memory(
+                            kwargs["template"],
+                            kwargs["picture"],
+                            kwargs["dpi"],
+                            kwargs["converter"],
+                            proxy=bool(kwargs["proxy_dir"]),
+                        ),
+                    )
+                except OSError:
+                    # rendering the slide will report it
+                    pass
+        return memory
+
+    def results():
+        remaining = batches()
+        first_batches = list(itertools.islice(remaining, 2))
+        try:
+            if jobs == 1 or len(first_batches) < 2:
+                for batch in itertools.chain(first_batches, remaining):
+                    yield from _do_slides_batch(batch, cache, max_memory)
+                return
+            memory_limit = max_memory // jobs if max_memory else None
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                in_flight = collections.deque()  # (future, estimated memory)
+                in_flight_memory = 0
+                try:
+                    for batch in itertools.chain(first_batches, remaining):
+                        memory = batch_memory(batch) if max_memory else 0
+                        while in_flight and (
+                            len(in_flight) >= 2 * jobs
+                            or (max_memory and in_flight_memory + memory > max_memory)
+                        ):
+                            future, future_memory = in_flight.popleft()
+                            in_flight_memory -= future_memory
+                            yield from _batch_future_results(future)
+                        if verbose and max_memory and memory > max_memory:
+                            print(
+                                "Slides estimated to need {} bytes, over --max-memory, are rendered alone".format(
+                                    memory
+                                )
+                            )
+                        if _profiling_hooks:
+                            future = executor.submit(
+                                _with_profiling,
+                                _do_slides_batch,
+                                batch,
+                                cache,
+                                memory_limit,
+                            )
+                        else:
+                            future = executor.submit(
+                                _do_slides_batch, batch, cache, memory_limit
+                            )
+                        in_flight.append((future, memory))
+                        in_flight_memory += memory
+                    while in_flight:
+                        yield from _batch_future_results(in_flight.popleft()[0])
+                finally:
+                    for future, _ in in_flight:
+                        future.cancel()
+        finally:
+            if cache:
+                cache.evict()
+
+    return results()
+
+
+SLIDES35_VARIANT_KEYS = {
+    "name": "name",
+    "dpi": "dpi",
+    "template": "template",
+    "format": "output_as",
+    "converter": "converter",
+    "prefix": "output_prefix",
+}
+
+
+def parse_variant(spec):
+    """Parse a --variant specification such as "dpi=96,format=png" for render_batch().
+
+    Keys are name, dpi, template, format (svg or one of
+    SLIDES35_RASTER_FORMATS), converter and prefix;
+    the name of the variant, its output subdirectory, defaults to its values
+    joined by underscores, such as "96dpi_png".
+    """
+    variant = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        key, separator, value = (s.strip() for s in part.partition("="))
+        if not separator or not value or key not in SLIDES35_VARIANT_KEYS:
+            raise ValueError(
+                "Invalid variant {}: expected key=value pairs with keys {}".format(
+                    spec, tuple(SLIDES35_VARIANT_KEYS)
+                )
+            )
+        variant[SLIDES35_VARIANT_KEYS[key]] = value
+    if "dpi" in variant:
+        try:
+            valid = float(variant["dpi"]) > 0
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError("Invalid variant {}: dpi must be positive".format(spec))
+    if variant.get("output_as", "png") not in ("svg",) + SLIDES35_RASTER_FORMATS:
+        raise ValueError(
+            "Invalid variant {}: format must be one of {}".format(
+                spec, ("svg",) + SLIDES35_RASTER_FORMATS
+            )
+        )
+    if variant.get("converter", SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER) not in (
+        SLIDES35_SUPPORTED_CONVERTERS
+    ):
+        raise ValueError(
+            "Invalid variant {}: converter must be one {}".format(
+                spec, SLIDES35_SUPPORTED_CONVERTERS
+            )
+        )
+    if "name" not in variant:
+        parts = []
+        if "dpi" in variant:
+            parts.append("{}dpi".format(variant["dpi"]))
+        if "template" in variant:
+            parts.append(Path(variant["template"]).stem)
+        for key in ("output_as", "converter", "output_prefix"):
+            if key in variant:
+                parts.append(variant[key])
+        variant["name"] = "_".join(parts) or "default"
+    if Path(variant["name"]).name != variant["name"]:
+        raise ValueError(
+            "Invalid variant {}: name must be a directory name".format(spec)
+        )
+    return variant
+
+
+def _batch_future_results(future):
+    # Returns the results of a pool batch, replaying its profiling events.
+    if not _profiling_hooks:
+        return future.result()
+    results, events = future.result()
+    for event in events:
+        _emit(event)
+    return results
+
+
+class SlideArchive:
+    """Write-only .zip or .tar archive, adding slides as soon as they are rendered.
+
+    PNG entries are stored uncompressed in zip archives, as their data is
+    compressed already; SVG entries are deflated.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        suffix = self.path.suffix.lower()
+        if suffix == ".zip":
+            self._archive = zipfile.ZipFile(self.path, "w")
+        elif suffix == ".tar":
+            self._archive = tarfile.open(self.path, "w")
+        else:
+            raise ValueError("Archive {} must be a .zip or .tar file".format(path))
+
+    def add(self, name, data):
+        """Write data as the archive entry name."""
+        with profile_stage("archive_write", entry=name, bytes=len(data)):
+            if isinstance(self._archive, zipfile.ZipFile):
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                info.external_attr = 0o644 << 16
+                info.compress_type = (
+                    zipfile.ZIP_DEFLATED
+                    if name.lower().endswith(".svg")
+                    else zipfile.ZIP_STORED
+                )
+                self._archive.writestr(info, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                info.mode = 0o644
+                self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def do_slides(
+    template,
+    pictures,
+    output_dir=".",
+    output_as="png",
+    output_prefix=SLIDES35_DEFAULT_OUTPUT_PREFIX,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    jobs=None,
+    cache=None,
+    proxy_dir=None,
+):
+    """Render each picture into a slide numbered after its position (starting at 1).
+
+    Work is spread over a pool of `jobs` processes (default: CPU count), each
+    converting batches of slides with as few converter processes as possible.
+    PNG slides found in the RenderCache `cache` are not converted again. With
+    a proxy_dir, pictures are embedded through picture_proxy() copies.
+    Returns a list of (picture, output_path, error) tuples in pictures order;
+    error is None on success and output_path is None on failure.
+    """
+    return [
+        (result["picture"], result["output"], result["error"])
+        for result in render_batch(
+            template,
+            list(pictures),
+            output_dir=output_dir,
+            output_as=output_as,
+            output_prefix=output_prefix,
+            dpi=dpi,
+            converter=converter,
+            verbose=verbose,
+            jobs=jobs,
+            cache=cache,
+            proxy_dir=proxy_dir,
+        )
+    ]
+
+
+def do_pdf_deck(
+    template,
+    pictures,
+    output_path,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    proxy_dir=None,
+):
+    """Render pictures as the pages of one PDF document, numbered after their position.
+
+    Every page has the size of the template and all of them are converted by
+    a single converter run, which needs rsvg-convert (vector pages) or
+    convert (pages rasterized at dpi). Returns (picture, output_path, error)
+    tuples in pictures order, like do_slides().
+    """
+    converter = get_converter(converter, verbose)
+    results = []
+    svgs = []
+    for identifier, picture in enumerate(pictures, start=1):
+        try:
+            svgs.append(
+                Slide(template)
+                .picture(_picture_or_proxy(template, picture, dpi, proxy_dir))
+                .id(identifier)
+                ._svg_bytes()
+            )
+            results.append((picture, output_path, None))
+        except Exception as e:
+            results.append((picture, None, _error_message(e)))
+    if svgs:
+        if os.path.lexists(output_path):
+            os.unlink(output_path)
+        try:
+            converter.convert_pdf_pages(svgs, output_path, dpi)
+        except Exception as e:
+            error = _error_message(e)
+            results = [
+                (picture, None, slide_error or error)
+                for picture, _, slide_error in results
+            ]
+    return results
+
+
+def _preview_caption(result):
+    return "{} - {}".format(result["id"], Path(result["picture"]).name)
+
+
+def _write_contact_sheet_png(output_path, results, columns):
+    # Lays the thumbnails of results out on a grid, each above its caption.
+    thumbnails = [
+        Image.open(io.BytesIO(result["output"])) if not result["error"] else None
+        for result in results
+    ]
+    sizes = [thumbnail.size for thumbnail in thumbnails if thumbnail]
+    width, height = sizes[0] if sizes else (1, 1)
+    padding, caption_height = 8, 14
+    cell = (width + padding, height + caption_height + padding)
+    rows = max(-(-len(results) // columns), 1)
+    sheet = Image.new(
+        "RGB",
+        (cell[0] * min(len(results), columns) + padding, cell[1] * rows + padding),
+        "#222222",
+    )
+    draw = ImageDraw.Draw(sheet)
+    for n, (result, thumbnail) in enumerate(zip(results, thumbnails)):
+        x = padding + cell[0] * (n % columns)
+        y = padding + cell[1] * (n // columns)
+        if thumbnail:
+            sheet.paste(thumbnail.convert("RGB"), (x, y))
+        caption = (
+            _preview_caption(result)
+            if thumbnail
+            else "{} - failed".format(result["id"])
+        )
+        draw.text(
+            (x, y + height + 2),
+            caption,
+            fill="#eeeeee" if thumbnail else "#ff6666",
+        )
+    sheet.save(output_path)
+
+
+def do_preview(
+    template,
+    items,
+    output_path,
+    dpi=SLIDES35_DEFAULT_PREVIEW_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    jobs=None,
+    proxy_dir=None,
+    columns=SLIDES35_PREVIEW_COLUMNS,
+):
+    """Render slide thumbnails into one contact sheet, to check a deck quickly.
+
+    items are render_batch() items, rendered in parallel at the thumbnail
+    dpi, through picture proxies if proxy_dir is given. The thumbnails are
+    laid out with their slide id and picture name into output_path: an HTML
+    page embedding them, written as they are rendered, or a PNG image (which
+    needs Pillow). Returns (picture, output_path, error) tuples in items
+    order, like do_slides().
+    """
+    output_path = Path(output_path)
+    suffix = output_path.suffix.lower()
+    if suffix not in (".html", ".htm", ".png"):
+        raise ValueError(
+            "Contact sheet {} must be an .html or .png file".format(output_path)
+        )
+    if suffix == ".png" and Image is None:
+        raise ValueError("A PNG contact sheet needs the Pillow module")
+    thumbnails = render_batch(
+        template,
+        items,
+        output_dir=None,
+        output_as="png",
+        dpi=dpi,
+        converter=converter,
+        verbose=verbose,
+        jobs=jobs,
+        proxy_dir=proxy_dir,
+    )
+    results = []
+    if suffix == ".png":
+        rendered = list(thumbnails)
+        _write_contact_sheet_png(output_path, rendered, columns)
+        results = [
+            (
+                result["picture"],
+                None if result["error"] else output_path,
+                result["error"],
+            )
+            for result in rendered
+        ]
+        return results
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            "<title>{} preview</title><style>"
+            "body{{background:#222;color:#eee;font-family:sans-serif}}"
+            "main{{display:grid;gap:12px;"
+            "grid-template-columns:repeat({},minmax(0,1fr))}}"
+            "figure{{margin:0}}img{{width:100%}}"
+            "figcaption{{font-size:12px;overflow-wrap:anywhere}}"
+            ".failed{{color:#f66}}</style></head><body><main>\n".format(
+                _escape_xml(str(template)), columns
+            )
+        )
+        for result in thumbnails:
+            if result["error"]:
+                f.write(
+                    '<figure class="failed"><figcaption>{} - {}</figcaption></figure>\n'.format(
+                        _escape_xml(str(result["id"])),
+                        _escape_xml(result["error"]),
+                    )
+                )
+            else:
+                f.write(
+                    '<figure><img src="data:image/png;base64,{}" alt="{}">'
+                    "<figcaption>{}</figcaption></figure>\n".format(
+                        base64.b64encode(result["output"]).decode("ascii"),
+                        _escape_xml(str(result["id"])),
+                        _escape_xml(_preview_caption(result)),
+                    )
+                )
+            results.append(
+                (
+                    result["picture"],
+                    None if result["error"] else output_path,
+                    result["error"],
+                )
+            )
+        f.write("</main></body></html>\n")
+    return results
+
+
+def watch_slides(
+    template,
+    pictures_dir,
+    output_dir=".",
+    recursive=False,
+    sort="name",
+    index_path=None,
+    debounce=SLIDES35_WATCH_DEBOUNCE,
+    poll_interval=SLIDES35_WATCH_POLL_INTERVAL,
+    inotify=True,
+    verbose=False,
+    **options
+):
+    """Render the pictures of pictures_dir, then keep rendering them as they change.
+
+    This generator yields render_batch() results (options are passed on to
+    it) for all pictures first, then only for the slides affected by added,
+    changed or removed pictures. Slides are numbered after the sort order of
+    discover_pictures(): a picture sorted in the middle renumbers the slides
+    after it, and the outputs of slides left over by removed pictures are
+    deleted. Changes are picked up through PicturesWatcher, and a picture is
+    only rendered once it has not been written to for debounce seconds, so
+    that partially copied files are skipped; a changed picture keeps its
+    slide number meanwhile. Close the generator to stop.
+    """
+    if sort not in SLIDES35_SORT_KEYS:
+        raise ValueError("sort must be one of {}".format(SLIDES35_SORT_KEYS))
+    pictures_dir = Path(pictures_dir)
+    index = ExifIndex(index_path) if sort == "exif" and index_path else None
+    # picture path -> ((size, mtime_ns), sort key)
+    pictures = {}
+    # slide id -> (picture path, (size, mtime_ns), output paths)
+    rendered = {}
+
+    def update(path, stat):
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if path not in pictures or pictures[path][0] != signature:
+            pictures[path] = (
+                signature,
+                _picture_sort_key(pictures_dir, path, stat, sort, index),
+            )
+
+    def remove_outputs(outputs):
+        for output in outputs:
+            try:
+                os.remove(output)
+            except FileNotFoundError:
+                pass
+
+    with PicturesWatcher(pictures_dir, recursive, poll_interval, inotify) as watcher:
+        changed = None
+        while True:
+            if changed is None:
+                found = dict(scan_pictures(pictures_dir, recursive, verbose))
+                for path in set(pictures) - set(found):
+                    del pictures[path]
+                for path, stat in found.items():
+                    update(path, stat)
+            else:
+                for path in changed:
+                    try:
+                        if _is_picture(path):
+                            update(path, path.stat())
+                            continue
+                    except OSError:
+                        pass
+                    pictures.pop(path, None)
+
+            now = time.time_ns()
+            # pictures rendered before keep their slot while a change settles,
+            # so that the slides after them are not renumbered meanwhile
+            rendered_paths = {path for path, _, _ in rendered.values()}
+            ordered = []
+            settling = set()
+            unsettled = []
+            for path, ((_, mtime_ns), key) in pictures.items():
+                age = (now - mtime_ns) / 1e9
+                if age < debounce:
+                    unsettled.append(debounce - age)
+                    if path not in rendered_paths:
+                        continue
+                    settling.add(path)
+                ordered.append((key, path))
+            ordered.sort()
+            items = [
+                dict(picture=path, id=n)
+                for n, (_, path) in enumerate(ordered, 1)
+                if path not in settling
+                and rendered.get(n, (None, None))[:2] != (path, pictures[path][0])
+            ]
+            for n in sorted(set(rendered) - set(range(1, len(ordered) + 1))):
+                remove_outputs(rendered.pop(n)[2])
+            outputs = collections.defaultdict(list)
+            for result in render_batch(
+                template, items, output_dir=output_dir, verbose=verbose, **options
+            ):
+                if result["output"] is not None:
+                    outputs[result["id"]].append(result["output"])
+                yield result
+            for item in items:
+                n, path = item["id"], item["picture"]
+                if n in rendered:
+                    remove_outputs(set(rendered[n][2]) - set(outputs[n]))
+                rendered[n] = (path, pictures[path][0], outputs[n])
+            if index:
+                index.save()
+            changed = watcher.wait(max(min(unsettled), 0.01) if unsettled else None)
+
+
+def _serve_request(request, cache=None, proxy_dir=None, verbose=False):
+    # Renders the slide of a serve() request, returning the response dict.
+    start = time.perf_counter()
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("Requests must be JSON objects")
+        unknown = sorted(set(request) - set(SLIDES35_SERVE_REQUEST_KEYS))
+        if unknown:
+            raise ValueError(
+                "Unknown request keys {}, expected {}".format(
+                    unknown, SLIDES35_SERVE_REQUEST_KEYS
+                )
+            )
+        if not request.get("picture") or request.get("id") is None:
+            raise ValueError("Requests need a picture and an id")
+        template = request.get("template", SLIDES35_DEFAULT_SVG_TEMPLATE)
+        dpi = request.get("dpi", SLIDES35_DEFAULT_OUTPUT_DPI)
+        request_proxy_dir = proxy_dir if request.get("proxy") else None
+        if request.get("stdout"):
+            response = dict(
+                svg=Slide(template)
+                .picture(
+                    _picture_or_proxy(
+                        template, request["picture"], dpi, request_proxy_dir
+                    )
+                )
+                .id(request["id"])
+                .embed(bool(request.get("embed")))
+                .svg()
+            )
+        else:
+            output_path = do_slide(
+                template,
+                request["picture"],
+                request["id"],
+                output_dir=request.get("output_dir", "."),
+                output_filename=request.get("output"),
+                output_as=request.get("output_as", "svg"),
+                dpi=dpi,
+                converter=request.get(
+                    "converter", SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER
+                ),
+                verbose=verbose,
+                cache=cache,
+                proxy_dir=request_proxy_dir,
+                embed=bool(request.get("embed")),
+                encoding=RasterEncoding(
+                    depth=request.get("depth"),
+                    alpha=request.get("alpha", True),
+                    compression=request.get("compression"),
+                    quality=request.get("quality"),
+                ),
+            )
+            response = dict(output=str(output_path))
+    except Exception as e:
+        response = dict(error=_error_message(e))
+    if isinstance(request, dict) and "tag" in request:
+        response["tag"] = request["tag"]
+    response["seconds"] = time.perf_counter() - start
+    return response
+
+
+async def _serve(socket_path, cache, proxy_dir, verbose):
+    socket_path = Path(socket_path)
+    if socket_path.exists():
+        # left over by a daemon which did not stop cleanly, unless it answers
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(str(socket_path))
+        except ConnectionRefusedError:
+            socket_path.unlink()
+        else:
+            raise OSError("A daemon already serves on {}".format(socket_path))
+    loop = asyncio.get_running_loop()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = dict(error=_error_message(e))
+                else:
+                    response = await loop.run_in_executor(
+                        None, _serve_request, request, cache, proxy_dir, verbose
+                    )
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a request line over the stream limit
+            if verbose:
+                print("Dropped connection: {}".format(_error_message(e)))
+        finally:
+            writer.close()
+
+    # requests write files as the daemon user, so the socket is created
+    # accessible to it only rather than changed after bind()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        listener.bind(str(socket_path))
+    except OSError:
+        listener.close()
+        raise
+    finally:
+        os.umask(umask)
+    server = await asyncio.start_unix_server(handle, sock=listener)
+    stop = loop.create_future()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(
+            signal_number, lambda: stop.done() or stop.set_result(None)
+        )
+
+    async def evict():
+        while True:
+            await asyncio.sleep(SLIDES35_SERVE_EVICT_INTERVAL)
+            await loop.run_in_executor(None, cache.evict)
+
+    evictor = loop.create_task(evict()) if cache else None
+    try:
+        async with server:
+            await stop
+    finally:
+        if evictor:
+            evictor.cancel()
+        if socket_path.exists():
+            socket_path.unlink()
+        if cache:
+            cache.evict()
+
+
+def serve(socket_path, cache=None, proxy_dir=None, verbose=False):
+    """Render slides requested as JSON lines over a Unix socket, until SIGINT or SIGTERM.
+
+    Each request line is an object with the picture and id of the slide and
+    optionally its template, output_dir, output (file name), output_as, dpi,
+    converter, embed, proxy (to render from a picture proxy in proxy_dir)
+    and stdout (to get the SVG back instead of a file) settings, which are
+    do_slide() arguments. It is answered by a line with the output path, or
+    svg, or error, and the rendering seconds; a tag of the request is sent
+    back with it. Paths are relative to the daemon's working directory.
+    Compiled templates, converter lookups, the PNG cache and the pillow
+    converter's template layers stay warm between requests, which are
+    rendered concurrently across connections and in order within one. The
+    socket is only accessible to the user running the daemon, and the render
+    cache is evicted every SLIDES35_SERVE_EVICT_INTERVAL seconds.
+    """
+    asyncio.run(_serve(socket_path, cache, proxy_dir, verbose))
+
+
+def request_slide(socket_path, request, timeout=None):
+    """Send a request to a serve() daemon and return its response dict."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(
+            "{} closed the connection without answering".format(socket_path)
+        )
+    return json.loads(line)
+
+
+def sheet_size_mm(sheet):
+    """Return the (width, height) of a sheet name of SLIDES35_SHEET_SIZES or "WxH[unit]"."""
+    for name, size in SLIDES35_SHEET_SIZES.items():
+        if str(sheet).lower() == name.lower():
+            return size
+    width, _, height = str(sheet).lower().partition("x")
+    unit = height.lstrip("0123456789.")
+    if not width or not height:
+        raise ValueError(
+            "sheet must be one of {} or WIDTHxHEIGHT with a unit like 100x150mm".format(
+                tuple(SLIDES35_SHEET_SIZES)
+            )
+        )
+    return length_to_mm(width + unit), length_to_mm(height)
+
+
+class SheetLayout:
+    """Grid of slides on a print sheet, in the orientation fitting the most slides.
+
+    Slides are spaced by twice the bleed, where crop marks are drawn at their
+    corners, and the grid is centered within the sheet margins.
+    """
+
+    def __init__(
+        self,
+        slide_size_mm,
+        sheet="A4",
+        bleed=SLIDES35_DEFAULT_SHEET_BLEED,
+        margin=SLIDES35_DEFAULT_SHEET_MARGIN,
+    ):
+        self.slide_width, self.slide_height = slide_size_mm
+        self.bleed = length_to_mm(bleed)
+        margin = length_to_mm(margin)
+        self.cell_width = self.slide_width + 2 * self.bleed
+        self.cell_height = self.slide_height + 2 * self.bleed
+
+        def grid(size):
+            columns = int((size[0] - 2 * margin) // self.cell_width)
+            rows = int((size[1] - 2 * margin) // self.cell_height)
+            return columns, rows
+
+        portrait = sheet_size_mm(sheet)
+        self.width, self.height = max(
+            (portrait, portrait[::-1]), key=lambda size: grid(size)[0] * grid(size)[1]
+        )
+        self.columns, self.rows = grid((self.width, self.height))
+        self.slides_per_sheet = self.columns * self.rows
+        if not self.slides_per_sheet:
+            raise ValueError("Slides do not fit on a {} sheet".format(sheet))
+
+    def sheets(self, slide_svgs):
+        """Yield sheet SVGs as bytes for an iterable of slide SVGs.
+
+        Slide SVGs must be nested ones, as returned by
+        CompiledTemplate.render(..., nested=True).
+        """
+        svgs = []
+        for svg in slide_svgs:
+            svgs.append(svg)
+            if len(svgs) == self.slides_per_sheet:
+                yield self._sheet(svgs)
+                svgs = []
+        if svgs:
+            yield self._sheet(svgs)
+
+    def _sheet(self, svgs):
+        left = (self.width - self.columns * self.cell_width) / 2 + self.bleed
+        top = (self.height - self.rows * self.cell_height) / 2 + self.bleed
+        parts = [
+            '<?xml version="1.0" ?><svg xmlns="http://www.w3.org/2000/svg"'
+            ' width="{0:g}mm" height="{1:g}mm" viewBox="0 0 {0:g} {1:g}">'.format(
+                self.width, self.height
+            ).encode("utf-8")
+        ]
+        marks = []
+        for n, svg in enumerate(svgs):
+            x = left + (n % self.columns) * self.cell_width
+            y = top + (n // self.columns) * self.cell_height
+            parts.append(
+                '<g transform="translate({:.3f},{:.3f})">'.format(x, y).encode("utf-8")
+            )
+            parts += [svg, b"</g>"]
+            if self.bleed:
+                marks += self._crop_marks(x, y)
+        parts.append(b'<g stroke="#000000" stroke-width="0.1">')
+        parts += [
+            '<line x1="{:.3f}" y1="{:.3f}" x2="{:.3f}" y2="{:.3f}"/>'.format(
+                *mark
+            ).encode("utf-8")
+            for mark in marks
+        ]
+        parts.append(b"</g></svg>")
+        return b"".join(parts)
+
+    def _crop_marks(self, x, y):
+        marks = []
+        for corner_x, corner_y, dx, dy in (
+            (x, y, -1, -1),
+            (x + self.slide_width, y, 1, -1),
+            (x, y + self.slide_height, -1, 1),
+            (x + self.slide_width, y + self.slide_height, 1, 1),
+        ):
+            marks.append((corner_x + dx * self.bleed, corner_y, corner_x, corner_y))
+            marks.append((corner_x, corner_y + dy * self.bleed, corner_x, corner_y))
+        return marks
+
+
+def do_sheets(
+    template,
+    pictures,
+    output_dir=".",
+    sheet="A4",
+    bleed=SLIDES35_DEFAULT_SHEET_BLEED,
+    output_prefix=SLIDES35_DEFAULT_SHEET_PREFIX,
+    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
+    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
+    verbose=False,
+    proxy_dir=None,
+):
+    """Impose the slides of pictures, numbered from 1, on PNG print sheets.
+
+    Each sheet is converted once. Returns a list of (picture, sheet_path, error)
+    tuples in pictures order, like do_slides().
+    """
+    compiled = compile_template(template)
+    layout = SheetLayout(compiled.size_mm, sheet, bleed)
+    results = []
+    slide_svgs = []
+    for identifier, picture in enumerate(pictures, start=1):
+        if not Path(picture).exists():
+            results.append(
+                (
+                    picture,
+                    None,
+                    "FileNotFoundError: Could not find picture: {}".format(picture),
+                )
+            )
+            continue
+        picture_path = _picture_or_proxy(template, picture, dpi, proxy_dir)
+        slide_svgs.append(
+            compiled.render(Path(picture_path).resolve(), identifier, nested=True)
+        )
+        results.append((picture, len(slide_svgs) - 1, None))
+    jobs = [
+        (svg, _slide_output_path(n, output_dir, None, "png", output_prefix), dpi)
+        for n, svg in enumerate(layout.sheets(slide_svgs), start=1)
+    ]
+    if verbose:
+        print("{} slides -> {} sheets".format(len(slide_svgs), len(jobs)))
+    errors = get_converter(converter, verbose).convert_many(jobs)
+    sheet_results = []
+    for picture, slide_index, error in results:
+        if slide_index is not None:
+            sheet_index = slide_index // layout.slides_per_sheet
+            error = errors[sheet_index]
+            sheet_results.append(
+                (picture, None if error else jobs[sheet_index][1], error)
+            )
+        else:
+            sheet_results.append((picture, None, error))
+    return sheet_results
+
+
+def _report_stats(stats, print_report, json_path):
+    report = stats.report()
+    if print_report:
+        print(format_stats(report), file=sys.stderr)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def _register_stats_report(args, stats):
+    # Called once the arguments are validated, so that early exits report nothing
+    if stats is not None:
+        atexit.register(_report_stats, stats, args.stats, args.stats_json)
+
+
+def _encoding_args(args):
+    return RasterEncoding(
+        args.output_format,
+        depth=args.bit_depth,
+        alpha=not args.strip_alpha,
+        compression=args.compression,
+        quality=args.quality,
+    )
 
-        subprocess.run(command_to_run)
 
-        os.unlink(svg_output_filename)
+def _check_batch_args(args):
+    if args.jobs is not None and args.jobs < 1:
+        print("--jobs must be at least 1. Exitting")
+        exit(1)
+    # --plan reports missing converters itself
+    if not args.plan and not get_converter(args.converter).available():
+        print("Cannot find executable path for converter '{}'".format(args.converter))
+        exit(1)
 
-        return self
 
-    def __eq__(self, other):
-        return (
-            self._template == other._template
-            and self._id == other._id
-            and self._comment == other._comment
-            and self._picture == other._picture
+def _run_plan(args, items, output_dir, proxy_dir, variants=None):
+    # Prints the --plan of a --pictures-dir or --manifest run, then exits with
+    # 1 if any picture is invalid or converter missing.
+    try:
+        plan = plan_batch(
+            args.template,
+            items,
+            output_dir=output_dir,
+            output_as=args.output_format,
+            output_prefix=(
+                args.output_prefix
+                if args.output_prefix
+                else SLIDES35_DEFAULT_OUTPUT_PREFIX
+            ),
+            dpi=args.dpi,
+            converter=args.converter,
+            proxy_dir=proxy_dir,
+            variants=variants,
+        )
+    except (OSError, ValueError, csv.Error) as e:
+        print("{}. Exitting".format(e))
+        exit(1)
+    invalid = {}
+    for slide in plan:
+        if slide["error"]:
+            invalid[slide["picture"]] = slide["error"]
+            details = "invalid: {}".format(slide["error"])
+        else:
+            details = "{}x{} {}".format(
+                slide["width"], slide["height"], slide["format"]
+            )
+            if slide["orientation"] != 1:
+                details += ", EXIF orientation {} drawn as stored".format(
+                    slide["orientation"]
+                )
+        print(
+            "{} {} -> {} ({})".format(
+                slide["id"], slide["picture"], slide["output"], details
+            )
+        )
+    if invalid:
+        print("{} invalid pictures:".format(len(invalid)))
+        for picture, error in invalid.items():
+            print("  {}: {}".format(picture, error))
+    valid = [slide for slide in plan if not slide["error"]]
+    summary = "{} slides to render, {:.1f} picture megapixels, {:.1f} output megapixels, up to {:.0f}MB per conversion".format(
+        len(valid),
+        sum(slide["width"] * slide["height"] for slide in valid) / 1e6,
+        sum(slide["pixels"] for slide in valid) / 1e6,
+        max([slide["memory"] for slide in valid], default=0) / (1 << 20),
+    )
+    if args.calibrate:
+        probes = {}
+        seconds = 0.0
+        for slide in valid:
+            if not slide["converter"]:
+                continue
+            key = (slide["template"], slide["dpi"])
+            if key not in probes:
+                probes[key] = probe_converters(
+                    Path(args.cache_dir) / "converters.json",
+                    template=slide["template"],
+                    dpi=slide["dpi"],
+                    calibrate=True,
+                )
+            seconds += probes[key][slide["converter"]].get("seconds") or 0.0
+        jobs = args.jobs if args.jobs else os.cpu_count() or 1
+        summary += ", about {:.0f}s of conversions on {} jobs".format(
+            seconds / jobs, jobs
         )
+    print(summary)
+    missing = sorted(
+        name
+        for name in {slide["converter"] for slide in valid if slide["converter"]}
+        if not get_converter(name).available()
+    )
+    for name in missing:
+        print("Cannot find executable path for converter '{}'".format(name))
+    exit(1 if invalid or missing else 0)
 
 
-def do_slide(
-    template,
-    picture,
-    identifier,
-    output_dir=".",
-    stdout=False,
-    output_filename=None,
-    output_as="svg",
-    output_prefix=SLIDES35_DEFAULT_OUTPUT_PREFIX,
-    dpi=SLIDES35_DEFAULT_OUTPUT_DPI,
-    converter=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
-    verbose=False,
-):
-    if output_as not in ("svg", "png"):
-        raise ValueError(
-            "output_as parameter must be 'svg' or 'png' but '{}' was provided"
+def _run_client(args, picture, output_filename, output_dir, output_as):
+    # Has the --serve daemon on --socket render the --picture slide, then
+    # exits with 1 if it failed. Paths are sent absolute, as the daemon runs
+    # from another directory.
+    request = dict(
+        template=str(Path(args.template).resolve()),
+        picture=str(picture),
+        id=args.id,
+        output_dir=str(output_dir.resolve()),
+        output=output_filename,
+        output_as=output_as,
+        dpi=args.dpi,
+        converter=args.converter,
+        depth=args.bit_depth,
+        alpha=not args.strip_alpha,
+        compression=args.compression,
+        quality=args.quality,
+        embed=args.embed,
+        proxy=args.proxy,
+        stdout=args.stdout,
+    )
+    try:
+        response = request_slide(args.socket, request)
+    except (OSError, ValueError) as e:
+        print("Cannot render through {}: {}. Exitting".format(args.socket, e))
+        exit(1)
+    if response.get("error"):
+        print("{}. Exitting".format(response["error"]))
+        exit(1)
+    if args.stdout:
+        print(response["svg"])
+    exit(0)
+
+
+def _run_preview(args, items, output_dir):
+    # Writes the --preview contact sheet of a --pictures-dir or --manifest run,
+    # then exits with 1 if any slide failed.
+    try:
+        results = do_preview(
+            args.template,
+            items,
+            output_dir / args.preview,
+            converter=args.converter,
+            verbose=args.verbose,
+            jobs=args.jobs,
+            # thumbnails are much faster to render from downscaled pictures
+            proxy_dir=Path(args.cache_dir) / "proxies" if Image is not None else None,
         )
-    if not output_filename:
-        output_path = "{}{}.{}".format(
-            output_prefix,
-            (str(identifier).zfill(SLIDES35_DEFAULT_OUTPUT_FILENAME_ZFILL_COUNT)),
-            output_as,
+    except (OSError, ValueError, csv.Error) as e:
+        print("{}. Exitting".format(e))
+        exit(1)
+    failures = [(picture, error) for picture, _, error in results if error]
+    for picture, error in failures:
+        print("Failed to render {}: {}".format(picture, error))
+    print(
+        "Preview of {} slides written to {}".format(
+            len(results), output_dir / args.preview
         )
-    else:
-        output_path = output_filename
-    output_path = Path(output_dir) / output_path
-    s = (
-        Slide(template)
-        .picture(picture)
-        .id(identifier)
-        .verbose(verbose)
-        .converter(converter)
     )
-    if output_as == "svg":
-        if not stdout:
-            s.svg(output_path)
-        else:
-            print(s.svg())
-    else:
-        s.png(output_path=output_path, dpi=dpi)
-    return output_path
+    exit(1 if failures else 0)
+
+
+def _run_watch(args, output_dir, cache, proxy_dir, variants=None, max_memory=None):
+    # Renders the slides of --pictures-dir as its pictures change, until
+    # interrupted.
+    print("Watching {} for pictures. Press Ctrl+C to stop".format(args.pictures_dir))
+    try:
+        for result in watch_slides(
+            args.template,
+            args.pictures_dir,
+            output_dir=output_dir,
+            recursive=args.recursive,
+            sort=args.sort,
+            index_path=Path(args.cache_dir) / "exif-index.json",
+            verbose=args.verbose,
+            output_prefix=(
+                args.output_prefix
+                if args.output_prefix
+                else SLIDES35_DEFAULT_OUTPUT_PREFIX
+            ),
+            output_as=args.output_format,
+            dpi=args.dpi,
+            converter=args.converter,
+            jobs=args.jobs,
+            cache=cache,
+            proxy_dir=proxy_dir,
+            variants=variants,
+            max_memory=max_memory,
+            encoding=_encoding_args(args),
+            embed=args.embed,
+        ):
+            if result["error"]:
+                print(
+                    "Failed to render {}: {}".format(result["picture"], result["error"])
+                )
+            else:
+                print("Rendered {} as {}".format(result["picture"], result["output"]))
+    except (OSError, ValueError) as e:
+        print("{}. Exitting".format(e))
+        exit(1)
+    except KeyboardInterrupt:
+        exit(0)
+
+
+def _run_batch(
+    args, items, output_dir, cache, proxy_dir, variants=None, max_memory=None
+):
+    # Renders the slides of a --pictures-dir or --manifest run, streaming them
+    # into the --output-archive if any, then exits with 1 if any slide failed.
+    # Archived slides are rendered as files like the others, through the cache
+    # and the batched converters, and moved into the archive one at a time.
+    archive = None
+    archive_dir = None
+    failures = 0
+    try:
+        if args.output_archive:
+            archive = SlideArchive(args.output_archive)
+            archive_dir = tempfile.TemporaryDirectory(prefix="slides35-archive-")
+        for result in render_batch(
+            args.template,
+            items,
+            output_dir=archive_dir.name if archive else output_dir,
+            output_as=args.output_format,
+            output_prefix=(
+                args.output_prefix
+                if args.output_prefix
+                else SLIDES35_DEFAULT_OUTPUT_PREFIX
+            ),
+            dpi=args.dpi,
+            converter=args.converter,
+            verbose=args.verbose,
+            jobs=args.jobs,
+            cache=cache,
+            proxy_dir=proxy_dir,
+            variants=variants,
+            max_memory=max_memory,
+            encoding=_encoding_args(args),
+            embed=args.embed,
+        ):
+            if result["error"]:
+                failures += 1
+                print(
+                    "Failed to render {}{}: {}".format(
+                        result["picture"],
+                        " ({})".format(result["variant"]) if result["variant"] else "",
+                        result["error"],
+                    )
+                )
+            elif archive:
+                output_path = Path(result["output"])
+                archive.add(
+                    "/".join(filter(None, (result["variant"], result["name"]))),
+                    output_path.read_bytes(),
+                )
+                output_path.unlink()
+    except (OSError, ValueError, csv.Error) as e:
+        print("{}. Exitting".format(e))
+        exit(1)
+    finally:
+        if archive:
+            archive.close()
+        if archive_dir:
+            archive_dir.cleanup()
+    exit(1 if failures else 0)
 
 
 def main():
@@ -242,6 +4334,11 @@ def main():
     parser.add_argument(
         "-I", "--pictures-dir", nargs="?", help="Path to directory of pictures to embed"
     )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="CSV or JSON lines (.jsonl) file of slides to render, with picture, id, comment, template and output fields, read as a stream",
+    )
     parser.add_argument("-n", "--id", help="ID of the new slide")
     parser.add_argument(
         "-t",
@@ -259,17 +4356,49 @@ def main():
         "-o",
         "--output",
         nargs="?",
-        help="Output file name (or file name --picture-dir is used). If omitted, result is printed. This cannot be used with --output-prefix.",
+        help="Output file name (or file name --picture-dir is used), .svg, .png, .tif, .jpg, .webp or .pdf; with --pictures-dir, a .pdf name writes all slides as the pages of one PDF. If omitted, result is printed. This cannot be used with --output-prefix.",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=SLIDES35_RASTER_FORMATS,
+        default="png",
+        help="Format of the slides of --pictures-dir or --manifest (default:png).",
+    )
+    parser.add_argument(
+        "--bit-depth",
+        type=int,
+        choices=(8, 16),
+        help="Bits per channel of raster slides, 16 for PNG and TIFF only (default: the converter's).",
+    )
+    parser.add_argument(
+        "--strip-alpha",
+        action="store_true",
+        help="Flatten raster slides on white, without an alpha channel, as JPEG slides always are.",
+    )
+    parser.add_argument(
+        "--compression",
+        type=int,
+        help="Compression effort of PNG, TIFF and lossless WebP slides, from 0 (fastest, largest) to 9 (slowest, smallest) (default: the converter's).",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        help="Quality of JPEG and WebP slides from 1 to 100; WebP slides are lossless without it.",
     )
     parser.add_argument(
         "-c",
         "--converter",
         nargs="?",
         default=SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER,
-        help="Executable to use to convert temporary SVG files to PNG (default:{}).".format(
+        help="Executable to use to convert temporary SVG files to PNG, or auto to pick an installed one (default:{}).".format(
             SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER
         ),
     )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="With --converter auto, time a render of the template with each installed converter and use the fastest one with a right output; with --plan, time the converters of the plan to estimate its duration (results are cached per host in --cache-dir)",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enabled verbose output."
     )
@@ -280,6 +4409,35 @@ def main():
         help="Output file name prefix, which will be suffixed with a 3-digits integer (using --identifier or not if --pictures-dir is used). This option cannot be used with --output.",
     )
     parser.add_argument("-d", "--output-dir", nargs="?", help="Output file directory")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        help="With --pictures-dir or --manifest, render every slide once per variant instead of once with the default settings, into the output directory subfolder named after the variant; comma-separated name, dpi, template, format (svg, png, tiff, jpeg or webp), converter and prefix values such as dpi=96,format=png. Can be repeated; pictures are discovered and SVGs built once for all variants",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="With --pictures-dir or --manifest, only read the picture headers and print the slides to render with their output names, the invalid pictures and an estimate of the cost of the run (with its duration if --calibrate is given), then exit with 1 if any picture is invalid",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="With --pictures-dir, keep running and render the slides of pictures as they are added, changed or removed, once they have not been written to for {} seconds".format(
+            SLIDES35_WATCH_DEBOUNCE
+        ),
+    )
+    parser.add_argument(
+        "--preview",
+        nargs="?",
+        const=SLIDES35_DEFAULT_PREVIEW_FILENAME,
+        help="With --pictures-dir or --manifest, only render {} DPI thumbnails of every slide into this .html or .png contact sheet in the output directory (default: {})".format(
+            SLIDES35_DEFAULT_PREVIEW_DPI, SLIDES35_DEFAULT_PREVIEW_FILENAME
+        ),
+    )
+    parser.add_argument(
+        "--output-archive",
+        help="With --pictures-dir or --manifest, write slides into this .zip (PNGs stored uncompressed) or .tar archive as they are rendered, instead of the output directory",
+    )
     parser.add_argument(
         "--dpi",
         nargs="?",
@@ -288,18 +4446,111 @@ def main():
             SLIDES35_DEFAULT_OUTPUT_DPI
         ),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of slides rendered in parallel with --pictures-dir (default: CPU count).",
+    )
+    parser.add_argument(
+        "--max-memory",
+        help="Memory budget of the PNG conversions with --pictures-dir or --manifest, like 8G: slides are scheduled so that their memory, estimated from the picture dimensions and --dpi, fits in it, and convert is limited to its share of it.",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Also look for pictures in the subdirectories of --pictures-dir.",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=SLIDES35_SORT_KEYS,
+        default="name",
+        help="Slides numbering order of --pictures-dir pictures: file name, modification time or EXIF capture date (default:name).",
+    )
+    parser.add_argument(
+        "--sheet",
+        help="Impose --pictures-dir slides on PNG print sheets of this size: one of {} or WIDTHxHEIGHT with a unit, like 100x150mm.".format(
+            ", ".join(SLIDES35_SHEET_SIZES)
+        ),
+    )
+    parser.add_argument(
+        "--bleed",
+        default=SLIDES35_DEFAULT_SHEET_BLEED,
+        help="Space around each slide of --sheet output, where crop marks are drawn (default:{}).".format(
+            SLIDES35_DEFAULT_SHEET_BLEED
+        ),
+    )
+    parser.add_argument(
+        "--embed",
+        action="store_true",
+        help="Embed the picture into SVG output as a base64 data URI instead of linking its path.",
+    )
+    parser.add_argument(
+        "--proxy",
+        action="store_true",
+        help="Embed pictures downscaled once to the size the template needs at --dpi, kept in --cache-dir (requires Pillow).",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print per-stage timings, slides per second and the slowest inputs at the end of the run.",
+    )
+    parser.add_argument(
+        "--stats-json",
+        help="Write the --stats report as JSON to this file.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep running as a daemon rendering the slides requested as JSON lines on the --socket Unix socket, with templates and converters kept warm between requests",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Unix socket of the --serve daemon; without --serve, have the daemon render the --picture slide instead of rendering it in this process",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=SLIDES35_DEFAULT_CACHE_DIR,
+        help="Directory of the PNG render cache and EXIF dates index (default:{}).".format(
+            SLIDES35_DEFAULT_CACHE_DIR
+        ),
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=SLIDES35_DEFAULT_CACHE_SIZE,
+        help="Size limit of the render cache, least recently used renders are evicted beyond it (default:{}).".format(
+            SLIDES35_DEFAULT_CACHE_SIZE
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always convert PNG slides, without reading nor filling the render cache.",
+    )
 
     args = parser.parse_args()
 
-    if not args.picture and not args.pictures_dir:
-        print("No --picture or --pictures-dir provided. Exitting")
+    inputs = [x for x in (args.picture, args.pictures_dir, args.manifest) if x]
+    if args.serve:
+        if not args.socket or inputs:
+            print(
+                "--serve requires --socket, without --picture, --pictures-dir or --manifest. Exitting"
+            )
+            exit(1)
+    elif not inputs:
+        print("No --picture, --pictures-dir or --manifest provided. Exitting")
+        exit(1)
+    elif args.socket and not args.picture:
+        print("--socket without --serve only renders a --picture slide. Exitting")
         exit(1)
 
-    if args.picture and args.pictures_dir:
-        print("Provide either --picture or --pictures-dir, not both. Exitting")
+    if len(inputs) > 1:
+        print("Provide only one of --picture, --pictures-dir and --manifest. Exitting")
         exit(1)
 
-    if not args.id and not args.pictures_dir:
+    if not args.id and args.picture:
         print(
             "No --id provided (while not in a --pictures-dir input files situation). Exitting"
         )
@@ -313,12 +4564,170 @@ def main():
         print("You cannot use --output (filename) and --stdout together")
         exit(1)
 
+    try:
+        _encoding_args(args)
+    except ValueError as e:
+        print("{}. Exitting".format(e))
+        exit(1)
+
+    if args.output_archive and (args.picture or args.sheet):
+        print("--output-archive cannot be used with --picture or --sheet. Exitting")
+        exit(1)
+    if args.plan and (
+        not (args.pictures_dir or args.manifest)
+        or args.sheet
+        or args.watch
+        or args.preview
+        or (args.output and args.output.lower().endswith(".pdf"))
+    ):
+        print(
+            "--plan can only be used with --pictures-dir or --manifest, without --sheet, --watch, --preview or a .pdf --output. Exitting"
+        )
+        exit(1)
+    if args.watch and (
+        not args.pictures_dir
+        or args.sheet
+        or args.output_archive
+        or args.preview
+        or (args.output and args.output.lower().endswith(".pdf"))
+    ):
+        print(
+            "--watch can only be used with --pictures-dir, without --sheet, --output-archive, --preview or a .pdf --output. Exitting"
+        )
+        exit(1)
+    if args.preview and (
+        args.picture or args.sheet or args.output_archive or args.variant
+    ):
+        print(
+            "--preview cannot be used with --picture, --sheet, --output-archive or --variant. Exitting"
+        )
+        exit(1)
+
     if args.output_dir:
         if not Path(args.output_dir).exists():
             os.makedirs(args.output_dir, exist_ok=True)
 
     output_dir = Path(args.output_dir if args.output_dir else ".")
 
+    stats = None
+    if args.stats or args.stats_json:
+        stats = StatsCollector()
+        add_profiling_hook(stats)
+
+    if args.proxy and Image is None:
+        print("--proxy requires the Pillow module. Exitting")
+        exit(1)
+    proxy_dir = Path(args.cache_dir) / "proxies" if args.proxy else None
+
+    try:
+        cache = (
+            RenderCache(args.cache_dir, args.cache_size) if not args.no_cache else None
+        )
+    except ValueError as e:
+        print("Invalid --cache-size: {}. Exitting".format(e))
+        exit(1)
+    try:
+        max_memory = parse_size(args.max_memory) if args.max_memory else None
+    except ValueError as e:
+        print("Invalid --max-memory: {}. Exitting".format(e))
+        exit(1)
+
+    if args.serve:
+        _register_stats_report(args, stats)
+        print("Serving slides on {}. Stop with Ctrl+C".format(args.socket))
+        try:
+            serve(
+                args.socket,
+                cache=cache,
+                proxy_dir=Path(args.cache_dir) / "proxies",
+                verbose=args.verbose,
+            )
+        except OSError as e:
+            print("{}. Exitting".format(e))
+            exit(1)
+        exit(0)
+
+    variants = None
+    if args.variant:
+        if (
+            not (args.pictures_dir or args.manifest)
+            or args.sheet
+            or (args.output and args.output.lower().endswith(".pdf"))
+        ):
+            print(
+                "--variant requires --pictures-dir or --manifest, without --sheet or a PDF --output. Exitting"
+            )
+            exit(1)
+        try:
+            variants = [parse_variant(spec) for spec in args.variant]
+        except ValueError as e:
+            print("{}. Exitting".format(e))
+            exit(1)
+        if len({variant["name"] for variant in variants}) < len(variants):
+            print("--variant names must be distinct. Exitting")
+            exit(1)
+        try:
+            for variant in variants:
+                _slide_encoding(
+                    variant.get("output_as", args.output_format), _encoding_args(args)
+                )
+        except ValueError as e:
+            print("{}. Exitting".format(e))
+            exit(1)
+
+    if args.converter == "auto":
+        try:
+            args.converter = select_converter(
+                args.template,
+                args.dpi if args.dpi else SLIDES35_DEFAULT_OUTPUT_DPI,
+                Path(args.cache_dir) / "converters.json",
+                calibrate=args.calibrate,
+                pdf_pages=bool(
+                    args.pictures_dir
+                    and args.output
+                    and args.output.lower().endswith(".pdf")
+                ),
+            )
+        except FileNotFoundError as e:
+            if (
+                args.picture
+                and SLIDES35_OUTPUT_SUFFIXES.get(
+                    Path(args.output or "").suffix.lower(), "svg"
+                )
+                == "svg"
+            ):
+                args.converter = SLIDES35_DEFAULT_SVG_TO_PNG_CONVERTER  # SVG output
+            else:
+                print("{}. Exitting".format(e))
+                exit(1)
+        if args.verbose:
+            print("Using converter {}".format(args.converter))
+
+    if args.manifest:
+        if args.stdout or args.sheet:
+            print("--manifest cannot be used with --stdout or --sheet. Exitting")
+            exit(1)
+        if not Path(args.manifest).is_file():
+            print("--manifest file {} does not exist. Exitting".format(args.manifest))
+            exit(1)
+        _check_batch_args(args)
+        _register_stats_report(args, stats)
+        if args.plan:
+            _run_plan(
+                args, read_manifest(args.manifest), output_dir, proxy_dir, variants
+            )
+        if args.preview:
+            _run_preview(args, read_manifest(args.manifest), output_dir)
+        _run_batch(
+            args,
+            read_manifest(args.manifest),
+            output_dir,
+            cache,
+            proxy_dir,
+            variants,
+            max_memory,
+        )
+
     if args.pictures_dir:
         if args.stdout:
             print("--pictures-dir cannot be used with --stdout. Exitting")
@@ -329,62 +4738,120 @@ def main():
                 "--pictures-dir directory {} does not exist. Exitting".format(pic_dir)
             )
             exit(1)
-        img_id = 1
+        _check_batch_args(args)
+        _register_stats_report(args, stats)
+        if args.watch:
+            _run_watch(args, output_dir, cache, proxy_dir, variants, max_memory)
 
-        for img in sorted(os.listdir(pic_dir)):
-            img_path = (Path(pic_dir) / Path(img)).resolve()
-            output_prefix = (
-                args.output_prefix
-                if args.output_prefix
-                else SLIDES35_DEFAULT_OUTPUT_PREFIX
+        pictures = [
+            path.resolve()
+            for path in discover_pictures(
+                pic_dir,
+                recursive=args.recursive,
+                sort=args.sort,
+                index_path=Path(args.cache_dir) / "exif-index.json",
+                verbose=args.verbose,
             )
-            do_slide(
+        ]
+        if args.plan:
+            _run_plan(args, pictures, output_dir, proxy_dir, variants)
+        if args.preview:
+            _run_preview(args, pictures, output_dir)
+        if args.output and args.output.lower().endswith(".pdf"):
+            results = do_pdf_deck(
                 template=args.template,
-                picture=img_path,
-                identifier=img_id,
-                output_dir=output_dir,
-                output_as="png",
-                output_prefix=output_prefix,
-                verbose=args.verbose,
+                pictures=pictures,
+                output_path=output_dir / args.output,
+                dpi=args.dpi,
                 converter=args.converter,
+                verbose=args.verbose,
+                proxy_dir=proxy_dir,
             )
-            img_id += 1
-        exit(0)
+        elif args.sheet:
+            try:
+                results = do_sheets(
+                    template=args.template,
+                    pictures=pictures,
+                    output_dir=output_dir,
+                    sheet=args.sheet,
+                    bleed=args.bleed,
+                    output_prefix=(
+                        args.output_prefix
+                        if args.output_prefix
+                        else SLIDES35_DEFAULT_SHEET_PREFIX
+                    ),
+                    dpi=args.dpi,
+                    converter=args.converter,
+                    verbose=args.verbose,
+                    proxy_dir=proxy_dir,
+                )
+            except ValueError as e:
+                print("{}. Exitting".format(e))
+                exit(1)
+        else:
+            _run_batch(
+                args, pictures, output_dir, cache, proxy_dir, variants, max_memory
+            )
+        failures = [(picture, error) for picture, _, error in results if error]
+        for picture, error in failures:
+            print("Failed to render {}: {}".format(picture, error))
+        exit(1 if failures else 0)
 
-    export_to_png = False
     output_filename = args.output
-    if args.output and output_filename.lower().endswith(".png"):
-        export_to_png = True
+    output_file_format = SLIDES35_OUTPUT_SUFFIXES.get(
+        Path(output_filename or "").suffix.lower(), "svg"
+    )
 
     picture = Path(args.picture).resolve()
 
-    if args.stdout:
-        if export_to_png:
-            print(
-                "The --stdout SVG-outputting option cannot be used with .png output (see the suffix of your --output argument)"
-            )
+    if args.stdout and output_file_format != "svg":
+        print(
+            "The --stdout SVG-outputting option cannot be used with raster or .pdf output (see the suffix of your --output argument)"
+        )
+        exit(1)
+    if output_file_format in SLIDES35_RASTER_FORMATS:
+        try:
+            _encoding_args(args).with_format(output_file_format)
+        except ValueError as e:
+            print("{}. Exitting".format(e))
             exit(1)
-        else:
-            do_slide(
-                template=args.template,
-                picture=picture,
-                stdout=True,
-                identifier=args.id,
-                verbose=args.verbose,
-            )
-    else:
-        output_file_format = "png" if export_to_png else "svg"
+    _register_stats_report(args, stats)
+
+    if args.socket:
+        _run_client(args, picture, output_filename, output_dir, output_file_format)
+
+    if args.stdout:
         do_slide(
             template=args.template,
             picture=picture,
+            stdout=True,
             identifier=args.id,
-            output_filename=output_filename,
-            output_dir=output_dir,
-            output_as=output_file_format,
-            dpi=args.dpi,
             verbose=args.verbose,
-            converter=args.converter,
+            proxy_dir=proxy_dir,
+            embed=args.embed,
         )
+    else:
+        try:
+            do_slide(
+                template=args.template,
+                picture=picture,
+                identifier=args.id,
+                output_filename=output_filename,
+                output_dir=output_dir,
+                output_as=output_file_format,
+                dpi=args.dpi,
+                verbose=args.verbose,
+                converter=args.converter,
+                cache=cache,
+                proxy_dir=proxy_dir,
+                embed=args.embed,
+                encoding=_encoding_args(args),
+            )
+        except (FileNotFoundError, ValueError) as e:
+            print("{}. Exitting".format(e))
+            exit(1)
+        if cache:
+            cache.evict()
 
 
 if __name__ == "__main__":
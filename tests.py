@@ -1,11 +1,23 @@
 # builtin modules
+import asyncio
+import base64
+import csv
+import io
+import itertools
+import json
 import os
 import os.path
 from pathlib import Path
+import re
 import shutil
+import signal
 import subprocess
+import tarfile
 import tempfile
+import time
 import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from xml.dom import minidom
 
 # third-party modules
@@ -15,9 +27,42 @@ import magic
 import pytest
 import imagesize
 
+import slides35
 from slides35 import (
+    CompiledTemplate,
     Slide,
+    compile_template,
     do_slide,
+    do_slides,
+    get_converter,
+    parse_size,
+    discover_pictures,
+    exif_datetime,
+    sheet_size_mm,
+    SheetLayout,
+    picture_proxy,
+    EmbeddedPicture,
+    add_profiling_hook,
+    remove_profiling_hook,
+    StatsCollector,
+    format_stats,
+    render_many_async,
+    render_batch,
+    read_manifest,
+    SlideArchive,
+    probe_converters,
+    select_converter,
+    parse_variant,
+    do_preview,
+    watch_slides,
+    picture_dimensions,
+    estimate_slide_memory,
+    picture_orientation,
+    inspect_picture,
+    plan_batch,
+    request_slide,
+    RasterEncoding,
+    RenderCache,
     SLIDES35_DEFAULT_SVG_TEMPLATE,
     SLIDES35_DEFAULT_OUTPUT_DPI,
     SLIDES35_SUPPORTED_CONVERTERS
@@ -344,3 +389,1322 @@ def test_do_slide_wrong_output_as_value():
     with pytest.raises(ValueError) as e:
         do_slide(DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 1, output_as="bad_extension")
     assert "output_as parameter must be" in e.value.args[0]
+
+
+def _make_pictures_dir(dirname, count, size=(30, 30)):
+    for n in range(count):
+        a = numpy.random.rand(size[1], size[0], 3) * 255
+        im_out = Image.fromarray(a.astype("uint8")).convert("RGB")
+        im_out.save(Path(dirname) / Path("out%03d.jpg" % n))
+    return [Path(dirname) / img for img in sorted(os.listdir(dirname))]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_do_slides_numbering_follows_pictures_order(jobs):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 5)
+        results = do_slides(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures,
+            output_dir=tmpdirname,
+            output_as="svg",
+            jobs=jobs,
+        )
+        assert [picture for picture, _, _ in results] == pictures
+        for n, (picture, output_path, error) in enumerate(results, start=1):
+            assert error is None
+            assert output_path == Path(tmpdirname) / "slide_{:03d}.svg".format(n)
+            with open(output_path) as f:
+                assert _normalize_xml(f.read()) == _normalize_xml(
+                    Slide(DEFAULT_SLIDE_TEMPLATE).id(n).picture(picture).svg()
+                )
+
+
+def test_do_slides_reports_failed_items():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 2)
+        pictures.insert(1, Path(tmpdirname) / DEFAULT_NON_EXISTING_PICTURE)
+        results = do_slides(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures,
+            output_dir=tmpdirname,
+            output_as="svg",
+            jobs=2,
+        )
+        errors = [error for _, _, error in results]
+        assert errors[0] is None and errors[2] is None
+        assert "FileNotFoundError" in errors[1]
+        assert results[1][1] is None
+        assert Path(results[2][1]).name == "slide_003.svg"
+
+
+def _minidom_slide_svg(template, picture, identifier):
+    rootElem = minidom.parse(template)
+    rootElem.getElementsByTagName("image")[0].attributes["xlink:href"].value = picture
+    rootElem.getElementsByTagName("text")[0].firstChild.firstChild.nodeValue = str(
+        identifier
+    ).center(3)
+    return rootElem.toxml()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_render_batch_streams_lazy_items(jobs):
+    consumed = []
+
+    def items(pictures):
+        for n, picture in enumerate(pictures):
+            consumed.append(picture)
+            yield picture, n * 10 + 5, "comment {}".format(n)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 200)
+        results = render_batch(
+            DEFAULT_SLIDE_TEMPLATE,
+            items(pictures),
+            output_dir=tmpdirname,
+            output_as="svg",
+            jobs=jobs,
+        )
+        first = next(results)
+        assert len(consumed) < len(pictures)  # only the batches in flight
+        results = [first] + list(results)
+        assert [result["picture"] for result in results] == pictures
+        assert [result["id"] for result in results] == list(range(5, 2000, 10))
+        assert results[1]["comment"] == "comment 1"
+        assert all(result["error"] is None for result in results)
+        assert Path(results[0]["output"]).name == "slide_005.svg"
+        assert Path(results[0]["output"]).is_file()
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl"])
+def test_read_manifest(suffix):
+    rows = [
+        dict(picture="a.jpg", id="12", comment="Hello, world"),
+        dict(picture="b.jpg", output="custom.svg", template="t.svg"),
+    ]
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        manifest = Path(tmpdirname) / ("manifest" + suffix)
+        with open(manifest, "w", newline="") as f:
+            if suffix == ".csv":
+                writer = csv.DictWriter(
+                    f, ["picture", "id", "comment", "template", "output"]
+                )
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                f.write("\n".join(json.dumps(row) for row in rows) + "\n\n")
+        items = read_manifest(manifest)
+        assert not isinstance(items, list)
+        assert list(items) == [
+            dict(picture=str(Path(tmpdirname) / "a.jpg"), id="12", comment="Hello, world"),
+            dict(
+                picture=str(Path(tmpdirname) / "b.jpg"),
+                template=str(Path(tmpdirname) / "t.svg"),
+                output="custom.svg",
+            ),
+        ]
+        invalid = Path(tmpdirname) / "invalid.csv"
+        invalid.write_text("picture,id\n,3\n")
+        assert list(read_manifest(invalid)) == [dict(id="3")]
+
+
+def test_render_batch_checks_arguments_on_call():
+    consumed = []
+
+    def items():
+        consumed.append(DEFAULT_PICTURE)
+        yield DEFAULT_PICTURE
+
+    with pytest.raises(ValueError):
+        render_batch(DEFAULT_SLIDE_TEMPLATE, items(), output_as="gif")
+    with pytest.raises(FileNotFoundError):
+        render_batch("no-such-template.svg", items())
+    assert consumed == []
+
+
+def test_render_batch_reuses_compiled_template(monkeypatch):
+    template_checks = []
+    exists = Path.exists
+
+    def counting_exists(path, *args, **kwargs):
+        if Path(path).name == Path(DEFAULT_SLIDE_TEMPLATE).name:
+            template_checks.append(path)
+        return exists(path, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 5)
+        monkeypatch.setattr(Path, "exists", counting_exists)
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures,
+                output_dir=tmpdirname,
+                output_as="svg",
+                jobs=1,
+            )
+        )
+    assert all(result["error"] is None for result in results)
+    assert template_checks == []
+
+
+def test_render_batch_manifest_row_without_picture():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 2)
+        manifest = Path(tmpdirname) / "manifest.csv"
+        manifest.write_text(
+            "picture,comment\n{},first\n,no picture\n{},third\n".format(
+                pictures[0].name, pictures[1].name
+            )
+        )
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                read_manifest(manifest),
+                output_dir=tmpdirname,
+                output_as="svg",
+            )
+        )
+        assert [result["id"] for result in results] == [1, 2, 3]
+        assert results[1]["error"].endswith("Slide 2 has no picture")
+        assert results[1]["comment"] == "no picture"
+        assert results[0]["error"] is None and results[2]["error"] is None
+        assert Path(results[2]["output"]).name == "slide_003.svg"
+
+
+def test_command_manifest():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 2)
+        manifest = Path(tmpdirname) / "manifest.jsonl"
+        manifest.write_text(
+            json.dumps(dict(picture=pictures[0].name, id=12, comment="Hello")) + "\n"
+            + json.dumps(dict(picture=pictures[1].name, output="custom.svg")) + "\n"
+        )
+        output_dir = Path(tmpdirname) / "out"
+        result = subprocess.run(
+            ["python", EXECUTABLE_UNDER_TEST, "--manifest", str(manifest), "-d", str(output_dir), "--no-cache"]
+        )
+        assert result.returncode == 0
+        assert sorted(os.listdir(output_dir)) == ["custom.svg", "slide_012.png"]
+
+
+@pytest.mark.parametrize("suffix", [".zip", ".tar"])
+def test_slide_archive(suffix):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname) / ("deck" + suffix)
+        with SlideArchive(path) as archive:
+            archive.add("slide_001.png", b"\x89PNG" * 100)
+            archive.add("slide_002.svg", b"<svg/>" * 100)
+        if suffix == ".zip":
+            with zipfile.ZipFile(path) as z:
+                assert z.namelist() == ["slide_001.png", "slide_002.svg"]
+                assert z.getinfo("slide_001.png").compress_type == zipfile.ZIP_STORED
+                assert z.getinfo("slide_002.svg").compress_type == zipfile.ZIP_DEFLATED
+                assert z.read("slide_002.svg") == b"<svg/>" * 100
+        else:
+            with tarfile.open(path) as tar:
+                assert tar.getnames() == ["slide_001.png", "slide_002.svg"]
+                assert tar.extractfile("slide_001.png").read() == b"\x89PNG" * 100
+        with pytest.raises(ValueError):
+            SlideArchive(Path(tmpdirname) / "deck.rar")
+
+
+def test_command_output_archive():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        _make_pictures_dir(pictures_dir, 3)
+        archive = Path(tmpdirname) / "deck.zip"
+        result = subprocess.run(
+            ["python", EXECUTABLE_UNDER_TEST, "--pictures-dir", str(pictures_dir), "--output-archive", str(archive), "--no-cache"]
+        )
+        assert result.returncode == 0
+        with zipfile.ZipFile(archive) as z:
+            assert z.namelist() == ["slide_001.png", "slide_002.png", "slide_003.png"]
+            assert z.read("slide_001.png").startswith(b"\x89PNG")
+
+
+def test_command_output_archive_uses_cache():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        _make_pictures_dir(pictures_dir, 3)
+        cache_dir = Path(tmpdirname) / "cache"
+        for n in range(2):
+            archive = Path(tmpdirname) / "deck{}.tar".format(n)
+            result = subprocess.run(
+                [
+                    "python",
+                    EXECUTABLE_UNDER_TEST,
+                    "--pictures-dir",
+                    str(pictures_dir),
+                    "--output-archive",
+                    str(archive),
+                    "--cache-dir",
+                    str(cache_dir),
+                ]
+            )
+            assert result.returncode == 0
+        assert len(list(cache_dir.glob("*/*.png"))) == 3
+        with tarfile.open(Path(tmpdirname) / "deck0.tar") as first, tarfile.open(
+            archive
+        ) as second:
+            assert first.getnames() == second.getnames() == [
+                "slide_001.png",
+                "slide_002.png",
+                "slide_003.png",
+            ]
+            for name in first.getnames():
+                assert (
+                    first.extractfile(name).read() == second.extractfile(name).read()
+                )
+
+
+
+
+@pytest.mark.parametrize("inotify", [True, False])
+def test_watch_slides(inotify):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        pictures = _make_pictures_dir(pictures_dir, 2)
+        slides = watch_slides(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures_dir,
+            output_dir=tmpdirname,
+            output_as="svg",
+            debounce=0,
+            poll_interval=0.1,
+            inotify=inotify,
+        )
+        assert [(r["id"], r["picture"]) for r in itertools.islice(slides, 2)] == [
+            (1, pictures[0]),
+            (2, pictures[1]),
+        ]
+        # sorted between both pictures: only the second slide and a new third one are rendered
+        shutil.copy(pictures[0], Path(tmpdirname) / "new.tmp")
+        os.replace(Path(tmpdirname) / "new.tmp", pictures_dir / "out000b.jpg")
+        assert [(r["id"], r["picture"].name) for r in itertools.islice(slides, 2)] == [
+            (2, "out000b.jpg"),
+            (3, "out001.jpg"),
+        ]
+        os.remove(pictures[0])
+        assert [r["id"] for r in itertools.islice(slides, 2)] == [1, 2]
+        slides.close()
+        assert sorted(f for f in os.listdir(tmpdirname) if f.endswith(".svg")) == [
+            "slide_001.svg",
+            "slide_002.svg",
+        ]
+
+def test_watch_slides_changed_picture_keeps_its_slot():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        pictures = _make_pictures_dir(pictures_dir, 6)
+        for picture in pictures:
+            os.utime(picture, (time.time() - 60,) * 2)
+        slides = watch_slides(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures_dir,
+            output_dir=tmpdirname,
+            output_as="svg",
+            debounce=0.5,
+            poll_interval=0.1,
+        )
+        assert [r["id"] for r in itertools.islice(slides, 6)] == [1, 2, 3, 4, 5, 6]
+        # while the third picture settles, no slide is renumbered nor removed
+        shutil.copy(pictures[0], pictures[2])
+        assert [(r["id"], r["picture"]) for r in itertools.islice(slides, 1)] == [
+            (3, pictures[2])
+        ]
+        slides.close()
+        assert len([f for f in os.listdir(tmpdirname) if f.endswith(".svg")]) == 6
+
+
+@pytest.mark.parametrize("sheet", ["preview.html", "preview.png"])
+def test_command_preview(sheet):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        _make_pictures_dir(pictures_dir, 3)
+        result = subprocess.run(
+            ["python", EXECUTABLE_UNDER_TEST, "--pictures-dir", str(pictures_dir), "--output-dir", tmpdirname, "--preview", sheet],
+            capture_output=True,
+        )
+        assert result.returncode == 0
+        assert sorted(os.listdir(tmpdirname)) == sorted([sheet, "pictures"])
+        if sheet.endswith(".html"):
+            html = (Path(tmpdirname) / sheet).read_text()
+            assert html.count("data:image/png;base64,") == 3
+            assert "3 - " in html
+        else:
+            assert magic.Magic(mime=True).from_file(str(Path(tmpdirname) / sheet)) == "image/png"
+
+
+def test_do_preview_invalid_sheet():
+    with pytest.raises(ValueError):
+        do_preview(DEFAULT_SLIDE_TEMPLATE, [DEFAULT_PICTURE], "preview.pdf")
+
+
+def test_serve():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        socket_path = Path(tmpdirname) / "slides35.sock"
+        daemon = subprocess.Popen(
+            ["python", EXECUTABLE_UNDER_TEST, "--serve", "--socket", str(socket_path), "--no-cache"],
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            for _ in range(100):
+                if socket_path.exists():
+                    break
+                time.sleep(0.05)
+            assert socket_path.stat().st_mode & 0o777 == 0o600
+            picture = str(Path(DEFAULT_PICTURE).resolve())
+            response = request_slide(
+                socket_path,
+                dict(picture=picture, id=4, output_dir=tmpdirname, output="4.svg", tag="x"),
+            )
+            assert response["output"] == str(Path(tmpdirname) / "4.svg")
+            assert response["tag"] == "x"
+            assert "error" in request_slide(socket_path, dict(picture=picture))
+            result = subprocess.run(
+                ["python", EXECUTABLE_UNDER_TEST, "--socket", str(socket_path), "--picture", DEFAULT_PICTURE, "--id", "5", "--stdout"],
+                capture_output=True,
+            )
+            assert result.returncode == 0
+            assert _normalize_xml(result.stdout.decode("utf-8")) == _normalize_xml(
+                Slide(DEFAULT_SLIDE_TEMPLATE).id(5).picture(DEFAULT_PICTURE).svg()
+            )
+        finally:
+            daemon.send_signal(signal.SIGTERM)
+            assert daemon.wait(timeout=10) == 0
+        assert not socket_path.exists()
+
+def test_pdf_commands():
+    assert get_converter("rsvg-convert").pdf_command(["0.svg", "1.svg"], "deck.pdf", 300)[-3:] == [
+        "--format=pdf",
+        "0.svg",
+        "1.svg",
+    ]
+    assert get_converter("convert").pdf_command([], None, 300)[-2:] == ["svg:-", "pdf:-"]
+    with pytest.raises(ValueError):
+        get_converter("inkscape").pdf_command(["0.svg", "1.svg"], "deck.pdf", 300)
+
+
+@pytest.mark.parametrize("converter", ["rsvg-convert", "convert"])
+def test_command_pdf_deck(converter):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        _make_pictures_dir(pictures_dir, 3)
+        result = subprocess.run(
+            ["python", EXECUTABLE_UNDER_TEST, "--pictures-dir", str(pictures_dir), "--output", "deck.pdf", "--output-dir", tmpdirname, "--converter", converter, "--dpi", "100"]
+        )
+        assert result.returncode == 0
+        assert sorted(os.listdir(tmpdirname)) == ["deck.pdf", "pictures"]
+        pdf = (Path(tmpdirname) / "deck.pdf").read_bytes()
+        assert magic.Magic(mime=True).from_buffer(pdf) == "application/pdf"
+        assert len(re.findall(rb"/Type\s*/Page\b", pdf)) == 3
+
+
+def test_probe_converters_cached(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache_path = Path(tmpdirname) / "converters.json"
+        converters = probe_converters(cache_path)
+        assert tuple(converters) == SLIDES35_SUPPORTED_CONVERTERS
+        assert set(converters["rsvg-convert"]["features"]) == {"stdin", "batches", "pdf", "pdf_pages"}
+        assert converters["inkscape"]["features"]["pdf_pages"] is False
+        assert len(json.loads(cache_path.read_text())) == 1  # this host
+
+        def no_probe(*args, **kwargs):
+            raise AssertionError("converters probed again")
+
+        monkeypatch.setattr(slides35, "get_converter", no_probe)
+        assert probe_converters(cache_path) == converters
+
+
+def test_select_converter_without_converters(monkeypatch):
+    monkeypatch.setenv("PATH", "")
+    with pytest.raises(FileNotFoundError):
+        select_converter(DEFAULT_SLIDE_TEMPLATE)
+
+
+def test_select_converter_pillow_needs_rsvg(monkeypatch):
+    # pillow over convert or inkscape layers is not picked automatically
+    monkeypatch.setattr(
+        slides35.RsvgConverter, "available", classmethod(lambda cls: False)
+    )
+    monkeypatch.setattr(
+        slides35.ImageMagickConverter, "available", classmethod(lambda cls: True)
+    )
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache_path = Path(tmpdirname) / "converters.json"
+        assert probe_converters(cache_path)["pillow"]["available"]
+        assert select_converter(DEFAULT_SLIDE_TEMPLATE, 100, cache_path) == "convert"
+
+
+def test_select_converter_calibrate():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache_path = Path(tmpdirname) / "converters.json"
+        converter = select_converter(DEFAULT_SLIDE_TEMPLATE, 100, cache_path, calibrate=True)
+        assert converter in SLIDES35_SUPPORTED_CONVERTERS
+        converters = probe_converters(cache_path, DEFAULT_SLIDE_TEMPLATE, 100, calibrate=True)
+        assert converters[converter]["seconds"] == min(
+            info["seconds"]
+            for name, info in converters.items()
+            if info["seconds"] is not None
+            and (name != "pillow" or converters["rsvg-convert"]["available"])
+        )
+        assert select_converter(DEFAULT_SLIDE_TEMPLATE, 100, cache_path, pdf_pages=True) != "inkscape"
+
+
+@pytest.mark.parametrize(
+    "spec,expected",
+    [
+        ("dpi=96,format=png", dict(name="96dpi_png", dpi="96", output_as="png")),
+        ("name=web, dpi=96", dict(name="web", dpi="96")),
+        ("template=templates/other.svg", dict(name="other", template="templates/other.svg")),
+    ],
+)
+def test_parse_variant(spec, expected):
+    assert parse_variant(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["dpi", "dpi=0", "format=gif", "converter=gimp", "size=3", "name=a/b"])
+def test_parse_variant_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_variant(spec)
+
+
+def test_render_batch_variants():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 3)
+        output_dir = Path(tmpdirname) / "out"
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures,
+                output_dir=output_dir,
+                output_as="svg",
+                variants=[parse_variant("name=a"), parse_variant("name=b,prefix=b_")],
+            )
+        )
+        assert [(result["id"], result["variant"]) for result in results] == [
+            (1, "a"), (1, "b"), (2, "a"), (2, "b"), (3, "a"), (3, "b")
+        ]
+        assert all(result["error"] is None for result in results)
+        assert sorted(os.listdir(output_dir / "a")) == ["slide_001.svg", "slide_002.svg", "slide_003.svg"]
+        assert sorted(os.listdir(output_dir / "b")) == ["b_001.svg", "b_002.svg", "b_003.svg"]
+
+
+@pytest.mark.parametrize("output_dir", ["out", None])
+def test_render_batch_embed(output_dir):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 1)
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures,
+                output_dir=output_dir and Path(tmpdirname) / output_dir,
+                variants=[parse_variant("format=svg")],
+                embed=True,
+            )
+        )
+        svg = results[0]["output"]
+        if output_dir:
+            svg = Path(svg).read_bytes()
+        assert _normalize_xml(svg) == _normalize_xml(
+            Slide(DEFAULT_SLIDE_TEMPLATE).id(1).picture(pictures[0]).embed(True).svg()
+        )
+
+
+def test_render_batch_bytes_output():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 2)
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures + [DEFAULT_NON_EXISTING_PICTURE],
+                output_dir=None,
+                output_as="svg",
+            )
+        )
+        assert os.listdir(tmpdirname) == sorted(p.name for p in pictures)
+        assert _normalize_xml(results[1]["output"]) == _normalize_xml(
+            Slide(DEFAULT_SLIDE_TEMPLATE).id(2).picture(pictures[1]).svg()
+        )
+    assert results[2]["output"] is None
+    assert "FileNotFoundError" in results[2]["error"]
+    assert all(result["seconds"] >= 0 for result in results)
+
+
+
+@pytest.mark.parametrize("extension", ["jpg", "png", "gif", "bmp", "tif", "webp"])
+def test_picture_dimensions(extension):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname) / ("picture." + extension)
+        Image.new("RGB", (457, 123), "red").save(path)
+        assert picture_dimensions(path) == (457, 123)
+    assert picture_dimensions("README.md") is None
+
+
+
+@pytest.mark.parametrize("extension", ["jpg", "tif"])
+def test_picture_orientation(extension):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname) / ("picture." + extension)
+        Image.new("RGB", (40, 30)).save(path)
+        assert picture_orientation(path) == 1
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new("RGB", (40, 30)).save(path, exif=exif)
+        assert picture_orientation(path) == 6
+
+
+def test_inspect_picture_invalid():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        truncated = Path(tmpdirname) / "truncated.jpg"
+        Image.new("RGB", (40, 30)).save(truncated)
+        truncated.write_bytes(truncated.read_bytes()[:20])
+        with pytest.raises(ValueError):
+            inspect_picture(truncated)
+        with pytest.raises(ValueError):
+            inspect_picture("README.md")
+    with pytest.raises(FileNotFoundError):
+        inspect_picture(DEFAULT_NON_EXISTING_PICTURE)
+    assert inspect_picture(DEFAULT_PICTURE) == dict(
+        format="png", width=3600, height=2400, orientation=1
+    )
+
+
+def test_render_batch_picture_headers():
+    # only truncated headers fail early, other formats are left to converters
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        ppm = Path(tmpdirname) / "picture.ppm"
+        Image.new("RGB", (40, 30)).save(ppm)
+        truncated = Path(tmpdirname) / "truncated.jpg"
+        Image.new("RGB", (40, 30)).save(truncated)
+        truncated.write_bytes(truncated.read_bytes()[:20])
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                [ppm, truncated],
+                output_dir=tmpdirname,
+                output_as="svg",
+            )
+        )
+        assert results[0]["error"] is None
+        assert "truncated" in results[1]["error"]
+
+
+def test_plan_batch():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 2)
+        plan = plan_batch(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures + [DEFAULT_NON_EXISTING_PICTURE],
+            output_dir=tmpdirname,
+            variants=[parse_variant("dpi=100"), parse_variant("format=svg")],
+        )
+        assert sorted(os.listdir(tmpdirname)) == sorted(p.name for p in pictures)
+    assert [(slide["id"], slide["variant"]) for slide in plan] == [
+        (n, variant) for n in (1, 2, 3) for variant in ("100dpi", "svg")
+    ]
+    assert plan[0]["output"] == Path(tmpdirname) / "100dpi" / "slide_001.png"
+    assert (plan[0]["width"], plan[0]["height"], plan[0]["format"]) == (30, 30, "jpeg")
+    assert plan[0]["memory"] > 0 and plan[0]["pixels"] == 142 * 94
+    assert plan[1]["converter"] is None and plan[1]["memory"] == 0
+    assert [slide["error"] is not None for slide in plan] == [False] * 4 + [True] * 2
+
+
+def test_command_plan():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures_dir = Path(tmpdirname) / "pictures"
+        pictures_dir.mkdir()
+        pictures = _make_pictures_dir(pictures_dir, 3)
+        pictures[1].write_bytes(pictures[1].read_bytes()[:20])
+        result = subprocess.run(
+            ["python", EXECUTABLE_UNDER_TEST, "--pictures-dir", str(pictures_dir), "--output-dir", tmpdirname, "--plan"],
+            capture_output=True,
+        )
+        assert result.returncode == 1
+        assert sorted(os.listdir(tmpdirname)) == ["pictures"]
+        assert b"slide_003.png" in result.stdout
+        assert b"1 invalid pictures" in result.stdout
+        assert b"2 slides to render" in result.stdout
+
+def test_estimate_slide_memory():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        small = Path(tmpdirname) / "small.jpg"
+        large = Path(tmpdirname) / "large.jpg"
+        Image.new("RGB", (300, 200)).save(small)
+        Image.new("RGB", (6000, 4000)).save(large)
+        estimate = estimate_slide_memory(DEFAULT_SLIDE_TEMPLATE, small, 300, "convert")
+        assert estimate < estimate_slide_memory(DEFAULT_SLIDE_TEMPLATE, small, 600, "convert")
+        assert estimate < estimate_slide_memory(DEFAULT_SLIDE_TEMPLATE, large, 300, "convert")
+        assert estimate_slide_memory(
+            DEFAULT_SLIDE_TEMPLATE, large, 300, "convert", proxy=True
+        ) < estimate_slide_memory(DEFAULT_SLIDE_TEMPLATE, large, 300, "convert")
+
+
+def test_convert_memory_limit():
+    assert "-limit" not in get_converter("convert").command(None, 300)
+    command = get_converter("convert", memory_limit=1 << 30).command(None, 300)
+    assert command[:5] == ["convert", "-limit", "memory", str(1 << 30), "-limit"]
+    assert get_converter("pillow", memory_limit=1 << 30).memory_limit == 1 << 30
+
+
+def test_render_batch_max_memory():
+    # a budget below any slide renders batches one at a time, still in order
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 6)
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures,
+                output_dir=tmpdirname,
+                dpi=100,
+                jobs=3,
+                max_memory=1,
+            )
+        )
+        assert [result["error"] for result in results] == [None] * 6
+        assert [result["name"] for result in results] == [
+            "slide_{:03d}.png".format(n) for n in range(1, 7)
+        ]
+
+@pytest.mark.parametrize("identifier", [1, 42, 999, "A&<b>"])
+def test_compiled_template_matches_minidom_output(identifier):
+    picture = str(Path(DEFAULT_PICTURE).resolve())
+    assert CompiledTemplate(DEFAULT_SLIDE_TEMPLATE).render(
+        picture, identifier
+    ).decode("utf-8") == _minidom_slide_svg(DEFAULT_SLIDE_TEMPLATE, picture, identifier)
+
+
+def test_compile_template_cache_follows_mtime():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        template = Path(tmpdirname) / "template.svg"
+        shutil.copyfile(DEFAULT_SLIDE_TEMPLATE, template)
+        compiled = compile_template(template)
+        assert compile_template(str(template)) is compiled
+        st = template.stat()
+        os.utime(template, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert compile_template(template) is not compiled
+
+
+def test_get_converter_unsupported():
+    with pytest.raises(ValueError):
+        get_converter("someUnsupportedConverter")
+
+
+@pytest.mark.parametrize("converter", SLIDES35_SUPPORTED_CONVERTERS)
+def test_do_slides_png_batch(converter):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 3)
+        results = do_slides(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures,
+            output_dir=tmpdirname,
+            converter=converter,
+            dpi=100,
+            jobs=1,
+        )
+        for picture, output_path, error in results:
+            assert error is None
+            assert magic.Magic(mime=True).from_file(str(output_path)).endswith("png")
+
+
+@pytest.mark.parametrize("converter", SLIDES35_SUPPORTED_CONVERTERS)
+def test_png_bytes_output(converter):
+    png = (
+        Slide(DEFAULT_SLIDE_TEMPLATE, converter=converter)
+        .id(1)
+        .picture(DEFAULT_PICTURE)
+        .png(dpi=100)
+    )
+    assert isinstance(png, bytes)
+    assert magic.Magic(mime=True).from_buffer(png).endswith("png")
+
+
+@pytest.mark.parametrize("converter", SLIDES35_SUPPORTED_CONVERTERS)
+def test_png_async_matches_png(converter):
+    s = Slide(DEFAULT_SLIDE_TEMPLATE, converter=converter).id(1).picture(DEFAULT_PICTURE)
+    png = asyncio.run(s.png_async(dpi=100))
+    assert magic.Magic(mime=True).from_buffer(png).endswith("png")
+    with Image.open(io.BytesIO(png)) as image, Image.open(io.BytesIO(s.png(dpi=100))) as expected:
+        assert image.size == expected.size
+
+
+def test_render_many_async():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 4)
+        slides = [
+            Slide(DEFAULT_SLIDE_TEMPLATE).id(n + 1).picture(picture)
+            for n, picture in enumerate(pictures)
+        ]
+        outputs = [Path(tmpdirname) / "{}.png".format(n) for n in range(len(slides))]
+        results = asyncio.run(
+            render_many_async(
+                list(zip(slides, outputs)) + [Slide(DEFAULT_SLIDE_TEMPLATE)],
+                concurrency=2,
+                dpi=100,
+                return_exceptions=True,
+            )
+        )
+        assert results[:4] == slides
+        assert all(output.is_file() for output in outputs)
+        assert isinstance(results[4], ValueError)  # no id nor picture
+
+
+def test_png_missing_converter_raises(monkeypatch):
+    monkeypatch.setenv("PATH", "")
+    s = Slide(DEFAULT_SLIDE_TEMPLATE).id(1).picture(DEFAULT_PICTURE)
+    with pytest.raises(FileNotFoundError):
+        s.png()
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(s.png_async())
+
+
+@pytest.mark.parametrize(
+    "size,expected", [(512, 512), ("800K", 800 * 1024), ("1.5G", 3 << 29), ("2TB", 2 << 40)]
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("many")
+
+
+def test_render_cache_key():
+    cache = RenderCache(tempfile.gettempdir())
+    converter = get_converter("convert")
+    key = cache.key(DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 1, 500, converter)
+    assert key == cache.key(DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 1, 500, converter)
+    assert key != cache.key(DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 2, 500, converter)
+    assert key != cache.key(DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 1, 400, converter)
+    assert key != cache.key(
+        DEFAULT_SLIDE_TEMPLATE, DEFAULT_PICTURE, 1, 500, get_converter("inkscape")
+    )
+
+
+def test_render_cache_get_put_evict():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache = RenderCache(Path(tmpdirname) / "cache", max_size=250)
+        output_path = Path(tmpdirname) / "slide.png"
+        assert not cache.get("a" * 64, output_path)
+        for n, key in enumerate(("a" * 64, "b" * 64, "c" * 64)):
+            output_path.write_bytes(bytes([n]) * 100)
+            cache.put(key, output_path)
+            os.utime(cache._entry(key), (n, n))
+        assert cache.get("a" * 64, output_path)  # refreshes "a" as most recently used
+        assert output_path.read_bytes() == bytes([0]) * 100
+        cache.evict()
+        assert cache._entry("a" * 64).exists()
+        assert not cache._entry("b" * 64).exists()
+        assert cache._entry("c" * 64).exists()
+
+
+def test_render_cache_concurrent_put():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache = RenderCache(Path(tmpdirname) / "cache")
+        output_path = Path(tmpdirname) / "slide.png"
+        output_path.write_bytes(os.urandom(4 * 1024 * 1024))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: cache.put("a" * 64, output_path), range(8)))
+        assert cache._entry("a" * 64).read_bytes() == output_path.read_bytes()
+        assert os.listdir(cache._entry("a" * 64).parent) == ["a" * 64 + ".png"]
+
+
+def test_render_cache_evicted_once_per_run():
+    evictions = []
+
+    class CountingCache(RenderCache):
+        def evict(self):
+            evictions.append(1)
+            super().evict()
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 3)
+        cache = CountingCache(Path(tmpdirname) / "cache")
+        results = list(
+            render_batch(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures,
+                output_dir=tmpdirname,
+                dpi=100,
+                jobs=1,
+                cache=cache,
+            )
+        )
+        assert [result["error"] for result in results] == [None] * 3
+        assert len(evictions) == 1
+        # single slides leave eviction to their caller
+        do_slide(
+            DEFAULT_SLIDE_TEMPLATE,
+            pictures[0],
+            1,
+            output_dir=tmpdirname,
+            output_as="png",
+            dpi=100,
+            cache=cache,
+        )
+        assert len(evictions) == 1
+
+
+def _save_picture_with_exif_date(path, date):
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0x9003] = date
+    Image.new("RGB", (8, 8)).save(path, exif=exif)
+
+
+def test_discover_pictures_filters_non_pictures():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        pictures = _make_pictures_dir(tmpdirname, 3)
+        Path(tmpdirname, ".DS_Store").write_bytes(b"\x00\x00\x00\x01Bud1")
+        Path(tmpdirname, "out000.xmp").write_text("<x:xmpmeta/>")
+        Path(tmpdirname, "fake.jpg").write_text("not a JPEG")
+        os.mkdir(Path(tmpdirname, "sub"))
+        sub_picture = Path(tmpdirname, "sub", "a.png")
+        Image.new("RGB", (8, 8)).save(sub_picture)
+        assert discover_pictures(tmpdirname) == pictures
+        assert discover_pictures(tmpdirname, recursive=True) == pictures + [
+            sub_picture
+        ]
+        # a symlink loop is not followed
+        os.symlink(tmpdirname, Path(tmpdirname, "sub", "loop"))
+        assert discover_pictures(tmpdirname, recursive=True) == pictures + [
+            sub_picture
+        ]
+        with slides35.PicturesWatcher(tmpdirname, True, 0.1) as watcher:
+            assert len(watcher._watches) in (0, 2)  # 0 when polling
+
+
+def test_discover_pictures_sort_keys():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        dates = ["2021:05:01 10:00:00", "2019:01:01 08:00:00", "2020:12:24 20:00:00"]
+        pictures = [Path(tmpdirname, "{}.jpg".format(name)) for name in "abc"]
+        for n, (picture, date) in enumerate(zip(pictures, dates)):
+            _save_picture_with_exif_date(picture, date)
+            os.utime(picture, (1000 - n, 1000 - n))
+            assert exif_datetime(picture) == date
+        assert discover_pictures(tmpdirname, sort="name") == pictures
+        assert discover_pictures(tmpdirname, sort="mtime") == pictures[::-1]
+        index_path = Path(tmpdirname) / "index" / "exif.json"
+        for _ in range(2):  # second run reads dates from the index
+            assert discover_pictures(
+                tmpdirname, sort="exif", index_path=index_path
+            ) == [pictures[1], pictures[2], pictures[0]]
+        assert index_path.exists()
+
+
+@pytest.mark.parametrize(
+    "sheet,expected",
+    [("A4", (210, 297)), ("a4", (210, 297)), ("100x150mm", (100, 150)), ("4x6in", (101.6, 152.4))],
+)
+def test_sheet_size_mm(sheet, expected):
+    assert sheet_size_mm(sheet) == pytest.approx(expected)
+
+
+def test_sheet_layout_impose():
+    compiled = compile_template(DEFAULT_SLIDE_TEMPLATE)
+    assert compiled.size_mm == pytest.approx((36, 24))
+    layout = SheetLayout(compiled.size_mm, "A4", bleed="2mm")
+    assert layout.slides_per_sheet == 36
+    slide_svgs = [
+        compiled.render(Path(DEFAULT_PICTURE).resolve(), n, nested=True)
+        for n in range(1, 41)
+    ]
+    sheets = list(layout.sheets(slide_svgs))
+    assert len(sheets) == 2
+    for sheet, count in zip(sheets, (36, 4)):
+        root = minidom.parseString(sheet).documentElement
+        assert root.getAttribute("width") == "210mm"
+        nested = [
+            svg for svg in root.getElementsByTagName("svg") if svg is not root
+        ]
+        assert len(nested) == count
+        assert nested[0].getAttribute("width") == "36"
+        assert len(root.getElementsByTagName("line")) == 8 * count
+
+
+def test_sheet_layout_too_small():
+    with pytest.raises(ValueError):
+        SheetLayout((36, 24), "30x30mm")
+
+
+def test_compiled_template_picture_size():
+    compiled = compile_template(DEFAULT_SLIDE_TEMPLATE)
+    assert compiled.picture_box_mm == pytest.approx((38.1, 25.4))
+    assert compiled.picture_size_px(500) == (751, 500)
+    assert compiled.picture_size_px(100) == (151, 100)
+
+
+def test_compiled_template_raster_geometry():
+    compiled = compile_template(DEFAULT_SLIDE_TEMPLATE)
+    assert compiled.view_box == pytest.approx((0, 0, 102.04724, 68.0315))
+    assert compiled.picture_rect == pytest.approx((-2.91, -1.92, 108, 72))
+    assert compiled.picture_aspect_ratio == "xMidYMid meet"
+    assert compiled.label["x"] == pytest.approx(47.58)
+    assert compiled.label["y"] == pytest.approx(60.36)
+    assert compiled.label["size"] == pytest.approx(4)
+    assert compiled.label["fill"] == "#ffffff"
+    assert compiled.label["bold"]
+
+
+@pytest.mark.parametrize("converter", ["convert", "rsvg-convert"])
+def test_pillow_converter_matches_svg_converters(converter):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        # a gradient, as resampling noise would differ between renderers
+        picture = Path(tmpdirname) / "gradient.png"
+        a = numpy.zeros((600, 700, 3), "uint8")
+        a[..., 0] = numpy.linspace(0, 255, 700)[None]
+        a[..., 1] = numpy.linspace(0, 255, 600)[:, None]
+        Image.fromarray(a).save(picture)
+        renders = [
+            Image.open(
+                io.BytesIO(
+                    Slide(DEFAULT_SLIDE_TEMPLATE, converter=name)
+                    .id(1)
+                    .picture(picture)
+                    .png(dpi=200)
+                )
+            ).convert("RGBA")
+            for name in (converter, "pillow")
+        ]
+    assert renders[0].size == renders[1].size
+    difference = numpy.abs(
+        numpy.asarray(renders[0], dtype=float) - numpy.asarray(renders[1], dtype=float)
+    )
+    # resampling and the number font differ slightly, placement must not
+    assert difference.mean() < 8
+
+
+def test_transparent_layer_commands():
+    convert = get_converter("convert")
+    convert.transparent = True
+    command = convert.command(None, 300)
+    assert command.index("none") < command.index("svg:-")
+    inkscape = get_converter("inkscape")
+    inkscape.transparent = True
+    assert "--export-background-opacity=0" in inkscape.command(None, 300)
+
+
+@pytest.mark.parametrize("layer_converter", ["rsvg-convert", "inkscape", "convert"])
+def test_pillow_converter_layer_converters(layer_converter, monkeypatch):
+    # the layer above the picture must not cover it, whatever renders it
+    monkeypatch.setattr(
+        slides35.PillowConverter, "layer_converters", (layer_converter,)
+    )
+    slides35._template_layers.cache_clear()
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        picture = Path(tmpdirname) / "red.png"
+        Image.new("RGB", (300, 200), (255, 0, 0)).save(picture)
+        png = (
+            Slide(DEFAULT_SLIDE_TEMPLATE, converter="pillow")
+            .id(1)
+            .picture(picture)
+            .png(dpi=100)
+        )
+    slides35._template_layers.cache_clear()
+    with Image.open(io.BytesIO(png)) as image:
+        x, y = image.width // 4, image.height // 2
+        assert image.convert("RGB").getpixel((x, y)) == (255, 0, 0)
+
+
+def test_picture_proxy():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        picture = _make_pictures_dir(tmpdirname, 1, size=(3000, 2000))[0]
+        proxy_dir = Path(tmpdirname) / "proxies"
+        proxy = picture_proxy(picture, (751, 500), proxy_dir)
+        assert proxy.parent == proxy_dir
+        with Image.open(proxy) as image:
+            assert image.size == (751, 501)  # covers the box, keeping the ratio
+        mtime = proxy.stat().st_mtime_ns
+        assert picture_proxy(picture, (751, 500), proxy_dir) == proxy
+        assert proxy.stat().st_mtime_ns == mtime
+        assert picture_proxy(picture, (3000, 3000), proxy_dir) == picture
+
+
+def test_picture_proxy_cmyk_and_exif_orientation():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        proxy_dir = Path(tmpdirname) / "proxies"
+        cmyk = Path(tmpdirname) / "cmyk.jpg"
+        Image.new("CMYK", (300, 200), (0, 255, 255, 0)).save(cmyk)
+        proxy = picture_proxy(cmyk, (150, 100), proxy_dir)
+        with Image.open(proxy) as image:
+            assert image.mode == "RGB"
+            assert image.size == (150, 100)
+        lab = Path(tmpdirname) / "lab.tif"
+        Image.new("LAB", (300, 200)).save(lab)
+        with Image.open(picture_proxy(lab, (150, 100), proxy_dir)) as image:
+            assert image.format == "PNG"
+            assert image.mode == "RGB"
+        rotated = Path(tmpdirname) / "rotated.jpg"
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, shown portrait
+        Image.new("RGB", (300, 200)).save(rotated, exif=exif)
+        with Image.open(picture_proxy(rotated, (100, 150), proxy_dir)) as image:
+            assert image.size == (100, 150)
+            assert image.getexif().get(0x0112, 1) == 1
+
+
+def test_embedded_svg_output():
+    s = Slide(DEFAULT_SLIDE_TEMPLATE).id(1).picture(DEFAULT_PICTURE).embed(True)
+    with open(DEFAULT_PICTURE, "rb") as f:
+        expected_href = "data:image/png;base64," + base64.b64encode(f.read()).decode()
+    for _ in range(2):  # second time from the spooled payload
+        svg = s.svg()
+        href = (
+            minidom.parseString(svg)
+            .getElementsByTagName("image")[0]
+            .attributes["xlink:href"]
+            .value
+        )
+        assert href == expected_href
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        output_svg_path = Path(tmpdirname) / "embedded.svg"
+        s.svg(output_svg_path)
+        assert output_svg_path.read_text() == svg
+
+
+def test_embedded_picture_chunks():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        picture = Path(tmpdirname) / "picture.jpg"
+        data = os.urandom(2 * 1024 * 1024 + 1)
+        picture.write_bytes(b"\xff\xd8\xff" + data)
+        chunks = list(EmbeddedPicture(picture).chunks())
+        assert len(chunks) > 2
+        assert b"".join(chunks) == b"data:image/jpeg;base64," + base64.b64encode(
+            b"\xff\xd8\xff" + data
+        )
+
+
+def test_embedded_picture_concurrent_spool():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        picture = Path(tmpdirname) / "picture.jpg"
+        picture.write_bytes(b"\xff\xd8\xff" + os.urandom(2 * 1024 * 1024))
+        expected = b"data:image/jpeg;base64," + base64.b64encode(picture.read_bytes())
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            uris = list(
+                executor.map(
+                    lambda _: b"".join(EmbeddedPicture(picture).chunks()), range(8)
+                )
+            )
+        assert uris == [expected] * 8
+
+
+def test_embedded_picture_spool_is_bounded():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        picture = Path(tmpdirname) / "picture.jpg"
+        picture.write_bytes(b"\xff\xd8\xff" + os.urandom(1024 * 1024))
+        embedded = EmbeddedPicture(picture)
+        spool_dir = Path(embedded._spool_path()).parent
+        b"".join(embedded.chunks())
+        path_key = embedded._spool_path().name.partition("-")[0]
+        assert len(list(spool_dir.glob(path_key + "-*"))) == 1
+        # a changed picture replaces its previous payload
+        picture.write_bytes(b"\xff\xd8\xff" + os.urandom(1024 * 1024))
+        os.utime(picture, ns=(0, 0))
+        expected = b"data:image/jpeg;base64," + base64.b64encode(picture.read_bytes())
+        assert b"".join(embedded.chunks()) == expected
+        assert list(spool_dir.glob(path_key + "-*")) == [embedded._spool_path()]
+        # closing the generator early leaves nothing behind
+        os.utime(picture, ns=(1, 1))
+        chunks = embedded.chunks()
+        next(chunks)
+        next(chunks)
+        chunks.close()
+        assert list(spool_dir.glob(path_key + "-*.tmp")) == []
+        assert b"".join(embedded.chunks()) == expected
+
+
+def test_command_stdout_embedded_svg_output():
+    command_output = subprocess.check_output(
+        [
+            "python",
+            EXECUTABLE_UNDER_TEST,
+            "--id",
+            "1",
+            "--picture",
+            DEFAULT_PICTURE,
+            "--stdout",
+            "--embed",
+        ]
+    )
+    assert _normalize_xml(command_output) == _normalize_xml(
+        Slide(DEFAULT_SLIDE_TEMPLATE).id(1).picture(DEFAULT_PICTURE).embed(True).svg()
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_stats_collector(jobs):
+    stats = StatsCollector()
+    add_profiling_hook(stats)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            pictures = _make_pictures_dir(tmpdirname, 3)
+            do_slides(
+                DEFAULT_SLIDE_TEMPLATE,
+                pictures + [Path(tmpdirname) / DEFAULT_NON_EXISTING_PICTURE],
+                output_dir=tmpdirname,
+                output_as="svg",
+                jobs=jobs,
+            )
+    finally:
+        remove_profiling_hook(stats)
+    report = stats.report(slowest=2)
+    assert report["slides"] == 4
+    assert report["failed_slides"] == 1
+    assert report["output_bytes"] > 0
+    assert report["stages"]["svg_build"]["count"] == 3
+    assert len(report["slowest"]) == 2
+    assert "svg_build" in format_stats(report)
+
+
+def test_command_stats_json():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        stats_path = Path(tmpdirname) / "stats.json"
+        result = subprocess.run(
+            [
+                "python",
+                EXECUTABLE_UNDER_TEST,
+                "--id",
+                "1",
+                "--picture",
+                DEFAULT_PICTURE,
+                "--output",
+                str(Path(tmpdirname) / "slide.svg"),
+                "--stats",
+                "--stats-json",
+                str(stats_path),
+            ],
+            capture_output=True,
+        )
+        assert result.returncode == 0
+        assert b"slides/s" in result.stderr
+        with open(stats_path) as f:
+            assert json.load(f)["slides"] == 1
+
+
+def test_command_stats_keeps_stdout_svg():
+    result = subprocess.run(
+        [
+            "python",
+            EXECUTABLE_UNDER_TEST,
+            "--id",
+            "1",
+            "--picture",
+            DEFAULT_PICTURE,
+            "--stdout",
+            "--stats",
+        ],
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    minidom.parseString(result.stdout)
+    assert b"slides/s" in result.stderr
+    # no report when the arguments are rejected
+    result = subprocess.run(
+        [
+            "python",
+            EXECUTABLE_UNDER_TEST,
+            "--id",
+            "1",
+            "--picture",
+            DEFAULT_PICTURE,
+            "--cache-size",
+            "lots",
+            "--stats",
+        ],
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert b"slides/s" not in result.stdout + result.stderr
+
+
+def test_raster_encoding():
+    assert RasterEncoding("jpeg").alpha is False
+    assert RasterEncoding("jpeg").with_format("png") == RasterEncoding()
+    # the quality only sets lossy formats apart
+    assert RasterEncoding("png", quality=80) == RasterEncoding()
+    assert RasterEncoding("webp", quality=80) != RasterEncoding("webp")
+    for kwargs in (
+        dict(format="gif"),
+        dict(format="jpeg", depth=16),
+        dict(depth=12),
+        dict(compression=10),
+        dict(format="webp", quality=0),
+    ):
+        with pytest.raises(ValueError):
+            RasterEncoding(**kwargs)
+
+
+def test_convert_encoding_commands():
+    encoding = RasterEncoding("tiff", depth=16, alpha=False, compression=6)
+    command = get_converter("convert", encoding=encoding).command("out.tif", 300)
+    assert command[-1] == "tiff:out.tif"
+    assert command[command.index("-depth") + 1] == "16"
+    assert command[command.index("-compress") + 1] == "Zip"
+    assert "remove" in command
+    command = get_converter("inkscape", encoding=RasterEncoding(depth=8)).command(
+        None, 300
+    )
+    assert "--export-png-color-mode=RGBA_8" in command
+    # converters without such flags have their PNG re-encoded with Pillow
+    assert get_converter("inkscape").encodes(RasterEncoding("jpeg")) is False
+    assert get_converter("rsvg-convert").encodes(RasterEncoding(alpha=False)) is False
+    assert get_converter("pillow").encodes(RasterEncoding("webp", compression=9))
+
+
+def test_raster_encoding_save():
+    image = Image.new("RGBA", (64, 48), (255, 0, 0, 0))
+    image.paste((0, 0, 255, 255), (16, 16, 48, 32))
+    for encoding, mode in (
+        (RasterEncoding(alpha=False, compression=9), "RGB"),
+        (RasterEncoding("tiff", compression=0), "RGBA"),
+        (RasterEncoding("jpeg", quality=90), "RGB"),
+        (RasterEncoding("webp"), "RGBA"),
+    ):
+        stream = io.BytesIO()
+        encoding.save(image, stream, dpi=300)
+        stream.seek(0)
+        with Image.open(stream) as saved:
+            assert saved.format == encoding.format.upper()
+            assert saved.mode == mode
+            if not encoding.alpha:
+                assert saved.getpixel((0, 0))[:3] == (255, 255, 255)
+    with pytest.raises(ValueError):
+        RasterEncoding(depth=16).save(image, io.BytesIO())
+
+
+@pytest.mark.parametrize("output_as", ["tiff", "jpeg", "webp"])
+def test_render_batch_output_format(output_as):
+    stats = StatsCollector()
+    add_profiling_hook(stats)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            pictures = _make_pictures_dir(tmpdirname, 3)
+            results = list(
+                render_batch(
+                    DEFAULT_SLIDE_TEMPLATE,
+                    pictures,
+                    output_dir=tmpdirname,
+                    output_as=output_as,
+                    dpi=100,
+                    jobs=1,
+                    encoding=RasterEncoding(alpha=False, quality=80),
+                )
+            )
+            assert [result["error"] for result in results] == [None] * 3
+            assert results[0]["name"] == "slide_001.{}".format(output_as)
+            with Image.open(results[0]["output"]) as image:
+                assert image.format == output_as.upper()
+                assert image.mode == "RGB"
+    finally:
+        remove_profiling_hook(stats)
+    report = stats.report()
+    assert report["formats"][output_as]["slides"] == 3
+    assert report["formats"][output_as]["bytes"] == report["output_bytes"]
+    assert output_as in format_stats(report)
+